@@ -1,16 +1,14 @@
-from PyQt6.QtWidgets import QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QComboBox, QLabel, QApplication, QMessageBox, QFileDialog
-from PyQt6.QtGui import QAction, QIcon
-from PyQt6.QtCore import Qt, QUrl
+from PyQt6.QtWidgets import QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QComboBox, QLabel, QApplication, QMessageBox, QFileDialog, QProgressBar, QPlainTextEdit
+from PyQt6.QtGui import QAction, QActionGroup, QIcon
+from PyQt6.QtCore import Qt, QUrl, QFileSystemWatcher, QTimer
 from PyQt6.QtGui import QDesktopServices
-import os, json, sys
+import bisect, os, time
 
-CONFIG_PATH = r"C:\ProgramData\keymap.json"
-
-def resource_path(relative_path):
-    """获取打包后或源码状态下的资源路径"""
-    if hasattr(sys, "_MEIPASS"):
-        return os.path.join(sys._MEIPASS, relative_path)
-    return os.path.join(os.path.abspath("."), relative_path)
+from keymap_core import engine
+from keymap_jobs import Job, JobQueue, patch_job, delete_job, load_template_job, restore_job
+from keymap_core import diff, jsonio, macro, naming, merge, snapshots
+from keymap_core.paths import RULES_PATH, resource_path
+from keymap_core.settings import Settings
 
 class KeymapEditor(QMainWindow):
     def __init__(self):
@@ -47,11 +45,46 @@ class KeymapEditor(QMainWindow):
         # 中部操作按钮
         btn_layout = QHBoxLayout()
         self.modify_button = QPushButton("插入宏点位并保存")
+        self.preview_button = QPushButton("预览改动")
         self.delete_button = QPushButton("删除当前文件")
         btn_layout.addWidget(self.modify_button)
+        btn_layout.addWidget(self.preview_button)
         btn_layout.addWidget(self.delete_button)
         main_layout.addLayout(btn_layout)
 
+        # 改动预览（预览后才显示）：确认无误再保存
+        self.preview_widget = QWidget()
+        preview_layout = QVBoxLayout(self.preview_widget)
+        preview_layout.setContentsMargins(0, 0, 0, 0)
+        self.preview_label = QLabel()
+        self.preview_text = QPlainTextEdit()
+        self.preview_text.setReadOnly(True)
+        self.preview_text.setLineWrapMode(QPlainTextEdit.LineWrapMode.NoWrap)
+        self.preview_text.setMinimumHeight(220)
+        preview_buttons = QHBoxLayout()
+        self.preview_save_button = QPushButton("确认保存")
+        self.preview_close_button = QPushButton("关闭预览")
+        preview_buttons.addWidget(self.preview_save_button)
+        preview_buttons.addWidget(self.preview_close_button)
+        preview_layout.addWidget(self.preview_label)
+        preview_layout.addWidget(self.preview_text)
+        preview_layout.addLayout(preview_buttons)
+        self.preview_widget.hide()
+        main_layout.addWidget(self.preview_widget)
+
+        # 后台任务进度（空闲时隐藏）
+        self.progress_widget = QWidget()
+        progress_layout = QHBoxLayout(self.progress_widget)
+        progress_layout.setContentsMargins(0, 0, 0, 0)
+        self.progress_label = QLabel()
+        self.progress_bar = QProgressBar()
+        self.cancel_button = QPushButton("取消")
+        progress_layout.addWidget(self.progress_label)
+        progress_layout.addWidget(self.progress_bar)
+        progress_layout.addWidget(self.cancel_button)
+        self.progress_widget.hide()
+        main_layout.addWidget(self.progress_widget)
+
         # 菜单栏
         menubar = self.menuBar()
         file_menu = menubar.addMenu("文件")
@@ -60,10 +93,57 @@ class KeymapEditor(QMainWindow):
         self.action_select_folder.triggered.connect(self.load_folder)
         self.action_open_folder.triggered.connect(self.open_folder)
 
+        # 最近使用的点位文件夹和已导入的模板，打开菜单时再列出
+        self.recent_menu = file_menu.addMenu("最近的点位文件夹")
+        self.recent_menu.aboutToShow.connect(self.populate_recent_menu)
+
         import_action = QAction("导入自定义点位模板", self)
         import_action.triggered.connect(self.import_custom_template)
         file_menu.addAction(import_action)
 
+        self.template_menu = file_menu.addMenu("切换点位模板")
+        self.template_menu.aboutToShow.connect(self.populate_template_menu)
+
+        rules_action = QAction("编辑文件名规则（排除 / 显示名 / 各游戏模板）", self)
+        rules_action.triggered.connect(self.edit_rules)
+        file_menu.addAction(rules_action)
+
+        batch_action = QAction("批量插入宏点位（全部文件）", self)
+        batch_action.triggered.connect(self.modify_all_files)
+        file_menu.addAction(batch_action)
+
+        batch_preview_action = QAction("预览批量插入的改动（不保存）", self)
+        batch_preview_action.triggered.connect(self.preview_all_files)
+        file_menu.addAction(batch_preview_action)
+
+        # 保留的点位与模板点位绑定同一按键时的处理方式
+        conflict_menu = file_menu.addMenu("按键冲突处理")
+        conflict_group = QActionGroup(self)
+        for policy in merge.POLICIES:
+            action = QAction(merge.POLICY_LABELS[policy], self, checkable=True)
+            action.setChecked(policy == merge.DEFAULT_POLICY)
+            action.triggered.connect(lambda _, p=policy: setattr(self, "merge_policy", p))
+            conflict_group.addAction(action)
+            conflict_menu.addAction(action)
+
+        # 保存点位文件时的格式
+        format_menu = file_menu.addMenu("保存格式")
+        format_group = QActionGroup(self)
+        for output_format in jsonio.OUTPUT_FORMATS:
+            action = QAction(jsonio.FORMAT_LABELS[output_format], self, checkable=True)
+            action.setChecked(output_format == jsonio.PRETTY)
+            action.triggered.connect(lambda _, f=output_format: setattr(self, "output_format", f))
+            format_group.addAction(action)
+            format_menu.addAction(action)
+
+        relocate_action = QAction("自动挪开重叠的模板图标", self, checkable=True)
+        relocate_action.toggled.connect(lambda checked: setattr(self, "relocate_icons", checked))
+        file_menu.addAction(relocate_action)
+
+        # 最近的修改 / 删除操作，打开菜单时再读取
+        self.undo_menu = file_menu.addMenu("撤销操作")
+        self.undo_menu.aboutToShow.connect(self.populate_undo_menu)
+
         # 关于菜单
         about_menu = menubar.addMenu("关于")
         action_manual = QAction("说明书", self)
@@ -76,16 +156,47 @@ class KeymapEditor(QMainWindow):
 
         # 按钮事件
         self.modify_button.clicked.connect(self.modify_file)
+        self.preview_button.clicked.connect(self.preview_file)
+        self.preview_save_button.clicked.connect(self.save_previewed)
+        self.preview_close_button.clicked.connect(self.close_preview)
         self.delete_button.clicked.connect(self.delete_file)
 
+        # 后台任务队列：文件读写不在界面线程中执行
+        self.jobs = JobQueue(self)
+        self.jobs.started.connect(self.on_job_started)
+        self.jobs.changed.connect(self.on_jobs_changed)
+        self.jobs.idle.connect(self.progress_widget.hide)
+        self.cancel_button.clicked.connect(self.jobs.cancel_all)
+
         # 初始化变量
         self.folder_path = None
         self.file_map = {}
+        self.display_names = []  # 与下拉列表顺序一致的显示名（已排序）
         self.custom_template_path = None
         self.custom_keymaps = []
-
-        # 初始化加载上次路径
-        self.init_folder()
+        self.custom_skill_area = None
+        # 设置：最近的文件夹、已导入的模板和文件夹索引，修改后延迟合并写盘
+        self.settings = Settings()
+        self.template_hash = self.settings.template
+        self.template_loaded = self.template_hash is None
+        if self.template_hash:
+            self.template_label.setText(f"新增宏点位模板：{self.settings.templates[self.template_hash]['name']}")
+        self.merge_policy = merge.DEFAULT_POLICY
+        self.relocate_icons = False
+        self.output_format = jsonio.PRETTY
+        self.preview_paths = []
+        self.folder_index = None
+
+        # 监视点位文件夹，模拟器在后台增删文件时增量更新列表
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.sync_file_list)
+        # 文件名规则被修改后重新读取
+        self.watcher.fileChanged.connect(self.reload_rules)
+        if os.path.exists(RULES_PATH):
+            self.watcher.addPath(RULES_PATH)
+
+        # 初始化加载上次路径：等窗口显示出来之后再读取文件夹，启动时不卡界面
+        QTimer.singleShot(0, self.init_folder)
 
     def show_manual(self):
         manual_text = (
@@ -99,10 +210,15 @@ class KeymapEditor(QMainWindow):
             "  ASD 宏\n"
             "  Shift 变速\n"
             "  Alt 自动\n"
-            "支持导入自定义模板功能，在文件内选择自己喜欢用的纯点位宏文件即可，不选择默认使用上面的布局\n\n"
+            "支持导入自定义模板功能，在文件内选择自己喜欢用的纯点位宏文件即可，不选择默认使用上面的布局；"
+            "导入过的模板会记住，下次启动仍然使用，也可以在“文件 → 切换点位模板”中切换\n\n"
             "其他功能：\n"
-            "- 删除当前文件：删除选中的点位文件，删除后不可恢复。\n"
+            "- 预览改动：先列出选中文件将被删除、新增和改动的点位，确认后再点“确认保存”；批量预览在“文件”菜单中。\n"
+            "- 删除当前文件：删除选中的点位文件，删除前会自动保存快照。\n"
+            "- 撤销操作：修改和删除前都会保存原文件，可以把一次批量处理或删除整体撤销。\n"
             "- 重新选择点位文件夹：选择存放点位JSON文件的文件夹。\n"
+            "- 最近的点位文件夹：在最近用过的几个文件夹之间切换。\n"
+            "- 编辑文件名规则：设置哪些文件不显示、包名显示成什么名字，以及各游戏默认使用的模板和技能区域，保存后自动生效。\n"
             "- 打开点位文件夹：直接打开已经当前选择的文件夹。"
         )
         QMessageBox.information(self, "说明书", manual_text)
@@ -116,28 +232,67 @@ class KeymapEditor(QMainWindow):
             "JSON Files (*.json)"
         )
         if file_path:
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                if "keymaps" not in data or not isinstance(data["keymaps"], list):
-                    QMessageBox.warning(self, "错误", "该文件不是有效的点位模板！")
-                    return
-                self.custom_keymaps = data["keymaps"]
-                self.custom_template_path = file_path
-                template_name = os.path.basename(file_path)
-                self.template_label.setText(f"新增宏点位模板：{template_name}")
-                QMessageBox.information(self, "成功", f"已导入自定义模板：{template_name}")
-            except Exception as e:
-                QMessageBox.critical(self, "错误", f"导入模板失败：{str(e)}")
+            job = Job("导入模板", load_template_job, file_path, self.settings)
+            job.signals.finished.connect(self.on_template_loaded)
+            job.signals.failed.connect(self.on_template_failed)
+            self.jobs.submit(job)
+
+    def on_template_loaded(self, loaded):
+        file_path, self.custom_keymaps, self.custom_skill_area, self.template_hash = loaded
+        self.custom_template_path = file_path
+        self.template_loaded = True
+        template_name = os.path.basename(file_path)
+        self.template_label.setText(f"新增宏点位模板：{template_name}")
+        text = f"已导入自定义模板：{template_name}"
+        warning = macro.unknown_warning(self.custom_keymaps)
+        if warning:
+            text += f"\n\n模板中{warning}。"
+        QMessageBox.information(self, "成功", text)
+
+    def populate_template_menu(self):
+        self.template_menu.clear()
+        group = QActionGroup(self.template_menu)
+        entries = [(None, "默认模板")] + [(digest, entry["name"]) for digest, entry in self.settings.template_list()]
+        for digest, name in entries:
+            action = QAction(name, self.template_menu, checkable=True)
+            action.setChecked(digest == self.template_hash)
+            action.triggered.connect(lambda _, d=digest: self.select_template(d))
+            group.addAction(action)
+            self.template_menu.addAction(action)
+
+    def select_template(self, digest):
+        """切换到已导入的模板（None 为默认模板）；模板内容在插入时才从缓存读取"""
+        self.settings.select_template(digest)
+        self.template_hash = self.settings.template
+        self.template_loaded = self.template_hash is None
+        self.custom_template_path = None
+        self.custom_keymaps = []
+        self.custom_skill_area = None
+        name = self.settings.templates[self.template_hash]["name"] if self.template_hash else "默认"
+        self.template_label.setText(f"新增宏点位模板：{name}")
+
+    def ensure_template(self):
+        """第一次使用上次选中的模板时从缓存读取；读取失败时改用默认模板并返回 False"""
+        if self.template_loaded:
+            return True
+        try:
+            self.custom_keymaps, self.custom_skill_area = self.settings.load_template(self.template_hash)
+        except Exception as e:
+            self.select_template(None)
+            QMessageBox.warning(self, "错误", f"{str(e)}\n已改用默认模板。")
+            return False
+        self.custom_template_path = self.settings.templates[self.template_hash]["path"]
+        self.template_loaded = True
+        return True
+
+    def on_template_failed(self, error):
+        if isinstance(error, engine.InvalidTemplateError):
+            QMessageBox.warning(self, "错误", str(error))
+        else:
+            QMessageBox.critical(self, "错误", f"导入模板失败：{str(error)}")
 
     def init_folder(self):
-        if os.path.exists(CONFIG_PATH):
-            try:
-                with open(CONFIG_PATH, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    self.folder_path = data.get("folder_path", "")
-            except Exception:
-                self.folder_path = ""
+        self.folder_path = self.settings.folder
         if not self.folder_path or not os.path.exists(self.folder_path):
             QMessageBox.information(self, "提示", "未检测到已保存的点位路径，请选择点位文件夹。")
             self.load_folder()
@@ -145,9 +300,26 @@ class KeymapEditor(QMainWindow):
             self.refresh_file_list()
 
     def save_folder_path(self, path):
-        os.makedirs(os.path.dirname(CONFIG_PATH), exist_ok=True)
-        with open(CONFIG_PATH, "w", encoding="utf-8") as f:
-            json.dump({"folder_path": path}, f, ensure_ascii=False, indent=2)
+        self.settings.add_recent(path)
+
+    def populate_recent_menu(self):
+        self.recent_menu.clear()
+        folders = self.settings.recent_folders
+        if not folders:
+            self.recent_menu.addAction("（没有最近使用的文件夹）").setEnabled(False)
+            return
+        for folder in folders:
+            action = self.recent_menu.addAction(folder)
+            action.triggered.connect(lambda _, f=folder: self.open_recent_folder(f))
+
+    def open_recent_folder(self, folder):
+        if not os.path.exists(folder):
+            QMessageBox.warning(self, "提示", f"文件夹已不存在：\n{folder}")
+            self.settings.remove_recent(folder)
+            return
+        self.folder_path = folder
+        self.save_folder_path(folder)
+        self.refresh_file_list()
 
     def load_folder(self):
         folder = QFileDialog.getExistingDirectory(self,
@@ -157,6 +329,29 @@ class KeymapEditor(QMainWindow):
             self.save_folder_path(folder)
             self.refresh_file_list()
 
+    def edit_rules(self):
+        """打开文件名规则文件（没有时先写出内置规则），保存后自动生效"""
+        try:
+            if not os.path.exists(RULES_PATH):
+                naming.write_default_rules(RULES_PATH)
+        except OSError as e:
+            QMessageBox.critical(self, "错误", f"无法创建文件名规则文件：{str(e)}")
+            return
+        if RULES_PATH not in self.watcher.files():
+            self.watcher.addPath(RULES_PATH)
+        QDesktopServices.openUrl(QUrl.fromLocalFile(RULES_PATH))
+
+    def reload_rules(self, *_):
+        # 编辑器保存时可能先删除再重建文件，监视会被移除，需要重新加入
+        if os.path.exists(RULES_PATH) and RULES_PATH not in self.watcher.files():
+            self.watcher.addPath(RULES_PATH)
+        try:
+            naming.load_rules(RULES_PATH)
+        except naming.InvalidRulesError as e:
+            QMessageBox.warning(self, "文件名规则有误", f"{str(e)}\n\n暂时只使用内置规则。")
+        naming.reload_rules()
+        self.refresh_file_list()
+
     def open_folder(self):
         if self.folder_path and os.path.exists(self.folder_path):
             os.startfile(self.folder_path)
@@ -164,34 +359,52 @@ class KeymapEditor(QMainWindow):
             QMessageBox.warning(self, "提示", "点位文件夹不存在，请先选择有效文件夹。")
 
     def refresh_file_list(self):
+        """重新载入当前文件夹：先用上次保存的索引立即填充列表，再增量扫描修正"""
         self.file_combo.clear()
         self.file_map.clear()
+        self.display_names.clear()
+        if self.watcher.directories():
+            self.watcher.removePaths(self.watcher.directories())
         if not self.folder_path or not os.path.exists(self.folder_path):
+            self.folder_index = None
             return
-        excluded_files = {
-            "com.nexon.bluearchive.json",
-            "com.RoamingStar.BlueArchive.json",
-            "com.RoamingStar.BlueArchive.bilibili.json",
-            "com.RoamingStar.BlueArchive-默认操作方案.json",
-            "com.nexon.bluearchive-默认操作模式.json",
-            "com.RoamingStar.BlueArchive.bilibili-默认操作方案.json",
-        }
-        files_in_folder = [f for f in os.listdir(self.folder_path) if f.endswith(".json")]
-        for file in files_in_folder:
-            if file in excluded_files:
-                continue
-            display_name = file
-            if file.startswith("com.nexon.bluearchive"):
-                display_name = file.replace("com.nexon.bluearchive", "国际服点位")
-            elif file.startswith("com.RoamingStar.BlueArchive.bilibili"):
-                display_name = file.replace("com.RoamingStar.BlueArchive.bilibili", "B服点位")
-            elif file.startswith("com.RoamingStar.BlueArchive"):
-                display_name = file.replace("com.RoamingStar.BlueArchive", "官服点位")
-            self.file_combo.addItem(display_name)
-            self.file_map[display_name] = file
+        self.folder_index = self.settings.get_index(self.folder_path)
+        self.add_files(self.folder_index.names())
+        self.watcher.addPath(self.folder_path)
+        self.sync_file_list()
         if not self.file_map:
             QMessageBox.warning(self, "提示", "该文件夹下没有有效的点位文件。")
 
+    def sync_file_list(self, *_):
+        """增量扫描当前文件夹，只把新增和删除的文件同步到下拉列表"""
+        if self.folder_index is None:
+            return
+        added, removed, changed = self.folder_index.scan()
+        if not (added or removed or changed):
+            return
+        self.remove_files(removed)
+        self.add_files(added)
+        self.settings.put_index(self.folder_index)
+
+    def add_files(self, files):
+        for file in files:
+            name = naming.display_name(file)
+            if name in self.file_map:
+                continue
+            pos = bisect.bisect_left(self.display_names, name)
+            self.display_names.insert(pos, name)
+            self.file_combo.insertItem(pos, name)
+            self.file_map[name] = file
+
+    def remove_files(self, files):
+        for file in files:
+            name = naming.display_name(file)
+            if self.file_map.pop(name, None) is None:
+                continue
+            pos = bisect.bisect_left(self.display_names, name)
+            del self.display_names[pos]
+            self.file_combo.removeItem(pos)
+
     def open_author_page(self):
         url = QUrl("https://space.bilibili.com/230141337")
         QDesktopServices.openUrl(url)
@@ -202,359 +415,118 @@ class KeymapEditor(QMainWindow):
             return
         file_name = self.file_map[self.file_combo.currentText()]
         input_path = os.path.join(self.folder_path, file_name)
-        try:
-            with open(input_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            # 删除指定区域点位
-            filtered_keymaps = []
-            for km in data.get("keymaps", []):
-                rel_x = km.get("rel_work_position", {}).get("rel_x", 0)
-                rel_y = km.get("rel_work_position", {}).get("rel_y", 0)
-                if not (rel_x > 0.67 and rel_y > 0.79):
-                    filtered_keymaps.append(km)
-            # 使用自定义模板点位或默认新增点位
-            if self.custom_keymaps:
-                new_keymaps = self.custom_keymaps
+        self.submit_patch([input_path])
+
+    def modify_all_files(self):
+        if not self.file_map:
+            QMessageBox.warning(self, "警告", "当前文件夹下没有可处理的点位文件！")
+            return
+        reply = QMessageBox.question(
+            self,
+            "确认",
+            f"确定要对当前文件夹下的 {len(self.file_map)} 个点位文件插入宏点位吗？",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+        )
+        if reply == QMessageBox.StandardButton.Yes:
+            paths = [os.path.join(self.folder_path, f) for f in self.file_map.values()]
+            self.submit_patch(paths)
+
+    def submit_patch(self, paths, force=False, dry_run=False):
+        # 使用自定义模板点位或默认新增点位
+        if not self.ensure_template():
+            return
+        job = Job("预览改动" if dry_run else "插入宏点位", patch_job, paths, self.custom_keymaps,
+                  self.custom_skill_area, force, self.merge_policy, self.relocate_icons, self.output_format, dry_run)
+        job.signals.finished.connect(self.show_preview if dry_run else self.on_patch_finished)
+        job.signals.failed.connect(lambda e: QMessageBox.critical(self, "错误", f"修改文件时出错：{str(e)}"))
+        self.jobs.submit(job)
+
+    def preview_file(self):
+        if not self.file_combo.currentText():
+            QMessageBox.warning(self, "警告", "请先选择一个点位文件！")
+            return
+        file_name = self.file_map[self.file_combo.currentText()]
+        self.submit_patch([os.path.join(self.folder_path, file_name)], force=True, dry_run=True)
+
+    def preview_all_files(self):
+        if not self.file_map:
+            QMessageBox.warning(self, "警告", "当前文件夹下没有可处理的点位文件！")
+            return
+        self.submit_patch([os.path.join(self.folder_path, f) for f in self.file_map.values()], dry_run=True)
+
+    def show_preview(self, results):
+        """在预览区列出每个文件将被删除、新增和改动的点位"""
+        single = len(results) == 1
+        blocks = []
+        pending = []
+        for r in results:
+            lines = [naming.display_name(os.path.basename(r["path"]))]
+            if r["status"] == engine.SKIPPED:
+                lines.append("  已插入过当前模板，之后也没有被修改过，不会改动")
+            elif not r["ok"]:
+                lines.append(f"  无法处理：{r['error']}")
             else:
-                # 默认新增点位示例（请根据你的需求修改）
-                new_keymaps = [
-                    {
-                        "editor_icon_scale": 1,
-                        "icon": {
-                            "background_color": "00000066",
-                            "description": "",
-                            "radius_correction": 1,
-                            "rel_position": {
-                                "rel_x": 0.9547079856972588,
-                                "rel_y": 0.8686440677966102
-                            },
-                            "visibility": True
-                        },
-                        "key": {
-                            "device": "keyboard",
-                            "scan_code": 42,
-                            "text": "Shift",
-                            "virtual_key": 16
-                        },
-                        "rel_work_position": {
-                            "rel_x": 0.9547079856972588,
-                            "rel_y": 0.8686440677966102
-                        },
-                        "type": "Click"
-                    },
-                    {
-                        "editor_icon_scale": 1,
-                        "icon": {
-                            "background_color": "00000066",
-                            "description": "",
-                            "radius_correction": 1,
-                            "rel_position": {
-                                "rel_x": 0.8649514894280045,
-                                "rel_y": 0.8558014966721654
-                            },
-                            "visibility": True
-                        },
-                        "key": {
-                            "device": "keyboard",
-                            "scan_code": 32,
-                            "text": "D",
-                            "virtual_key": 68
-                        },
-                        "press_actions": [
-                            "start_loop:until_release",
-                            "curve_first_point_sleep_time:1",
-                            "curve_last_point_sleep_time:until_release_cmd",
-                            "curve_rel:(0.846246,0.896186);(0.851013,0.843220);mouse",
-                            "curve_release",
-                            "stop_loop"
-                        ],
-                        "rel_work_position": {
-                            "rel_x": 0.8649514894280045,
-                            "rel_y": 0.8558014966721654
-                        },
-                        "release_actions": [
-
-                        ],
-                        "type": "Macro"
-                    },
-                    {
-                        "editor_icon_scale": 1,
-                        "icon": {
-                            "background_color": "00000066",
-                            "description": "",
-                            "radius_correction": 1,
-                            "rel_position": {
-                                "rel_x": 0.7824383719289509,
-                                "rel_y": 0.8539144665041505
-                            },
-                            "visibility": True
-                        },
-                        "key": {
-                            "device": "keyboard",
-                            "scan_code": 31,
-                            "text": "S",
-                            "virtual_key": 83
-                        },
-                        "press_actions": [
-                            "start_loop:until_release",
-                            "curve_first_point_sleep_time:1",
-                            "curve_last_point_sleep_time:until_release_cmd",
-                            "curve_rel:(0.765793,0.893008);(0.771752,0.862288);mouse",
-                            "curve_release",
-                            "stop_loop"
-                        ],
-                        "rel_work_position": {
-                            "rel_x": 0.7824383719289509,
-                            "rel_y": 0.8539144665041505
-                        },
-                        "release_actions": [
-
-                        ],
-                        "type": "Macro"
-                    },
-                    {
-                        "editor_icon_scale": 1,
-                        "icon": {
-                            "background_color": "00000066",
-                            "description": "",
-                            "radius_correction": 1,
-                            "rel_position": {
-                                "rel_x": 0.6959501557632397,
-                                "rel_y": 0.8737541528239198
-                            },
-                            "visibility": True
-                        },
-                        "key": {
-                            "device": "keyboard",
-                            "scan_code": 16,
-                            "text": "Q",
-                            "virtual_key": 81
-                        },
-                        "rel_work_position": {
-                            "rel_x": 0.6959501557632397,
-                            "rel_y": 0.8737541528239198
-                        },
-                        "type": "Click"
-                    },
-                    {
-                        "editor_icon_scale": 1,
-                        "icon": {
-                            "background_color": "00000066",
-                            "description": "",
-                            "radius_correction": 1,
-                            "rel_position": {
-                                "rel_x": 0.9665315542056766,
-                                "rel_y": 0.05184377789044
-                            },
-                            "visibility": True
-                        },
-                        "key": {
-                            "device": "keyboard",
-                            "scan_code": 57,
-                            "text": "Space",
-                            "virtual_key": 32
-                        },
-                        "rel_work_position": {
-                            "rel_x": 0.9665315542056766,
-                            "rel_y": 0.05184377789044
-                        },
-                        "type": "Click"
-                    },
-                    {
-                        "editor_icon_scale": 1,
-                        "icon": {
-                            "background_color": "00000066",
-                            "description": "",
-                            "radius_correction": 1,
-                            "rel_position": {
-                                "rel_x": 0.7713395638629283,
-                                "rel_y": 0.8704318936877076
-                            },
-                            "visibility": True
-                        },
-                        "key": {
-                            "device": "keyboard",
-                            "scan_code": 17,
-                            "text": "W",
-                            "virtual_key": 87
-                        },
-                        "rel_work_position": {
-                            "rel_x": 0.7713395638629283,
-                            "rel_y": 0.8704318936877076
-                        },
-                        "type": "Click"
-                    },
-                    {
-                        "editor_icon_scale": 1,
-                        "icon": {
-                            "background_color": "00000066",
-                            "description": "",
-                            "radius_correction": 1,
-                            "rel_position": {
-                                "rel_x": 0.8529595015576324,
-                                "rel_y": 0.8748615725359912
-                            },
-                            "visibility": True
-                        },
-                        "key": {
-                            "device": "keyboard",
-                            "scan_code": 18,
-                            "text": "E",
-                            "virtual_key": 69
-                        },
-                        "rel_work_position": {
-                            "rel_x": 0.8529595015576324,
-                            "rel_y": 0.8748615725359912
-                        },
-                        "type": "Click"
-                    },
-                    {
-                        "editor_icon_scale": 1,
-                        "icon": {
-                            "background_color": "00000066",
-                            "description": "",
-                            "radius_correction": 1,
-                            "rel_position": {
-                                "rel_x": 0.7075435470493948,
-                                "rel_y": 0.8513726772712982
-                            },
-                            "visibility": True
-                        },
-                        "key": {
-                            "device": "keyboard",
-                            "scan_code": 30,
-                            "text": "A",
-                            "virtual_key": 65
-                        },
-                        "press_actions": [
-                            "start_loop:until_release",
-                            "curve_first_point_sleep_time:1",
-                            "curve_last_point_sleep_time:until_release_cmd",
-                            "curve_rel:(0.686532,0.856992);(0.694279,0.851695);mouse",
-                            "curve_release",
-                            "stop_loop"
-                        ],
-                        "rel_work_position": {
-                            "rel_x": 0.7075435470493948,
-                            "rel_y": 0.8513726772712982
-                        },
-                        "release_actions": [
-
-                        ],
-                        "type": "Macro"
-                    },
-                    {
-                        "editor_icon_scale": 1,
-                        "icon": {
-                            "background_color": "00000066",
-                            "description": "",
-                            "radius_correction": 1,
-                            "rel_position": {
-                                "rel_x": 0.9673901811142316,
-                                "rel_y": 0.10652879801825023
-                            },
-                            "visibility": True
-                        },
-                        "key": {
-                            "device": "keyboard",
-                            "scan_code": 19,
-                            "text": "R",
-                            "virtual_key": 82
-                        },
-                        "press_actions": [
-                            "click_rel:(0.972586,0.081568)",
-                            "sleep:50",
-                            "click_rel:(0.972586,0.081568)",
-                            "sleep:50",
-                            "click_rel:(0.972586,0.081568)",
-                            "sleep:500",
-                            "click_rel:(0.439213,0.709746)",
-                            "sleep:50",
-                            "click_rel:(0.439213,0.709746)",
-                            "sleep:50",
-                            "click_rel:(0.439213,0.709746)",
-                            "sleep:500",
-                            "click_rel:(0.564958,0.695975)",
-                            "sleep:50",
-                            "click_rel:(0.564958,0.695975)",
-                            "sleep:50",
-                            "click_rel:(0.564958,0.695975)"
-                        ],
-                        "rel_work_position": {
-                            "rel_x": 0.9673901811142316,
-                            "rel_y": 0.10652879801825023
-                        },
-                        "release_actions": [
-
-                        ],
-                        "type": "Macro"
-                    },
-                    {
-                        "editor_icon_scale": 1,
-                        "icon": {
-                            "background_color": "00000066",
-                            "description": "",
-                            "radius_correction": 1,
-                            "rel_position": {
-                                "rel_x": 0.9659486031789325,
-                                "rel_y": 0.16279789247958604
-                            },
-                            "visibility": True
-                        },
-                        "key": {
-                            "device": "keyboard",
-                            "scan_code": 29,
-                            "text": "Ctrl",
-                            "virtual_key": 17
-                        },
-                        "press_actions": [
-                            "start_loop:until_release",
-                            "press_rel:mouse",
-                            "sleep:16",
-                            "release_rel:mouse",
-                            "stop_loop"
-                        ],
-                        "rel_work_position": {
-                            "rel_x": 0.9659486031789325,
-                            "rel_y": 0.16279789247958604
-                        },
-                        "release_actions": [
-
-                        ],
-                        "type": "Macro"
-                    },
-                    {
-                        "editor_icon_scale": 1,
-                        "icon": {
-                            "background_color": "00000066",
-                            "description": "",
-                            "radius_correction": 1,
-                            "rel_position": {
-                                "rel_x": 0.9547079856972588,
-                                "rel_y": 0.9449152542372882
-                            },
-                            "visibility": True
-                        },
-                        "key": {
-                            "device": "keyboard",
-                            "scan_code": 56,
-                            "text": "Alt",
-                            "virtual_key": 18
-                        },
-                        "rel_work_position": {
-                            "rel_x": 0.9547079856972588,
-                            "rel_y": 0.9449152542372882
-                        },
-                        "type": "Click"
-                    }
-                ]
-            filtered_keymaps.extend(new_keymaps)
-            data["keymaps"] = filtered_keymaps
-            with open(input_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            QMessageBox.information(self, "成功", f"文件已修改并保存：\n{file_name}")
-        except Exception as e:
-            QMessageBox.critical(self, "错误", f"修改文件时出错：{str(e)}")
+                lines.append(f"  {diff.summary(r['diff'])}")
+                if r["conflicts"]:
+                    lines.append("  按键冲突：" + "，".join(r["conflicts"]))
+                if r["overlaps"]:
+                    lines.append("  图标重叠：" + "，".join(r["overlaps"]))
+                if not diff.is_empty(r["diff"]):
+                    lines.append(diff.format_diff(r["diff"], limit=None if single else 10, indent="  "))
+                    pending.append(r["path"])
+            blocks.append("\n".join(lines))
+        self.preview_paths = pending
+        self.preview_label.setText(f"预览：{len(results)} 个文件中 {len(pending)} 个会被改动（尚未保存）")
+        self.preview_text.setPlainText("\n\n".join(blocks))
+        self.preview_save_button.setEnabled(bool(pending))
+        self.preview_widget.show()
+
+    def save_previewed(self):
+        paths = self.preview_paths
+        self.close_preview()
+        if paths:
+            self.submit_patch(paths, force=True)
+
+    def close_preview(self):
+        self.preview_paths = []
+        self.preview_widget.hide()
+        self.adjustSize()
+
+    def on_patch_finished(self, results):
+        if len(results) == 1:
+            result = results[0]
+            file_name = os.path.basename(result["path"])
+            if result["status"] == engine.SKIPPED:
+                reply = QMessageBox.question(
+                    self,
+                    "提示",
+                    "该文件已插入过当前模板，之后也没有被修改过，是否仍要重新插入？",
+                    QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+                )
+                if reply == QMessageBox.StandardButton.Yes:
+                    self.submit_patch([result["path"]], force=True)
+            elif result["status"] == engine.CANCELLED:
+                return
+            elif not result["ok"]:
+                QMessageBox.critical(self, "错误", f"修改文件时出错：{result['error']}")
+            else:
+                text = f"文件已修改并保存：\n{file_name}"
+                if result["conflicts"]:
+                    text += "\n\n按键冲突：\n" + "\n".join(result["conflicts"])
+                if result["overlaps"]:
+                    text += "\n\n图标重叠：\n" + "\n".join(result["overlaps"])
+                QMessageBox.information(self, "成功", text)
+            return
+        counts = {}
+        for r in results:
+            counts[r["status"]] = counts.get(r["status"], 0) + 1
+        failed = [f"{os.path.basename(r['path'])}：{r['error']}" for r in results if r["status"] == engine.FAILED]
+        text = (f"成功 {counts.get(engine.PATCHED, 0)} 个，跳过 {counts.get(engine.SKIPPED, 0)} 个，"
+                f"失败 {len(failed)} 个，取消 {counts.get(engine.CANCELLED, 0)} 个。")
+        if failed:
+            QMessageBox.warning(self, "批量处理完成", text + "\n\n" + "\n".join(failed[:20]))
+        else:
+            QMessageBox.information(self, "批量处理完成", text)
 
     def delete_file(self):
         if not self.file_combo.currentText():
@@ -566,18 +538,82 @@ class KeymapEditor(QMainWindow):
         reply = QMessageBox.question(
             self,
             "确认删除",
-            f"确定要删除 {display_name} 吗？此操作不可恢复！",
+            f"确定要删除 {display_name} 吗？\n删除前会保存快照，可以在“文件 → 撤销操作”中恢复。",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+        )
+        if reply == QMessageBox.StandardButton.Yes:
+            job = Job("删除文件", delete_job, file_path)
+            job.signals.finished.connect(lambda _: self.on_file_deleted(display_name))
+            job.signals.failed.connect(lambda e: QMessageBox.critical(self, "错误", f"删除文件失败：{str(e)}"))
+            self.jobs.submit(job)
+
+    def on_file_deleted(self, display_name):
+        QMessageBox.information(self, "成功", f"{display_name} 已删除。")
+        self.sync_file_list()
+
+    def populate_undo_menu(self):
+        self.undo_menu.clear()
+        runs = snapshots.Store().list_runs(limit=15)
+        if not runs:
+            self.undo_menu.addAction("（没有可以撤销的操作）").setEnabled(False)
+            return
+        for run in runs:
+            when = time.strftime("%m-%d %H:%M", time.localtime(run["time"]))
+            action = self.undo_menu.addAction(f"{when}  {run['label']}")
+            action.triggered.connect(lambda _, r=run: self.undo_run(r))
+
+    def undo_run(self, run):
+        reply = QMessageBox.question(
+            self,
+            "确认撤销",
+            f"确定要撤销“{run['label']}”吗？\n{run['files']} 个文件将恢复为该操作之前的内容（当前内容也会先保存快照）。",
             QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
         )
         if reply == QMessageBox.StandardButton.Yes:
-            try:
-                os.remove(file_path)
-                QMessageBox.information(self, "成功", f"{display_name} 已删除。")
-                self.refresh_file_list()
-            except Exception as e:
-                QMessageBox.critical(self, "错误", f"删除文件失败：{str(e)}")
+            job = Job("撤销操作", restore_job, run["id"])
+            job.signals.finished.connect(self.on_restore_finished)
+            job.signals.failed.connect(lambda e: QMessageBox.critical(self, "错误", f"撤销失败：{str(e)}"))
+            self.jobs.submit(job)
+
+    def on_restore_finished(self, result):
+        _, results = result
+        failed = [f"{os.path.basename(r['path'])}：{r['error']}" for r in results if not r["ok"]]
+        restored = sum(1 for r in results if r["changed"])
+        text = f"已恢复 {restored} 个文件，{len(results) - restored - len(failed)} 个文件内容未变。"
+        if failed:
+            QMessageBox.warning(self, "撤销完成", text + f"\n\n失败 {len(failed)} 个：\n" + "\n".join(failed[:20]))
+        else:
+            QMessageBox.information(self, "撤销完成", text)
+        self.sync_file_list()
+
+    def on_job_started(self, job):
+        self.progress_bar.setRange(0, 0)
+        job.signals.progress.connect(self.on_job_progress)
+        self.progress_widget.show()
+        self.on_jobs_changed(len(self.jobs.jobs))
+
+    def on_job_progress(self, done, total):
+        self.progress_bar.setRange(0, total)
+        self.progress_bar.setValue(done)
+
+    def on_jobs_changed(self, count):
+        job = self.jobs.current
+        if job is None:
+            return
+        text = f"正在{job.title}…"
+        if count > 1:
+            text += f"（排队 {count - 1} 个）"
+        self.progress_label.setText(text)
+
+    def closeEvent(self, event):
+        self.jobs.cancel_all()
+        self.jobs.wait()
+        self.settings.flush()
+        super().closeEvent(event)
 
 if __name__ == "__main__":
+    import multiprocessing
+    multiprocessing.freeze_support()
     app = QApplication([])
     window = KeymapEditor()
     window.show()
@@ -0,0 +1,133 @@
+"""启动耗时测试：python -m benchmarks.bench_import [-o 结果.json] [--compare 上次结果.json]
+
+每一项都在新的 Python 进程中执行（冷启动），重复 --repeat 次取最短时间，并减去空解释器的启动时间。
+--detail 模块名 用 python -X importtime 列出该模块导入时最耗时的子模块。
+结果格式与 bench_patch 相同，可以用 --compare 对比。
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from benchmarks.bench_patch import compare
+from keymap_core import jsonio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_LOAD_GUI = (
+    "import importlib.util\n"
+    "spec = importlib.util.spec_from_file_location('keymap_gui', '2.py')\n"
+    "gui = importlib.util.module_from_spec(spec)\n"
+    "spec.loader.exec_module(gui)\n"
+)
+
+# 名称 → 在新进程中执行的代码
+CASES = {
+    "import keymap_core": "import keymap_core",
+    "import keymap_cli": "import keymap_cli",
+    "cli patch (default template)": (
+        "import keymap_cli\n"
+        "keymap_cli.build_parser().parse_args(['patch', 'x'])\n"
+        "keymap_cli.engine.default_keymaps()\n"
+    ),
+    "import PyQt6.QtWidgets": "import PyQt6.QtWidgets",
+    "import gui (2.py)": _LOAD_GUI,
+    "gui window shown": _LOAD_GUI + (
+        "app = gui.QApplication([])\n"
+        "window = gui.KeymapEditor()\n"
+        "window.show()\n"
+    ),
+}
+
+
+def _run(code, env):
+    start = time.perf_counter()
+    try:
+        proc = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, timeout=60,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    except subprocess.TimeoutExpired:
+        raise RuntimeError("超时（可能弹出了对话框）") from None
+    elapsed = (time.perf_counter() - start) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "执行失败")
+    return elapsed
+
+
+def bench(repeat, env):
+    baseline = min(_run("pass", env) for _ in range(repeat))
+    cases = []
+    for name, code in CASES.items():
+        try:
+            wall = min(_run(code, env) for _ in range(repeat))
+        except RuntimeError as e:
+            print(f"{name}：跳过（{e}）")
+            continue
+        cases.append({"name": name, "stages": {"wall_ms": wall, "startup_ms": max(wall - baseline, 0.0)}})
+        print(f"{name:<32} {wall:>8.1f} ms（扣除解释器启动后 {wall - baseline:>7.1f} ms）", flush=True)
+    return baseline, cases
+
+
+def detail(module, env, top=15):
+    """python -X importtime 的结果中累计耗时最长的模块"""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=ROOT, env=env,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            _, self_us, total_us, name = [part.strip() for part in line.split(":", 1)[1].split("|")]
+            rows.append((int(total_us), int(self_us), name))
+        except ValueError:
+            continue
+    rows.sort(reverse=True)
+    lines = [f"{'累计(ms)':>10} {'自身(ms)':>10}  模块"]
+    for total_us, self_us, name in rows[:top]:
+        lines.append(f"{total_us / 1000:>10.1f} {self_us / 1000:>10.1f}  {name}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="bench_import", description="启动耗时测试")
+    parser.add_argument("--repeat", type=int, default=5, help="每项重复次数，取最短时间")
+    parser.add_argument("--detail", metavar="MODULE", help="列出导入该模块时最耗时的子模块")
+    parser.add_argument("-o", "--output", help="把结果写入该 JSON 文件")
+    parser.add_argument("--compare", help="与上次保存的结果对比")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="变慢超过该比例视为退化（默认 0.1）")
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ)
+    # 没有显示器的环境（例如 CI）也能创建窗口
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    env.pop("KEYMAP_TRACE", None)
+    if args.detail:
+        print(detail(args.detail, env))
+        return 0
+    baseline, cases = bench(args.repeat, env)
+    results = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "interpreter_ms": baseline,
+            "repeat": args.repeat,
+        },
+        "cases": cases,
+    }
+    if args.output:
+        with jsonio.atomic_write(args.output) as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入：{args.output}")
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            report, regressed = compare(results, json.load(f), args.tolerance)
+        print(report)
+        return 1 if regressed else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
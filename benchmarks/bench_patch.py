@@ -0,0 +1,306 @@
+"""插入流程的性能测试：python -m benchmarks.bench_patch [--sizes 10,1000,100000] [-o 结果.json]
+
+单文件测试把一次插入拆成 解析 → 区域过滤 → 合并 → 序列化 → 写入 五个阶段分别计时，
+再整体运行 patch_file（内存 / 列式 / 流式三种模式）并用 tracemalloc 记录内存峰值，
+另外对比全部点位以字典和以 columnar.KeymapTable 常驻内存时的占用与区域过滤耗时；
+批量测试用 patch_files 处理整个文件夹。每项重复 --repeat 次取最短时间。
+计时之前先做一致性检查（--no-check 跳过），不通过时返回 1：同一文件插入两次的结果应逐字节相同；
+已插入过的文件被改写后由监视模式自动重新处理，点位数量应不变。
+
+结果保存为 JSON，--compare 上次的结果 可以逐项对比，变慢超过 --tolerance 时返回 1。
+--generate 文件夹 只生成测试数据，便于手动试用图形界面或命令行。
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from keymap_core import engine, jsonio, layout, merge, optional, synth, watch
+from keymap_core.columnar import KeymapTable
+from keymap_core.default_template import default_keymaps
+from keymap_core.regions import DEFAULT_SKILL_AREA
+
+
+# patch_file 的三种处理模式
+MODES = (("memory", {"stream": False, "columnar": False}),
+         ("columnar", {"stream": False, "columnar": True}),
+         ("stream", {"stream": True}))
+
+
+def _best(func, repeat):
+    """运行 repeat 次，返回 (最短耗时毫秒, 最后一次的返回值)"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def _peak_mb(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def _resident_mb(load):
+    """load() 返回的对象常驻的内存"""
+    tracemalloc.start()
+    try:
+        value = load()
+        size = tracemalloc.get_traced_memory()[0]
+        del value
+        return size / 1024 / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def bench_stages(path, repeat):
+    """逐阶段计时（与 engine._patch_in_memory 的步骤一致）"""
+    stages = {}
+
+    stages["parse_ms"], data = _best(lambda: jsonio.load_file(path), repeat)
+    stages["filter_ms"], (kept, _) = _best(lambda: DEFAULT_SKILL_AREA.split(data["keymaps"]), repeat)
+    table = KeymapTable.from_keymaps(data["keymaps"])
+    stages["filter_table_ms"], _ = _best(lambda: DEFAULT_SKILL_AREA.split(table), repeat)
+
+    def do_merge():
+        merger = merge.Merger(default_keymaps())
+        icons = layout.Layout()
+        merged = []
+        for km in kept:
+            km = merger.keep(km)
+            if km is not None:
+                icons.add(km)
+                merged.append(km)
+        tail, _ = engine._finish(merger, icons)
+        return merged + tail
+
+    stages["merge_ms"], merged = _best(do_merge, repeat)
+    data["keymaps"] = merged
+    stages["serialize_ms"], text = _best(lambda: jsonio.dumps(data), repeat)
+    out = path + ".out"
+
+    def write():
+        with jsonio.atomic_write(out) as f:
+            f.write(text)
+
+    stages["write_ms"], _ = _best(write, repeat)
+    os.remove(out)
+    return stages
+
+
+def bench_file(folder, count, repeat, seed):
+    src = os.path.join(folder, f"bench-{count}.json")
+    synth.write_file(src, count, seed)
+    work = src + ".work"
+    case = {"name": f"file keymaps={count}", "keymaps": count, "bytes": os.path.getsize(src)}
+    case["stages"] = bench_stages(src, repeat)
+    case["resident_dict_mb"] = _resident_mb(lambda: jsonio.load_file(src))
+    case["resident_table_mb"] = _resident_mb(lambda: KeymapTable.load(src))
+    for mode, options in MODES:
+
+        def run():
+            shutil.copyfile(src, work)
+            engine.patch_file(work, **options)
+
+        case["stages"][f"patch_{mode}_ms"], _ = _best(run, repeat)
+        case[f"peak_{mode}_mb"] = _peak_mb(run)
+    os.remove(work)
+    os.remove(src)
+    return case
+
+
+def bench_folder(folder, files, per_file, workers, repeat, seed):
+    src = os.path.join(folder, f"src-{files}")
+    synth.write_folder(src, files, per_file, seed)
+    work = os.path.join(folder, f"work-{files}")
+    case = {"name": f"folder files={files} keymaps/file={per_file}", "files": files, "keymaps": files * per_file}
+
+    def run():
+        shutil.rmtree(work, ignore_errors=True)
+        shutil.copytree(src, work)
+        start = time.perf_counter()
+        results = engine.patch_files(engine.collect_targets([work]), workers=workers, use_manifest=False,
+                                     snapshot=False)
+        assert all(r["ok"] for r in results)
+        return (time.perf_counter() - start) * 1000
+
+    case["stages"] = {"patch_files_ms": min(run() for _ in range(repeat))}
+    shutil.rmtree(work, ignore_errors=True)
+    shutil.rmtree(src, ignore_errors=True)
+    return case
+
+
+def check_repatch(folder, count, seed):
+    """同一文件插入两次（第二次之前像模拟器重新保存那样改动空白）结果应逐字节相同，返回不一致的说明列表"""
+    src = os.path.join(folder, "repatch.json")
+    work = src + ".work"
+    synth.write_file(src, count, seed)
+    problems = []
+    for mode, options in MODES:
+        shutil.copyfile(src, work)
+        engine.patch_file(work, **options)
+        with open(work, 'rb') as f:
+            first = f.read()
+        with open(work, 'ab') as f:
+            f.write(b" ")
+        engine.patch_file(work, **options)
+        with open(work, 'rb') as f:
+            second = f.read()
+        if second != first:
+            before, after = (len(jsonio.loads(text)["keymaps"]) for text in (first, second))
+            problems.append(f"{mode} 模式重复插入后内容不同（点位 {before} → {after}）")
+    os.remove(work)
+    os.remove(src)
+    return problems
+
+
+def check_watch(folder, seed, timeout=10.0):
+    """已插入过的文件被模拟器改写（只改空白）后，监视模式自动重新处理，点位数量应不变；返回问题列表"""
+    src = os.path.join(folder, "watch")
+    paths = synth.write_folder(src, 3, 60, seed)
+    engine.patch_files(paths, workers=1, snapshot=False)
+    counts = [len(jsonio.load_file(path)["keymaps"]) for path in paths]
+    watched = watch.WatchedFolder({"name": "check", "folder": src})
+    daemon = watch.WatchDaemon([watched], interval=0.05, debounce=0.1, workers=1, snapshot=False)
+
+    async def drift_and_wait():
+        task = asyncio.create_task(daemon.run())
+        await asyncio.sleep(0.3)   # 等监视模式记下基准
+        for path in paths:
+            with open(path, 'ab') as f:
+                f.write(b" ")
+        deadline = time.monotonic() + timeout
+        while watched.totals[engine.PATCHED] + watched.totals[engine.FAILED] < len(paths):
+            if time.monotonic() > deadline:
+                break
+            await asyncio.sleep(0.05)
+        daemon.stop()
+        await task
+
+    asyncio.run(drift_and_wait())
+    problems = []
+    if watched.totals[engine.PATCHED] < len(paths):
+        problems.append(f"监视模式只重新处理了 {watched.totals[engine.PATCHED]} / {len(paths)} 个文件"
+                        f"{'：' + watched.last_error if watched.last_error else ''}")
+    for path, before in zip(paths, counts):
+        after = len(jsonio.load_file(path)["keymaps"])
+        if after != before:
+            problems.append(f"监视模式重新处理后点位数量变化：{os.path.basename(path)} {before} → {after}")
+    shutil.rmtree(src, ignore_errors=True)
+    return problems
+
+
+def compare(results, baseline, tolerance):
+    """逐项对比，返回 (报告文本, 是否有变慢超过 tolerance 的项)"""
+    old_cases = {c["name"]: c for c in baseline["cases"]}
+    lines = [f"{'项目':<44} {'阶段':<18} {'上次(ms)':>10} {'本次(ms)':>10} {'变化':>8}"]
+    regressed = False
+    for case in results["cases"]:
+        old = old_cases.get(case["name"])
+        if old is None:
+            continue
+        for stage, value in case["stages"].items():
+            before = old["stages"].get(stage)
+            if not before:
+                continue
+            change = value / before - 1
+            flag = ""
+            if change > tolerance:
+                flag = "  ← 变慢"
+                regressed = True
+            lines.append(f"{case['name']:<44} {stage:<18} {before:>10.1f} {value:>10.1f} {change:>+8.0%}{flag}")
+    return "\n".join(lines), regressed
+
+
+def format_results(results):
+    lines = []
+    for case in results["cases"]:
+        lines.append(case["name"])
+        for stage, value in case["stages"].items():
+            lines.append(f"  {stage:<18} {value:>10.1f} ms")
+        for key in ("peak_memory_mb", "peak_columnar_mb", "peak_stream_mb", "resident_dict_mb", "resident_table_mb"):
+            if key in case:
+                lines.append(f"  {key:<18} {case[key]:>10.1f} MB")
+    return "\n".join(lines)
+
+
+def _ints(text):
+    return [int(v) for v in text.split(",") if v]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="bench_patch", description="插入流程性能测试")
+    parser.add_argument("--sizes", type=_ints, default=[10, 1000, 100000],
+                        help="单文件测试的点位数量，逗号分隔（默认 10,1000,100000，最多可到 1000000）")
+    parser.add_argument("--files", type=_ints, default=[1, 100, 1000],
+                        help="批量测试的文件数量，逗号分隔（默认 1,100,1000）")
+    parser.add_argument("--per-file", type=int, default=60, help="批量测试中每个文件的点位数量")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="批量测试的并行进程数")
+    parser.add_argument("--repeat", type=int, default=3, help="每项重复次数，取最短时间")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="把结果写入该 JSON 文件")
+    parser.add_argument("--compare", help="与上次保存的结果对比")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="变慢超过该比例视为退化（默认 0.1）")
+    parser.add_argument("--no-check", action="store_true", help="跳过计时之前的一致性检查")
+    parser.add_argument("--generate", metavar="FOLDER",
+                        help="只生成测试数据：在该文件夹中写出 --files 第一个值 × --per-file 个点位后退出")
+    args = parser.parse_args(argv)
+
+    if args.generate:
+        paths = synth.write_folder(args.generate, args.files[0], args.per_file, args.seed)
+        print(f"已生成 {len(paths)} 个点位文件：{args.generate}")
+        return 0
+
+    results = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "numpy": optional.numpy() is not None,
+            "json": jsonio.backend(),
+            "repeat": args.repeat,
+        },
+        "cases": [],
+    }
+    with tempfile.TemporaryDirectory(prefix="keymap_bench_") as folder:
+        if not args.no_check:
+            problems = check_repatch(folder, 1000, args.seed) + check_watch(folder, args.seed)
+            for problem in problems:
+                print(f"一致性检查失败：{problem}")
+            if problems:
+                return 1
+        for count in args.sizes:
+            results["cases"].append(bench_file(folder, count, args.repeat, args.seed))
+            print(format_results({"cases": results["cases"][-1:]}), flush=True)
+        for files in args.files:
+            results["cases"].append(bench_folder(folder, files, args.per_file, args.jobs, args.repeat, args.seed))
+            print(format_results({"cases": results["cases"][-1:]}), flush=True)
+    if args.output:
+        with jsonio.atomic_write(args.output) as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入：{args.output}")
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        report, regressed = compare(results, baseline, args.tolerance)
+        print(report)
+        return 1 if regressed else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,405 @@
+"""宏点位插入工具命令行入口：python keymap_cli.py patch <文件夹或通配符...>"""
+import argparse
+import json
+import os
+import sys
+import textwrap
+import time
+
+from keymap_core import engine, jsonio, macro, merge, snapshots, trace
+from keymap_core.regions import SkillArea
+
+
+def cmd_patch(args):
+    paths = engine.collect_targets(args.targets)
+    if not paths:
+        print("没有找到有效的点位文件。", file=sys.stderr)
+        return 1
+    try:
+        new_keymaps, skill_area = engine.load_template(args.template) if args.template else (None, None)
+        if args.region:
+            with open(args.region, 'r', encoding='utf-8') as f:
+                skill_area = SkillArea(json.load(f))
+    except (OSError, ValueError) as e:
+        print(f"读取模板失败：{e}", file=sys.stderr)
+        return 2
+    warning = macro.unknown_warning(new_keymaps) if new_keymaps is not None else ""
+    if warning:
+        print(f"警告：模板中{warning}", file=sys.stderr)
+    start = time.perf_counter()
+    results = engine.patch_files(paths, new_keymaps, skill_area, workers=args.jobs, stream=args.stream,
+                                 use_manifest=args.manifest, force=args.force, policy=args.on_conflict,
+                                 relocate_icons=args.relocate_icons, snapshot=args.snapshot,
+                                 output_format=args.format, dry_run=args.dry_run)
+    print(engine.format_report(results, time.perf_counter() - start, verbose=args.verbose))
+    _print_undo_hint(results)
+    return 0 if all(r["ok"] for r in results) else 1
+
+
+def _print_undo_hint(results):
+    run_id = next((r["snapshot"] for r in results if r["snapshot"]), None)
+    if run_id:
+        print(f"修改前的文件已保存，撤销：python keymap_cli.py restore {run_id}")
+
+
+def cmd_fleet(args):
+    from keymap_core import fleet
+    try:
+        instances = fleet.load_profile(args.profile)
+    except fleet.InvalidProfileError as e:
+        print(e, file=sys.stderr)
+        return 2
+    if args.only:
+        unknown = set(args.only) - {instance["name"] for instance in instances}
+        if unknown:
+            print(f"配置文件中没有这些实例：{'，'.join(sorted(unknown))}", file=sys.stderr)
+            return 2
+        instances = [instance for instance in instances if instance["name"] in args.only]
+    report = fleet.run_profile(instances, workers=args.jobs, stream=args.stream, use_manifest=args.manifest,
+                               force=args.force, snapshot=args.snapshot, dry_run=args.dry_run)
+    print(fleet.format_report(report, verbose=args.verbose))
+    _print_undo_hint(fleet.results(report))
+    if args.output:
+        for summary in report["instances"]:
+            for r in summary["results"]:
+                r.pop("diff", None)
+        with jsonio.atomic_write(args.output) as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入：{args.output}")
+    return 0 if all(not s["error"] and not s["failed"] for s in report["instances"]) else 1
+
+
+def cmd_watch(args):
+    import asyncio
+    from keymap_core import fleet, watch
+    try:
+        if args.profile:
+            instances = fleet.load_profile(args.profile)
+        else:
+            instances = [{"name": os.path.basename(os.path.normpath(folder)) or folder,
+                          "folder": os.path.abspath(folder), "template": args.template, "region": args.region,
+                          "on_conflict": args.on_conflict, "format": args.format,
+                          "relocate_icons": args.relocate_icons} for folder in args.folders]
+            fleet.check_folders(instances)
+        if not instances:
+            print("需要指定要监视的文件夹，或者 --profile", file=sys.stderr)
+            return 2
+        folders = watch.from_instances(instances)
+        address = watch.parse_address(args.status) if args.status else None
+    except (OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 2
+    daemon = watch.WatchDaemon(folders, interval=args.interval, debounce=args.debounce, workers=args.jobs,
+                               snapshot=args.snapshot, status_address=address, initial=args.initial,
+                               log=lambda text: print(f"{time.strftime('%H:%M:%S')} {text}", flush=True))
+    for folder in folders:
+        print(f"监视 {folder.name}：{folder.folder}")
+    print("按 Ctrl+C 停止", flush=True)
+    try:
+        asyncio.run(daemon.run())
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        print(f"无法启动状态查询：{e}", file=sys.stderr)
+        return 2
+    return 0
+
+
+def cmd_check(args):
+    failed = False
+    for path in args.files:
+        start = time.perf_counter()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                keymaps = json.load(f).get("keymaps", [])
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"{path}：无法读取（{e}）")
+            failed = True
+            continue
+        errors = macro.validate_keymaps(keymaps, strict=args.strict)
+        warning = "" if args.strict else macro.unknown_warning(keymaps)
+        elapsed = (time.perf_counter() - start) * 1000
+        actions = sum(len(km.get(field, [])) for km in keymaps if isinstance(km, dict)
+                      for field in macro.ACTION_FIELDS)
+        print(f"{path}：{len(keymaps)} 个点位，{actions} 条宏指令，{len(errors)} 处错误（{elapsed:.1f} ms）")
+        for e in errors:
+            print(textwrap.indent(str(e), "  "))
+        if warning:
+            print(f"  警告：{warning}")
+        failed = failed or bool(errors)
+    return 1 if failed else 0
+
+
+def cmd_optimize(args):
+    from keymap_core import macro_opt
+    try:
+        if args.template:
+            with open(args.template, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            engine.validate_template(data.get("keymaps", []))
+        else:
+            data = {"keymaps": engine.default_keymaps()}
+    except (OSError, ValueError) as e:
+        print(f"读取模板失败：{e}", file=sys.stderr)
+        return 2
+    new_keymaps, reports = macro_opt.optimize_keymaps(data["keymaps"], args.budget)
+    print(macro_opt.format_reports(reports))
+    if args.output:
+        data["keymaps"] = new_keymaps
+        with jsonio.atomic_write(args.output) as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        print(f"已写入：{args.output}")
+    return 0
+
+
+def _read_template(path):
+    if not path:
+        return engine.default_keymaps()
+    with open(path, 'r', encoding='utf-8') as f:
+        keymaps = json.load(f).get("keymaps", [])
+    engine.validate_template(keymaps)
+    return keymaps
+
+
+def _parse_press(text):
+    key, _, times = text.rpartition(":")
+    key, _, start = key.rpartition(":")
+    try:
+        return key, float(start), float(times)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"格式应为 按键:按下毫秒:松开毫秒，例如 Ctrl:0:1000（实际为 {text}）")
+
+
+def cmd_simulate(args):
+    from keymap_core import macro_sim
+    try:
+        keymaps = _read_template(args.template)
+    except (OSError, ValueError) as e:
+        print(f"读取模板失败：{e}", file=sys.stderr)
+        return 2
+    presses = args.press or macro_sim.default_presses(keymaps)
+    try:
+        summary = macro_sim.run(keymaps, presses)
+    except KeyError as e:
+        print(e.args[0], file=sys.stderr)
+        return 2
+    print(macro_sim.format_summary(summary))
+    if args.timeline:
+        with jsonio.atomic_write(args.timeline) as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        print(f"事件时间线已写入：{args.timeline}")
+    return 0
+
+
+def _parse_matrix(text):
+    from keymap_core import remap
+    try:
+        values = [float(v) for v in text.split(",")]
+    except ValueError:
+        values = []
+    if len(values) != 6:
+        raise argparse.ArgumentTypeError(f"格式应为 a,b,c,d,e,f 六个数（实际为 {text}）")
+    return remap.Transform(*values)
+
+
+def cmd_remap(args):
+    from keymap_core import remap
+    paths = engine.collect_targets(args.targets)
+    if not paths:
+        print("没有找到有效的点位文件。", file=sys.stderr)
+        return 1
+    if args.matrix:
+        transform = args.matrix
+    elif args.source and args.target:
+        try:
+            transform = remap.Transform.letterbox(remap.parse_aspect(args.source), remap.parse_aspect(args.target),
+                                                  remap.parse_aspect(args.content) if args.content else None)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 2
+    else:
+        print("需要指定 --from 和 --to，或者 --matrix", file=sys.stderr)
+        return 2
+    print(f"坐标变换：{transform}")
+    start = time.perf_counter()
+    results = remap.remap_files(paths, transform, workers=args.jobs, snapshot=args.snapshot)
+    print(remap.format_report(results, time.perf_counter() - start))
+    _print_undo_hint(results)
+    return 0 if all(r["ok"] for r in results) else 1
+
+
+def cmd_history(args):
+    store = snapshots.Store()
+    if args.file:
+        runs = {run["id"]: run for run in store.list_runs()}
+        found = [runs[run_id] for run_id in reversed(store.file_history(args.file)) if run_id in runs]
+        if not found:
+            print(f"没有该文件的快照：{args.file}")
+            return 1
+        print(snapshots.format_runs(found[:args.limit]))
+        return 0
+    runs = store.list_runs(limit=args.limit)
+    if not runs:
+        print("没有快照。")
+        return 0
+    print(snapshots.format_runs(runs))
+    print(f"快照共占用 {store.size() / 1024 / 1024:.1f} MB：{store.root}")
+    return 0
+
+
+def cmd_restore(args):
+    store = snapshots.Store()
+    try:
+        if args.file:
+            run_id, results = store.restore_file(args.file, args.run)
+        elif args.run:
+            run_id, results = store.restore_run(args.run)
+        else:
+            print("需要指定要撤销的操作编号，或者 --file", file=sys.stderr)
+            return 2
+    except snapshots.SnapshotError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(snapshots.format_restore(run_id, results))
+    return 0 if all(r["ok"] for r in results) else 1
+
+
+def cmd_prune(args):
+    store = snapshots.Store()
+    max_age = args.max_age * 86400 if args.max_age is not None else None
+    removed, freed = store.prune(int(args.max_size * 1024 * 1024), max_age, keep=args.keep)
+    print(f"已删除 {removed} 条操作记录，释放 {freed / 1024 / 1024:.1f} MB，"
+          f"剩余 {store.size() / 1024 / 1024:.1f} MB")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="keymap_cli", description="宏点位插入工具（命令行版）")
+    parser.add_argument("--trace", metavar="FILE",
+                        help=f"记录各阶段耗时并写入 Chrome trace JSON（也可设置环境变量 {trace.ENV_VAR}）")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("patch", help="清空技能区域并插入宏点位模板")
+    p.add_argument("targets", nargs="+", help="点位文件夹、点位文件或通配符（支持 **）")
+    p.add_argument("-t", "--template", help="自定义点位模板文件，不指定则使用默认模板")
+    p.add_argument("-r", "--region", help="技能区域描述文件（JSON），覆盖模板中的 skill_area")
+    p.add_argument("-v", "--verbose", action="store_true", help="列出每个文件被清空的按键")
+    p.add_argument("--stream", action=argparse.BooleanOptionalAction, default=None,
+                   help="逐条流式读写 keymaps（默认仅对超大文件启用）")
+    p.add_argument("-f", "--force", action="store_true", help="忽略处理记录，已处理过的文件也重新处理")
+    p.add_argument("--no-manifest", dest="manifest", action="store_false",
+                   help="不读取也不更新文件夹中的处理记录（.keymap_manifest）")
+    p.add_argument("-j", "--jobs", type=int, default=None, help="并行进程数，默认等于 CPU 核数")
+    p.add_argument("--on-conflict", choices=merge.POLICIES, default=merge.DEFAULT_POLICY,
+                   help="保留的点位与模板点位绑定同一按键时：both 都保留、只报告冲突（默认）、"
+                        "template 模板优先（删除原有点位）、original 原有优先、"
+                        "rebind 原有点位改绑空闲按键、abort 不修改该文件")
+    p.add_argument("--relocate-icons", action="store_true",
+                   help="模板图标压在原有图标上时，把模板图标挪到最近的空位（不影响实际点击位置）")
+    p.add_argument("--no-snapshot", dest="snapshot", action="store_false",
+                   help="修改前不保存原文件（无法用 restore 撤销）")
+    p.add_argument("--format", choices=jsonio.OUTPUT_FORMATS, default=jsonio.PRETTY,
+                   help="保存格式：pretty 标准缩进（默认）、compact 紧凑、minimal 只改写 keymaps 数组，"
+                        "其余内容原样保留")
+    p.add_argument("-n", "--dry-run", action="store_true",
+                   help="只列出每个文件将被删除、新增和改动的点位，不写入任何文件（-v 列出全部改动）")
+    p.set_defaults(func=cmd_patch)
+
+    p = sub.add_parser("fleet", help="按实例配置文件一次处理多个模拟器实例的点位文件夹")
+    p.add_argument("profile", help="实例配置文件（JSON），列出每个实例的文件夹、模板和技能区域")
+    p.add_argument("--only", action="append", metavar="NAME", help="只处理这些实例（可重复）")
+    p.add_argument("-j", "--jobs", type=int, default=None, help="全部实例共用的并行进程数，默认等于 CPU 核数")
+    p.add_argument("-v", "--verbose", action="store_true", help="列出每个实例的逐文件结果")
+    p.add_argument("--stream", action=argparse.BooleanOptionalAction, default=None,
+                   help="逐条流式读写 keymaps（默认仅对超大文件启用）")
+    p.add_argument("-f", "--force", action="store_true", help="忽略处理记录，已处理过的文件也重新处理")
+    p.add_argument("--no-manifest", dest="manifest", action="store_false",
+                   help="不读取也不更新文件夹中的处理记录（.keymap_manifest）")
+    p.add_argument("--no-snapshot", dest="snapshot", action="store_false",
+                   help="修改前不保存原文件（无法用 restore 撤销）")
+    p.add_argument("-n", "--dry-run", action="store_true", help="只预览改动，不写入任何文件")
+    p.add_argument("-o", "--output", help="把汇总结果写入该 JSON 文件")
+    p.set_defaults(func=cmd_fleet)
+
+    p = sub.add_parser("watch", help="持续监视点位文件夹，新建或被改写的点位文件自动插入模板")
+    p.add_argument("folders", nargs="*", help="要监视的点位文件夹")
+    p.add_argument("--profile", help="实例配置文件（与 fleet 相同），监视其中全部实例的文件夹")
+    p.add_argument("-t", "--template", help="自定义点位模板文件，不指定则使用默认模板")
+    p.add_argument("-r", "--region", help="技能区域描述文件（JSON），覆盖模板中的 skill_area")
+    p.add_argument("--on-conflict", choices=merge.POLICIES, default=merge.DEFAULT_POLICY,
+                   help="保留的点位与模板点位绑定同一按键时的处理方式（同 patch）")
+    p.add_argument("--format", choices=jsonio.OUTPUT_FORMATS, default=jsonio.PRETTY, help="保存格式（同 patch）")
+    p.add_argument("--relocate-icons", action="store_true", help="把压在原有图标上的模板图标挪到空位")
+    p.add_argument("--interval", type=float, default=2.0, help="轮询间隔秒数（默认 2）")
+    p.add_argument("--debounce", type=float, default=1.5,
+                   help="文件夹停止变化多少秒后再处理（默认 1.5），模拟器连续写出多个文件时只处理一次")
+    p.add_argument("--status", default="127.0.0.1:8765",
+                   help="状态查询地址 host:port（默认 127.0.0.1:8765），返回排队文件数、各文件夹上次处理时间和错误")
+    p.add_argument("--no-status", dest="status", action="store_const", const=None, help="不提供状态查询")
+    p.add_argument("--initial", action="store_true",
+                   help="启动时把文件夹中已有的文件也处理一遍（默认只处理启动后新建或改写的文件）")
+    p.add_argument("-j", "--jobs", type=int, default=None, help="并行进程数，默认等于 CPU 核数")
+    p.add_argument("--no-snapshot", dest="snapshot", action="store_false",
+                   help="修改前不保存原文件（无法用 restore 撤销）")
+    p.set_defaults(func=cmd_watch)
+
+    p = sub.add_parser("check", help="检查模板或点位文件中的宏指令")
+    p.add_argument("files", nargs="+", help="模板或点位文件")
+    p.add_argument("--strict", action="store_true", help="不认识的宏指令也算作错误（默认只给出警告、原样保留）")
+    p.set_defaults(func=cmd_check)
+
+    p = sub.add_parser("optimize", help="估算每个宏的耗时并给出精简后的写法")
+    p.add_argument("template", nargs="?", help="模板文件，不指定则分析默认模板")
+    p.add_argument("-b", "--budget", type=float, help="每次按键的耗时预算（毫秒），超出时进一步缩短")
+    p.add_argument("-o", "--output", help="把精简后的模板写入该文件")
+    p.set_defaults(func=cmd_optimize)
+
+    p = sub.add_parser("simulate", help="在虚拟时钟上试运行宏，统计点击频率、耗时和按键重叠")
+    p.add_argument("template", nargs="?", help="模板文件，不指定则使用默认模板")
+    p.add_argument("-p", "--press", action="append", type=_parse_press,
+                   help="按键场景 按键:按下毫秒:松开毫秒，可重复；不指定则依次单独按住每个宏按键 1 秒")
+    p.add_argument("--timeline", help="把事件时间线和统计结果写入该 JSON 文件")
+    p.set_defaults(func=cmd_simulate)
+
+    p = sub.add_parser("remap", help="按分辨率 / 宽高比换算点位文件中的全部坐标（直接改写文件）")
+    p.add_argument("targets", nargs="+", help="点位文件夹、点位或模板文件、通配符（支持 **）")
+    p.add_argument("--from", dest="source", help="原屏幕宽高比，例如 16:9")
+    p.add_argument("--to", dest="target", help="新屏幕宽高比，例如 16:10")
+    p.add_argument("--content", help="游戏画面本身的宽高比，默认与原屏幕相同（画面居中，其余为黑边）")
+    p.add_argument("--matrix", type=_parse_matrix,
+                   help="直接指定仿射变换 a,b,c,d,e,f：x'=a*x+b*y+c，y'=d*x+e*y+f")
+    p.add_argument("-j", "--jobs", type=int, default=None, help="并行进程数，默认等于 CPU 核数")
+    p.add_argument("--no-snapshot", dest="snapshot", action="store_false",
+                   help="修改前不保存原文件（无法用 restore 撤销）")
+    p.set_defaults(func=cmd_remap)
+
+    p = sub.add_parser("history", help="列出修改 / 删除操作的快照记录")
+    p.add_argument("file", nargs="?", help="只列出涉及该文件的操作")
+    p.add_argument("-n", "--limit", type=int, default=20, help="最多列出的条数（默认 20）")
+    p.set_defaults(func=cmd_history)
+
+    p = sub.add_parser("restore", help="撤销一次操作，或把单个文件恢复为修改 / 删除之前的内容")
+    p.add_argument("run", nargs="?", help="操作编号（见 history），撤销其中全部文件")
+    p.add_argument("--file", help="只恢复该文件；不指定操作编号时撤销它最近一次的修改或删除")
+    p.set_defaults(func=cmd_restore)
+
+    p = sub.add_parser("prune", help="清理旧的快照")
+    p.add_argument("--max-size", type=float, default=snapshots.MAX_BYTES / 1024 / 1024,
+                   help=f"快照总大小上限（MB，默认 {snapshots.MAX_BYTES // 1024 // 1024}），超出时删除最久未使用的记录")
+    p.add_argument("--max-age", type=float, help="同时删除早于该天数的记录")
+    p.add_argument("--keep", type=int, default=1, help="至少保留最近的几条记录（默认 1）")
+    p.set_defaults(func=cmd_prune)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.trace:
+        trace.enable(args.trace)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    import multiprocessing
+    multiprocessing.freeze_support()
+    sys.exit(main())
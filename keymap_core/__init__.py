@@ -0,0 +1,3 @@
+"""宏点位插入工具核心（不依赖 Qt，可供图形界面和命令行共用）"""
+from .engine import collect_targets, load_template, patch_file, patch_files
+from .regions import SkillArea
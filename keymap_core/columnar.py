@@ -0,0 +1,306 @@
+"""列式点位表：大批量点位常驻内存时代替 json 解析出的嵌套字典
+
+json.loads 之后每个点位是一棵字典树（点位本身、key、icon、rel_position……），
+十万个点位就是上百万个小对象。KeymapTable 只把区域过滤、按键合并、坐标换算要用的字段放进按列存放的 array：
+
+    type            类型在 types 表中的序号（array('H')）
+    work_x/work_y   rel_work_position（缺少的分量为 0，与区域过滤的默认值相同）
+    icon_x/icon_y   icon.rel_position（缺少的分量为 0）
+    device          key.device 在 devices 表中的序号（array('H')）
+    vk/sc           key.virtual_key / key.scan_code（没有时为 -1，array('q')）
+    scale           图标半径系数 editor_icon_scale × icon.radius_correction（不是数值的系数按 1 计，array('d')）
+    flags           HAS_WORK、HAS_ICON、HAS_ACTIONS、COMPLEX_KEY、ODD_ICON 位标志（array('B')）
+
+其余内容（宏指令、图标样式、未知字段）以紧凑 JSON（UTF-8 bytes）原样保存在 Record 中，用到时才解析。
+坐标列可以零拷贝转成 NumPy 数组（numpy_columns()），regions.SkillArea.split、merge.Merger.keep_table、
+layout.Layout.add_table、remap.remap_table 都直接接受 KeymapTable 并按列向量化处理，
+engine.patch_file（较大的文件和流式模式）与 remap.remap_file（较大的文件）从读取到写出都不展开成字典。
+
+与 MuMu 的 JSON 互相转换不丢失任何信息：row() / to_keymaps() 解析 Record 中的原始内容，
+只把列中被修改过的坐标写回（字段顺序、未知字段、整数 / 小数都与原来相同）。
+write_rows() / write_document() 逐行写出，紧凑格式且坐标没有改动时直接写出原始内容。
+按键列是只读的；需要改动坐标以外的内容时用 replace() 整行替换；直接改动坐标列后要把 moved 设为 True。
+"""
+import array
+import itertools
+
+from . import jsonio, macro, optional
+
+HAS_WORK = 1
+HAS_ICON = 2
+HAS_ACTIONS = 4
+# key 的 virtual_key / scan_code 不是整数，或者其它字段中也绑定了按键（摇杆等），
+# 这样的行在合并时要解析原始内容后按 merge.key_bindings 处理
+COMPLEX_KEY = 8
+# icon.rel_position 有内容但不完整或坐标不是数值（此时不退回 rel_work_position）：
+# 这样的行在图标重叠检查时要解析原始内容后按 layout.icon_position 处理
+ODD_ICON = 16
+
+# 不小于该大小的点位文件由 engine.patch_file（不到流式处理的大小时）和 remap.remap_file 读入列式点位表：
+# 内存占用约为字典的三分之一，但逐个点位建表比整体解析慢，小文件仍解析成字典
+COLUMNAR_THRESHOLD = 4 * 1024 * 1024
+# extend() 每批处理的点位数量
+EXTEND_BATCH = 1024
+
+COLUMNS = ("type", "work_x", "work_y", "icon_x", "icon_y", "scale", "device", "vk", "sc", "flags")
+_TYPECODES = {"type": "H", "work_x": "d", "work_y": "d", "icon_x": "d", "icon_y": "d", "scale": "d",
+              "device": "H", "vk": "q", "sc": "q", "flags": "B"}
+
+
+def _number(value):
+    return float(value) if isinstance(value, (int, float)) else None
+
+
+def _position(pos):
+    """(x, y, 是否完整)：缺少的分量按 0 计（与区域过滤相同），两个分量都是数值时才算完整"""
+    if not isinstance(pos, dict):
+        return 0.0, 0.0, False
+    x, y = _number(pos.get("rel_x", 0)), _number(pos.get("rel_y", 0))
+    return x or 0.0, y or 0.0, x is not None and y is not None and "rel_x" in pos and "rel_y" in pos
+
+
+def _factor(value):
+    return value if isinstance(value, (int, float)) else 1
+
+
+def _code(value):
+    if value is None:
+        return -1
+    if isinstance(value, int) and not isinstance(value, bool) and 0 <= value < 2 ** 63:
+        return value
+    return None
+
+
+class Record:
+    """一个点位中不按列存放的部分：原始内容（紧凑 JSON）和按键名"""
+    __slots__ = ("raw", "text")
+
+    def __init__(self, raw, text):
+        self.raw = raw
+        self.text = text
+
+
+class KeymapTable:
+    """按列存放的点位列表"""
+
+    def __init__(self):
+        self.types = []
+        self.devices = []
+        self._type_ids = {}
+        self._device_ids = {}
+        for name in COLUMNS:
+            setattr(self, name, array.array(_TYPECODES[name]))
+        self.records = []
+        # 坐标列是否被直接改动过（改动过的行写出时不能直接用原始内容）
+        self.moved = False
+
+    @classmethod
+    def from_keymaps(cls, keymaps):
+        table = cls()
+        table.extend(keymaps)
+        return table
+
+    @classmethod
+    def load(cls, path):
+        """流式读取点位文件，返回 (顶层字段, KeymapTable)；读取过程中不会同时持有全部点位字典
+
+        顶层字段保持文件中的顺序，keymaps 的位置上是 None（交给 write_document 写出）。
+        """
+        table = cls()
+        members = {}
+        with open(path, 'r', encoding='utf-8') as f:
+            for key, value, streamed in jsonio.iter_document(f, "keymaps"):
+                if streamed:
+                    members.setdefault("keymaps")
+                    table.extend(value)
+                elif key == "keymaps":
+                    raise ValueError("keymaps 字段不是数组")
+                else:
+                    members[key] = value
+        return members, table
+
+    # ---------- 写入 ----------
+
+    def _intern(self, ids, names, value):
+        i = ids.get(value)
+        if i is None:
+            i = ids[value] = len(names)
+            names.append(value)
+        return i
+
+    def _columns(self, km):
+        """km 对应的一行列值"""
+        flags = 0
+        work_x, work_y, complete = _position(km.get("rel_work_position"))
+        if complete:
+            flags |= HAS_WORK
+        icon = km.get("icon")
+        icon_pos = icon.get("rel_position") if isinstance(icon, dict) else None
+        icon_x, icon_y, complete = _position(icon_pos)
+        if complete:
+            flags |= HAS_ICON
+        elif icon_pos:
+            flags |= ODD_ICON
+        correction = icon.get("radius_correction", 1) if isinstance(icon, dict) else 1
+        scale = _factor(km.get("editor_icon_scale", 1)) * _factor(correction)
+        if any(field in km for field in macro.ACTION_FIELDS):
+            flags |= HAS_ACTIONS
+        device, vk, sc = "", -1, -1
+        for name, value in km.items():
+            if not (isinstance(value, dict) and ("virtual_key" in value or "scan_code" in value)):
+                continue
+            if name != "key":
+                flags |= COMPLEX_KEY
+                continue
+            d, v, s = value.get("device", ""), _code(value.get("virtual_key")), _code(value.get("scan_code"))
+            if v is None or s is None or not isinstance(d, str):
+                flags |= COMPLEX_KEY
+            else:
+                device, vk, sc = d, v, s
+        km_type = km.get("type", "")
+        if not isinstance(km_type, str):
+            km_type = ""
+        return (self._intern(self._type_ids, self.types, km_type),
+                work_x, work_y, icon_x, icon_y, float(scale),
+                self._intern(self._device_ids, self.devices, device), vk, sc, flags)
+
+    @staticmethod
+    def _record(km):
+        key = km.get("key")
+        text = key.get("text", "") if isinstance(key, dict) else ""
+        return Record(jsonio.dumps(km, compact=True).encode("utf-8"), text or "?")
+
+    def append(self, km):
+        for name, value in zip(COLUMNS, self._columns(km)):
+            getattr(self, name).append(value)
+        self.records.append(self._record(km))
+
+    def extend(self, keymaps):
+        """追加多个点位；keymaps 可以是迭代器，每次只取出 EXTEND_BATCH 个"""
+        keymaps = iter(keymaps)
+        while True:
+            batch = list(itertools.islice(keymaps, EXTEND_BATCH))
+            if not batch:
+                break
+            # 按列整批追加，比逐行逐列 append 快
+            for name, values in zip(COLUMNS, zip(*map(self._columns, batch))):
+                getattr(self, name).extend(values)
+            self.records.extend(map(self._record, batch))
+
+    def replace(self, i, km):
+        """用 km 整行替换第 i 行"""
+        for name, value in zip(COLUMNS, self._columns(km)):
+            getattr(self, name)[i] = value
+        self.records[i] = self._record(km)
+
+    # ---------- 读取 ----------
+
+    def __len__(self):
+        return len(self.records)
+
+    def type_of(self, i):
+        return self.types[self.type[i]]
+
+    def key_text(self, i):
+        """第 i 行在报告中显示的按键名，不需要解析原始内容"""
+        return self.records[i].text
+
+    def row(self, i):
+        """第 i 行还原成点位字典（新建的对象，修改它不影响表）"""
+        km = jsonio.loads(self.records[i].raw)
+        flags = self.flags[i]
+        if flags & HAS_WORK:
+            pos = km["rel_work_position"]
+            x, y = self.work_x[i], self.work_y[i]
+            if pos["rel_x"] != x or pos["rel_y"] != y:
+                pos["rel_x"], pos["rel_y"] = x, y
+        if flags & HAS_ICON:
+            pos = km["icon"]["rel_position"]
+            x, y = self.icon_x[i], self.icon_y[i]
+            if pos["rel_x"] != x or pos["rel_y"] != y:
+                pos["rel_x"], pos["rel_y"] = x, y
+        return km
+
+    def rows(self, indices=None):
+        if indices is None:
+            indices = range(len(self))
+        return (self.row(i) for i in indices)
+
+    def to_keymaps(self):
+        return list(self.rows())
+
+    def take(self, indices):
+        """按行号取出若干行组成新表（共用 types / devices 表）"""
+        table = KeymapTable()
+        table.types, table.devices = self.types, self.devices
+        table._type_ids, table._device_ids = self._type_ids, self._device_ids
+        table.moved = self.moved
+        indices = list(indices)
+        np = optional.numpy() if indices else None
+        if np is None:
+            for name in COLUMNS:
+                column = getattr(self, name)
+                setattr(table, name, array.array(column.typecode, [column[i] for i in indices]))
+        else:
+            rows = np.asarray(indices, dtype=np.intp)
+            for name, view in zip(COLUMNS, self.numpy_columns()):
+                column = getattr(table, name)
+                column.frombytes(view[rows].tobytes())
+        records = self.records
+        table.records = [records[i] for i in indices]
+        return table
+
+    # ---------- 写出 ----------
+
+    def write_rows(self, writer):
+        """把每一行作为数组元素交给 jsonio.StreamWriter（写在 begin_array / end_array 之间）"""
+        fast = writer.compact and not self.moved
+        for i, record in enumerate(self.records):
+            if fast:
+                writer.raw_item(record.raw.decode("utf-8"))
+            else:
+                writer.item(self.row(i))
+
+    def write_document(self, f, members, tail=(), compact=False):
+        """写出整个点位文件：members 是 load() 返回的顶层字段，keymaps 依次为表中各行和 tail 中的点位字典
+
+        输出与 jsonio.dumps / render 对整个文档的结果逐字节相同。
+        """
+        writer = jsonio.StreamWriter(f, compact=compact)
+        writer.begin()
+        for key, value in members.items():
+            if key != "keymaps":
+                writer.member(key, value)
+            else:
+                self._write_keymaps(writer, tail)
+        # 文件中原本没有 keymaps 时写在最后（与 dict 赋值的顺序相同）
+        if "keymaps" not in members:
+            self._write_keymaps(writer, tail)
+        writer.end()
+
+    def _write_keymaps(self, writer, tail):
+        writer.begin_array("keymaps")
+        self.write_rows(writer)
+        for km in tail:
+            writer.item(km)
+        writer.end_array()
+
+    def numpy_columns(self, *names):
+        """各列的 NumPy 视图（零拷贝，与表共用内存），没有安装 NumPy 时返回 None"""
+        np = optional.numpy()
+        if np is None:
+            return None
+        views = []
+        for name in names or COLUMNS:
+            column = getattr(self, name)
+            views.append(np.frombuffer(column, dtype=column.typecode) if len(column) else
+                         np.zeros(0, dtype=column.typecode))
+        return views
+
+    def nbytes(self):
+        """列和原始内容占用的字节数（不含 Python 对象本身的开销）"""
+        size = sum(getattr(self, name).itemsize * len(self) for name in COLUMNS)
+        return size + sum(len(r.raw) for r in self.records)
+
+    def __repr__(self):
+        return f"<KeymapTable {len(self)} 个点位>"
@@ -0,0 +1,25 @@
+"""默认新增宏点位模板
+
+模板内容保存在 data/default_template.json 中（请根据你的需求修改该文件），格式与自定义模板文件相同。
+首次使用时读取一次并缓存，之后返回同一个列表，调用方不要修改。
+"""
+import functools
+import json
+import os
+
+from .paths import resource_path
+
+DATA_FILE = os.path.join("keymap_core", "data", "default_template.json")
+
+
+@functools.lru_cache(maxsize=None)
+def default_keymaps():
+    with open(resource_path(DATA_FILE), 'r', encoding='utf-8') as f:
+        return json.load(f)["keymaps"]
+
+
+def __getattr__(name):
+    # 兼容旧代码中的 DEFAULT_KEYMAPS 常量
+    if name == "DEFAULT_KEYMAPS":
+        return default_keymaps()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,141 @@
+"""点位结构对比：比较插入前后的 keymaps，列出删除、新增和改动的点位
+
+三轮哈希配对，整体 O(n)：
+    1. 内容完全相同 → 未改动。插入时保留的点位和原来是同一个对象，先按对象配对，
+       其余的再比较键排序后的 JSON 的哈希
+    2. 剩下的按 (类型, 绑定的按键) 配对 → 改动（例如宏指令、图标位置变了）
+    3. 再剩下的按点击位置（取到千分之一）配对 → 改动（例如改绑了按键）
+最后没配上的原有点位是删除，新点位是新增。同一个哈希有多个候选时按出现顺序依次配对。
+结果里只保留点位的简短描述，不含点位本身，可以直接从工作进程传回。
+"""
+import hashlib
+from collections import deque
+
+from . import jsonio
+from .merge import key_bindings
+
+# 位置配对时坐标保留的小数位数
+POSITION_DIGITS = 3
+
+
+def _fingerprint(km):
+    return hashlib.blake2b(jsonio.canonical(km), digest_size=16).digest()
+
+
+def _identity(km):
+    return km.get("type"), tuple(key_bindings(km))
+
+
+def _position(km):
+    pos = km.get("rel_work_position") or km.get("icon", {}).get("rel_position")
+    if not isinstance(pos, dict) or "rel_x" not in pos or "rel_y" not in pos:
+        return None
+    return round(pos["rel_x"], POSITION_DIGITS), round(pos["rel_y"], POSITION_DIGITS)
+
+
+def describe(km):
+    """点位的简短描述：按键 类型 (x, y)"""
+    text = km.get("key", {}).get("text", "") or "?"
+    pos = _position(km)
+    where = f" ({pos[0]:.3f}, {pos[1]:.3f})" if pos else ""
+    return f"{text} {km.get('type', '')}{where}"
+
+
+def changed_fields(old, new):
+    """两个点位中取值不同的字段，嵌套一层的字典列出子字段（例如 key.text）"""
+    fields = []
+    for name in list(old) + [name for name in new if name not in old]:
+        a, b = old.get(name), new.get(name)
+        if a == b:
+            continue
+        if isinstance(a, dict) and isinstance(b, dict):
+            fields.extend(f"{name}.{sub}" for sub in list(a) + [sub for sub in b if sub not in a]
+                          if a.get(sub) != b.get(sub))
+        else:
+            fields.append(name)
+    return fields
+
+
+def _pair(old_left, new_left, key_func, changed):
+    """按 key_func 配对剩余的点位，配上的记为改动，返回仍未配对的 (原有, 新) 序号列表"""
+    buckets = {}
+    for i in old_left:
+        key = key_func(old_left[i])
+        if key is not None:
+            buckets.setdefault(key, deque()).append(i)
+    rest_new = {}
+    for j, km in new_left.items():
+        key = key_func(km)
+        candidates = buckets.get(key) if key is not None else None
+        if candidates:
+            i = candidates.popleft()
+            changed.append((i, j, old_left.pop(i), km))
+        else:
+            rest_new[j] = km
+    return old_left, rest_new
+
+
+def diff_keymaps(old_keymaps, new_keymaps):
+    """对比两组点位，返回 {"unchanged": 数量, "removed": [描述], "added": [描述],
+    "changed": [{"old": 描述, "new": 描述, "fields": [字段]}]}，各列表按原有 / 新列表中的顺序排列"""
+    old_keymaps = [km for km in old_keymaps if isinstance(km, dict)]
+    new_keymaps = [km for km in new_keymaps if isinstance(km, dict)]
+    objects = {}
+    for i, km in enumerate(old_keymaps):
+        objects.setdefault(id(km), i)
+    matched = [False] * len(old_keymaps)
+    new_left = {}
+    for j, km in enumerate(new_keymaps):
+        i = objects.pop(id(km), None)
+        if i is None:
+            new_left[j] = km
+        else:
+            matched[i] = True
+    same = {}
+    for i, km in enumerate(old_keymaps):
+        if not matched[i]:
+            same.setdefault(_fingerprint(km), deque()).append(i)
+    if same:
+        for j, km in list(new_left.items()):
+            candidates = same.get(_fingerprint(km))
+            if candidates:
+                matched[candidates.popleft()] = True
+                del new_left[j]
+    old_left = {i: km for i, km in enumerate(old_keymaps) if not matched[i]}
+    changed = []
+    old_left, new_left = _pair(old_left, new_left, _identity, changed)
+    old_left, new_left = _pair(old_left, new_left, _position, changed)
+    changed.sort(key=lambda item: item[1])
+    return {
+        "unchanged": len(old_keymaps) - len(old_left) - len(changed),
+        "removed": [describe(km) for km in old_left.values()],
+        "added": [describe(km) for km in new_left.values()],
+        "changed": [{"old": describe(a), "new": describe(b), "fields": changed_fields(a, b)}
+                    for _, _, a, b in changed],
+    }
+
+
+def is_empty(changes):
+    return not (changes["removed"] or changes["added"] or changes["changed"])
+
+
+def summary(changes):
+    return (f"删除 {len(changes['removed'])}，新增 {len(changes['added'])}，"
+            f"改动 {len(changes['changed'])}，未改动 {changes['unchanged']}")
+
+
+def format_diff(changes, limit=None, indent=""):
+    """逐条列出改动：- 删除、+ 新增、~ 改动；limit 限定每类列出的条数"""
+    lines = []
+    for mark, items in (("-", changes["removed"]), ("+", changes["added"])):
+        shown = items if limit is None else items[:limit]
+        lines.extend(f"{indent}{mark} {text}" for text in shown)
+        if len(shown) < len(items):
+            lines.append(f"{indent}{mark} …… 等 {len(items)} 个")
+    shown = changes["changed"] if limit is None else changes["changed"][:limit]
+    for c in shown:
+        target = c["old"] if c["old"] == c["new"] else f"{c['old']} → {c['new']}"
+        lines.append(f"{indent}~ {target}：{', '.join(c['fields'])}")
+    if len(shown) < len(changes["changed"]):
+        lines.append(f"{indent}~ …… 等 {len(changes['changed'])} 个")
+    return "\n".join(lines)
@@ -0,0 +1,641 @@
+"""点位文件处理核心：读取 → 清空技能区域 → 插入模板 → 保存，不依赖 Qt"""
+import glob
+import hashlib
+import itertools
+import json
+import os
+import time
+
+from . import diff, jsonio, layout, macro, manifest, merge, naming, snapshots, trace
+from .columnar import COLUMNAR_THRESHOLD, KeymapTable
+from .default_template import default_keymaps
+from .merge import key_text
+from .regions import DEFAULT_SKILL_AREA, SkillArea
+
+# 超过该大小的点位文件自动使用流式读写
+STREAM_THRESHOLD = 16 * 1024 * 1024
+# 流式模式下每批做一次区域判定的点位数量
+STREAM_BATCH = 1024
+
+
+class InvalidTemplateError(ValueError):
+    """模板文件缺少 keymaps 列表"""
+
+
+def load_template(path):
+    """读取自定义模板文件，返回 (keymaps 列表, 技能区域)；未配置 skill_area 时使用默认区域"""
+    with trace.span("template.load", path=path):
+        data = jsonio.load_file(path)
+    return parse_template(data)
+
+
+def parse_template(data):
+    """检查已解析的模板内容，返回 (keymaps 列表, 技能区域)"""
+    if not isinstance(data, dict) or "keymaps" not in data or not isinstance(data["keymaps"], list):
+        raise InvalidTemplateError("该文件不是有效的点位模板！")
+    validate_template(data["keymaps"])
+    skill_area = SkillArea(data["skill_area"]) if "skill_area" in data else DEFAULT_SKILL_AREA
+    return data["keymaps"], skill_area
+
+
+class TemplateCache:
+    """同一个模板文件 / 技能区域只读取一次；读取失败时每次都抛出同样的异常"""
+
+    def __init__(self):
+        self.templates = {}
+        self.regions = {}
+
+    @staticmethod
+    def _get(cache, key, load):
+        if key not in cache:
+            try:
+                cache[key] = load()
+            except (OSError, ValueError) as e:
+                cache[key] = e
+        value = cache[key]
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+    def template(self, path):
+        """返回 (keymaps, 技能区域)，path 为 None 时为 (None, None)"""
+        if path is None:
+            return None, None
+        return self._get(self.templates, path, lambda: load_template(path))
+
+    def region(self, region):
+        """region 为区域文件路径、区域描述或 SkillArea，返回 SkillArea；None 时返回 None"""
+        if region is None or isinstance(region, SkillArea):
+            return region
+        if isinstance(region, str):
+            return self._get(self.regions, region, lambda: SkillArea(jsonio.load_file(region)))
+        return self._get(self.regions, json.dumps(region, sort_keys=True), lambda: SkillArea(region))
+
+
+def validate_template(new_keymaps):
+    """写入前检查模板中全部宏指令，有错误时抛出 InvalidTemplateError（列出前几处错误）"""
+    errors = macro.validate_keymaps(new_keymaps, limit=5)
+    if errors:
+        raise InvalidTemplateError("模板中的宏指令有误：\n" + "\n".join(str(e) for e in errors))
+
+
+# 结果状态
+PATCHED = "patched"
+SKIPPED = "skipped"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+def _result(path, kept=0, removed_keys=(), inserted=0, elapsed=0.0, error="", status=None, conflicts=(),
+            overlaps=(), group=0):
+    status = status or (FAILED if error else PATCHED)
+    return {
+        "path": path,
+        "ok": status in (PATCHED, SKIPPED),
+        "status": status,
+        "drift": False,
+        "kept": kept,
+        "removed": len(removed_keys),
+        "removed_keys": list(removed_keys),
+        "inserted": inserted,
+        "conflicts": list(conflicts),
+        "overlaps": list(overlaps),
+        "snapshot": None,
+        "diff": None,
+        "elapsed": elapsed,
+        "error": error,
+        "group": group,
+    }
+
+
+def error_result(path, error):
+    """无法处理的文件的结果字典"""
+    return _result(path, error=error)
+
+
+def _finish(merger, icons):
+    """合并结束时要追加的模板点位（检查图标重叠后），返回 (点位列表, 图标重叠)"""
+    with trace.span("merge.finish"):
+        return icons.place(merger.finish())
+
+
+def _merge_in_memory(path, merger, icons, skill_area, output_format):
+    """读取并合并，返回 (文档, 原文, 字段位置, 原有点位, 被清空的点位, 图标重叠)，文档中已是合并后的点位"""
+    with trace.span("json.parse"):
+        with open(path, 'rb') as f:
+            text = f.read().decode('utf-8')
+        if output_format == jsonio.MINIMAL:
+            data, spans = jsonio.member_spans(text)
+        else:
+            data, spans = jsonio.loads(text), None
+    original = data.get("keymaps", [])
+    with trace.span("filter"):
+        filtered_keymaps, removed_keymaps = skill_area.split(original)
+    with trace.span("merge"):
+        merger.reserve(filtered_keymaps)
+        merged = []
+        for km in filtered_keymaps:
+            km = merger.keep(km)
+            if km is not None:
+                icons.add(km)
+                merged.append(km)
+    tail, overlaps = _finish(merger, icons)
+    merged.extend(tail)
+    data["keymaps"] = merged
+    return data, text, spans, original, removed_keymaps, overlaps
+
+
+def _patch_in_memory(path, merger, icons, skill_area, output_format):
+    data, text, spans, _, removed_keymaps, overlaps = _merge_in_memory(path, merger, icons, skill_area,
+                                                                       output_format)
+    with trace.span("json.dump"):
+        output = jsonio.render(data, output_format, text, spans)
+    if output_format != jsonio.MINIMAL:
+        # 文本模式写出时换行符由系统决定，比较前统一成 \n
+        text = text.replace("\r\n", "\n")
+    # 内容没有变化（例如重复插入同一模板）时不写文件，同步盘不会看到改动
+    if output == text:
+        trace.count("files.unchanged")
+    else:
+        newline = "" if output_format == jsonio.MINIMAL else None
+        with jsonio.atomic_write(path, newline=newline) as f:
+            f.write(output)
+    return merger.kept, [key_text(km) for km in removed_keymaps], overlaps
+
+
+def _merge_table(table, merger, icons, skill_area):
+    """区域过滤并合并一张列式点位表，返回 (要写出的行组成的表, 被清空的按键)，全程不展开成字典"""
+    with trace.span("filter", keymaps=len(table)):
+        kept, removed = skill_area.split(table)
+    with trace.span("merge"):
+        merger.reserve_table(kept)
+        kept = merger.keep_table(kept)
+        icons.add_table(kept)
+    return kept, [removed.key_text(i) for i in range(len(removed))]
+
+
+class _Unchanged(Exception):
+    """写出的内容与原文件相同，放弃替换"""
+
+
+class _DigestWriter:
+    """写入文件的同时计算内容的摘要"""
+
+    def __init__(self, f):
+        self.f = f
+        self.digest = hashlib.sha1()
+
+    def write(self, text):
+        self.digest.update(text.encode("utf-8"))
+        self.f.write(text)
+
+
+def _text_digest(path):
+    """文件内容（\r\n 统一成 \n）的摘要，逐块读取"""
+    digest = hashlib.sha1()
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        pending = ""
+        while True:
+            chunk = f.read(1024 * 1024)
+            if not chunk:
+                break
+            chunk = pending + chunk
+            # 块末尾的 \r 可能与下一块开头的 \n 组成换行
+            pending = "\r" if chunk.endswith("\r") else ""
+            digest.update(chunk[:len(chunk) - len(pending)].replace("\r\n", "\n").encode("utf-8"))
+        digest.update(pending.encode("utf-8"))
+    return digest.digest()
+
+
+def _patch_columnar(path, merger, icons, skill_area, output_format):
+    """读入列式点位表后合并，逐行写出：保留的点位始终以紧凑 JSON 存放，不会同时持有全部点位字典"""
+    with trace.span("json.parse"):
+        members, table = KeymapTable.load(path)
+    kept, removed_keys = _merge_table(table, merger, icons, skill_area)
+    del table
+    tail, overlaps = _finish(merger, icons)
+    source = _text_digest(path)
+    try:
+        with trace.span("json.dump"), jsonio.atomic_write(path) as f:
+            out = _DigestWriter(f)
+            kept.write_document(out, members, tail, compact=output_format == jsonio.COMPACT)
+            # 与内存模式相同：内容没有变化时不替换原文件
+            if out.digest.digest() == source:
+                raise _Unchanged
+    except _Unchanged:
+        trace.count("files.unchanged")
+    return merger.kept, removed_keys, overlaps
+
+
+def _patch_streaming(path, merger, icons, skill_area, output_format):
+    removed_keys = []
+    overlaps = []
+
+    def flush(batch):
+        kept, removed = _merge_table(KeymapTable.from_keymaps(batch), merger, icons, skill_area)
+        kept.write_rows(writer)
+        removed_keys.extend(removed)
+
+    if merger.policy == merge.REBIND:
+        # 改绑不能选到后面的点位正在用的按键：先读一遍文件，登记全部保留的点位的按键
+        with trace.span("stream.reserve"), open(path, 'r', encoding='utf-8') as src:
+            for key, value, streamed in jsonio.iter_document(src, "keymaps"):
+                while streamed:
+                    batch = list(itertools.islice(value, STREAM_BATCH))
+                    if not batch:
+                        break
+                    merger.reserve(skill_area.split(batch)[0])
+
+    # 源文件必须在替换前关闭（Windows 下无法替换已打开的文件）
+    with jsonio.atomic_write(path) as dst:
+        with trace.span("stream"), open(path, 'r', encoding='utf-8') as src:
+            writer = jsonio.StreamWriter(dst, compact=output_format == jsonio.COMPACT)
+            writer.begin()
+            found = False
+            for key, value, streamed in jsonio.iter_document(src, "keymaps"):
+                if not streamed:
+                    if key == "keymaps":
+                        raise ValueError("keymaps 字段不是数组")
+                    writer.member(key, value)
+                    continue
+                found = True
+                writer.begin_array(key)
+                batch = []
+                for km in value:
+                    batch.append(km)
+                    if len(batch) >= STREAM_BATCH:
+                        flush(batch)
+                        batch = []
+                flush(batch)
+                tail, overlaps = _finish(merger, icons)
+                for km in tail:
+                    writer.item(km)
+                writer.end_array()
+            if not found:
+                writer.begin_array("keymaps")
+                tail, overlaps = _finish(merger, icons)
+                for km in tail:
+                    writer.item(km)
+                writer.end_array()
+            writer.end()
+    return merger.kept, removed_keys, overlaps
+
+
+def _preview(path, merger, icons, skill_area):
+    """只合并不写入，返回 (保留数, 被清空的按键, 图标重叠, 插入前后的对比)"""
+    data, _, _, original, removed_keymaps, overlaps = _merge_in_memory(path, merger, icons, skill_area,
+                                                                       jsonio.PRETTY)
+    with trace.span("diff"):
+        changes = diff.diff_keymaps(original, data["keymaps"])
+    return merger.kept, [key_text(km) for km in removed_keymaps], overlaps, changes
+
+
+def patch_file(path, new_keymaps=None, skill_area=None, stream=None, policy=None, relocate_icons=False,
+               store=None, output_format=None, dry_run=False, columnar=None):
+    """清空单个点位文件的技能区域并插入模板点位，出错时直接抛出异常
+
+    stream 为 None 时按文件大小自动选择：超过 STREAM_THRESHOLD 的文件逐条流式处理，
+    内存占用与文件大小无关，每批点位读入一张列式点位表后过滤、合并、写出。
+    不流式处理时，columnar 为 None 则不小于 COLUMNAR_THRESHOLD 的文件整个读入列式点位表（见 columnar 模块），
+    保留的点位直到写出都不展开成字典；较小的文件和 minimal 格式仍解析成字典处理。
+    各种模式都先写临时文件再原子替换。
+    保留的点位与模板点位绑定同一按键时按 policy 处理（见 merge 模块），默认两者都保留、只报告冲突。
+    模板图标压在原有图标上时记录在结果的 overlaps 中，relocate_icons 时挪到最近的空位（见 layout 模块）。
+    指定快照仓库 store 时先保存原文件，快照记录放在结果的 snapshot 中（见 snapshots 模块）。
+    output_format 为 jsonio.OUTPUT_FORMATS 之一，默认 pretty；流式模式不支持 minimal，按 pretty 写出。
+    dry_run 时不写文件也不拍快照，结果的 diff 为插入前后 keymaps 的对比（见 diff 模块），
+    需要把整个文件读入内存，不使用流式模式。
+    """
+    if not new_keymaps:
+        new_keymaps = default_keymaps()
+    if skill_area is None:
+        skill_area = DEFAULT_SKILL_AREA
+    output_format = output_format or jsonio.PRETTY
+    start = time.perf_counter()
+    if dry_run:
+        stream = False
+    elif stream is None:
+        stream = os.path.getsize(path) >= STREAM_THRESHOLD
+    if dry_run or stream or output_format == jsonio.MINIMAL:
+        columnar = False
+    elif columnar is None:
+        columnar = os.path.getsize(path) >= COLUMNAR_THRESHOLD
+    merger = merge.Merger(new_keymaps, policy)
+    icons = layout.Layout(relocate=relocate_icons)
+    patch = _patch_streaming if stream else _patch_columnar if columnar else _patch_in_memory
+    changes = snapshot = None
+    with trace.span("patch_file", path=path, stream=stream, columnar=columnar, dry_run=dry_run):
+        if dry_run:
+            kept, removed_keys, overlaps, changes = _preview(path, merger, icons, skill_area)
+        else:
+            snapshot = store.save_file(path) if store is not None else None
+            kept, removed_keys, overlaps = patch(path, merger, icons, skill_area, output_format)
+    trace.count("keymaps.kept", kept)
+    trace.count("keymaps.removed", len(removed_keys))
+    trace.count("keymaps.inserted", merger.inserted())
+    result = _result(path, kept, removed_keys, merger.inserted(), time.perf_counter() - start,
+                     conflicts=[merge.format_conflict(c) for c in merger.conflicts], overlaps=overlaps)
+    result["snapshot"] = snapshot
+    result["diff"] = changes
+    return result
+
+
+def collect_targets(targets):
+    """把文件夹、通配符和文件路径展开成去重后的点位文件列表"""
+    found = {}
+    for target in targets:
+        if os.path.isdir(target):
+            with trace.span("listdir", folder=target):
+                names = sorted(f for f in os.listdir(target) if f.endswith(".json"))
+            paths = [os.path.join(target, f) for f in names]
+        elif glob.has_magic(target):
+            paths = sorted(glob.glob(target, recursive=True))
+        else:
+            paths = [target]
+        for path in paths:
+            if naming.rules().is_excluded(os.path.basename(path)):
+                continue
+            found.setdefault(os.path.abspath(path), None)
+    return list(found)
+
+
+# 进程池中每个工作进程只接收一次模板等参数，避免每个任务重复序列化；
+# 一次可以处理多组文件（每组的模板不同），任务中记录所属的组号
+_worker_groups = []
+
+
+def _init_worker(groups):
+    stores = {}
+    _worker_groups.clear()
+    for options in groups:
+        options = dict(options)
+        if options["snapshots"]:
+            if options["snapshots"] not in stores:
+                stores[options["snapshots"]] = snapshots.Store(options["snapshots"])
+            options["store"] = stores[options["snapshots"]]
+        _worker_groups.append(options)
+    if any(options.get("trace") for options in groups):
+        import multiprocessing
+        if multiprocessing.parent_process() is not None:
+            trace.start_worker()
+
+
+def _patch_one(task):
+    path, entry, group = task
+    opts = _worker_groups[group]
+    start = time.perf_counter()
+    try:
+        drift = False
+        if entry is not None and not opts["force"]:
+            status, refreshed = manifest.check(path, entry, opts["template_hash"])
+            if status == manifest.UNCHANGED:
+                result = _result(path, elapsed=time.perf_counter() - start, status=SKIPPED)
+                result["manifest"] = refreshed
+                return result
+            drift = status == manifest.DRIFT
+        result = patch_file(path, opts["keymaps"], opts["skill_area"], opts["stream"], opts["policy"],
+                            opts["relocate_icons"], opts.get("store"), opts["output_format"], opts["dry_run"])
+        result["drift"] = drift
+        if opts["use_manifest"] and not opts["dry_run"]:
+            result["manifest"] = manifest.make_entry(path, opts["template_hash"])
+    except Exception as e:
+        result = _result(path, elapsed=time.perf_counter() - start, error=str(e) or type(e).__name__)
+    if opts.get("trace"):
+        result["trace"] = trace.drain()
+    return result
+
+
+def _patch_chunk(chunk):
+    return [(i, _patch_one((path, entry, group))) for i, path, entry, group in chunk]
+
+
+def make_options(new_keymaps=None, skill_area=None, stream=None, use_manifest=True, force=False, policy=None,
+                 relocate_icons=False, output_format=None, dry_run=False):
+    """检查模板和参数，生成一组文件的处理参数（patch_groups 使用），参数含义与 patch_files 相同"""
+    options = {
+        "keymaps": new_keymaps or default_keymaps(),
+        "skill_area": skill_area or DEFAULT_SKILL_AREA,
+        "stream": stream,
+        "force": force,
+        "use_manifest": use_manifest,
+        "policy": policy or merge.DEFAULT_POLICY,
+        "relocate_icons": relocate_icons,
+        "trace": trace.enabled(),
+        "snapshots": None,
+        "output_format": output_format or jsonio.PRETTY,
+        "dry_run": dry_run,
+    }
+    if options["policy"] not in merge.POLICIES:
+        raise ValueError(f"未知的冲突处理策略：{policy}")
+    if options["output_format"] not in jsonio.OUTPUT_FORMATS:
+        raise ValueError(f"未知的保存格式：{output_format}")
+    validate_template(options["keymaps"])
+    options["template_hash"] = manifest.template_hash(options["keymaps"], options["skill_area"],
+                                                      options["policy"], relocate_icons, options["output_format"])
+    return options
+
+
+def patch_files(paths, new_keymaps=None, skill_area=None, workers=None, stream=None,
+                use_manifest=True, force=False, on_result=None, cancel_event=None, policy=None,
+                relocate_icons=False, snapshot=True, output_format=None, dry_run=False):
+    """批量修改点位文件，按输入顺序返回每个文件的结果字典
+
+    use_manifest 时根据各文件夹的处理记录跳过已用同一模板处理过且未被改动的文件，
+    force 为 True 时忽略记录全部重新处理。
+    on_result(result) 在每个文件处理完时调用（完成顺序）；cancel_event 被设置后不再开始新的文件，
+    未处理的文件状态为 CANCELLED。policy 为按键冲突处理策略（merge.POLICIES），
+    relocate_icons 为 True 时把压在原有图标上的模板图标挪到空位。
+    snapshot 为 True（默认仓库）或 snapshots.Store 时，修改前先保存原文件，整批记为一次操作，
+    结果的 snapshot 为该操作的编号，可以整批或逐个文件撤销；为 False 时不保存。
+    output_format 为保存格式（jsonio.OUTPUT_FORMATS），默认 pretty。
+    dry_run 时只生成每个文件的改动对比（结果的 diff），不写入任何文件，包括处理记录和快照。
+    """
+    paths = list(paths)
+    if not paths:
+        return []
+    planned = plan(paths, new_keymaps, skill_area, stream=stream, use_manifest=use_manifest, force=force,
+                   policy=policy, relocate_icons=relocate_icons, output_format=output_format, dry_run=dry_run)
+    results = [None] * len(paths)
+    groups = []
+    for indices, options in planned:
+        if isinstance(options, str):
+            for i in indices:
+                results[i] = error_result(paths[i], options)
+                if on_result:
+                    on_result(results[i])
+        else:
+            groups.append((indices, options))
+    if groups:
+        grouped = patch_groups([([paths[i] for i in indices], options) for indices, options in groups], workers,
+                               on_result, cancel_event, snapshot, f"插入宏点位（{len(paths)} 个文件）")
+        for (indices, _), group_results in zip(groups, grouped):
+            for i, result in zip(indices, group_results):
+                results[i] = result
+    return results
+
+
+def plan(paths, new_keymaps=None, skill_area=None, cache=None, **kwargs):
+    """按文件名规则（naming.rules()）把文件分组，生成各组的处理参数，返回 [(序号列表, 参数)]
+
+    没有指定模板 / 技能区域时使用规则中该游戏的默认模板 / 技能区域，规则中也没有时使用默认值。
+    规则指定的模板或区域无法读取时该组的参数为错误信息（str），这些文件不处理；
+    调用方自己的模板有误时照常抛出异常。kwargs 为 make_options() 的其余参数，cache 为 TemplateCache。
+    """
+    rules = naming.rules()
+    cache = cache or TemplateCache()
+    keys = {}
+    for i, path in enumerate(paths):
+        match = rules.match(os.path.basename(path))
+        template = match.template if not new_keymaps else None
+        region = match.region if skill_area is None else None
+        keys.setdefault((template, region if region is None or isinstance(region, str)
+                         else json.dumps(region, sort_keys=True)), (template, region, []))[2].append(i)
+    planned = []
+    for template, region, indices in keys.values():
+        if template is None and region is None:
+            planned.append((indices, make_options(new_keymaps, skill_area, **kwargs)))
+            continue
+        try:
+            keymaps, area = cache.template(template) if template else (new_keymaps, skill_area)
+            area = cache.region(region) or skill_area or area
+        except (OSError, ValueError) as e:
+            planned.append((indices, f"读取规则指定的模板或技能区域失败：{e}"))
+            continue
+        planned.append((indices, make_options(keymaps, area, **kwargs)))
+    return planned
+
+
+def patch_groups(groups, workers=None, on_result=None, cancel_event=None, snapshot=True, label=None):
+    """一次处理多组文件，每组为 (路径列表, make_options() 生成的参数)，各组可以使用不同的模板和技能区域
+
+    所有文件共用一个进程池（最多 workers 个进程），整体记为一次快照操作（label 为操作名称）。
+    结果字典中 group 为所属组的序号。返回与 groups 对应的结果列表的列表。
+    """
+    groups = [(list(paths), options) for paths, options in groups]
+    option_list = [options for _, options in groups]
+    use_manifest = any(options["use_manifest"] for options in option_list)
+    dry_run = all(options["dry_run"] for options in option_list)
+    manifests = manifest.ManifestSet() if use_manifest else None
+    run = None
+    if snapshot and not dry_run:
+        store = snapshot if isinstance(snapshot, snapshots.Store) else snapshots.Store()
+        for options in option_list:
+            options["snapshots"] = None if options["dry_run"] else store.root
+        total = sum(len(paths) for paths, _ in groups)
+        run = store.begin(label or f"插入宏点位（{total} 个文件）")
+
+    results = [[None] * len(paths) for paths, _ in groups]
+    tasks = []
+    for group, (paths, options) in enumerate(groups):
+        for i, path in enumerate(paths):
+            entry = manifests.for_path(path).get(path) if options["use_manifest"] else None
+            if (entry is not None and not options["force"]
+                    and manifest.quick_check(path, entry, options["template_hash"]) == manifest.UNCHANGED):
+                results[group][i] = _result(path, status=SKIPPED, group=group)
+                if on_result:
+                    on_result(results[group][i])
+                continue
+            tasks.append(((group, i), path, entry, group))
+
+    try:
+        with trace.span("patch_files", files=len(tasks), workers=workers, groups=len(groups)):
+            for (group, i), result in _run_tasks(tasks, option_list, workers, cancel_event):
+                result["group"] = group
+                results[group][i] = result
+                trace.extend(result.pop("trace", ()))
+                if run is not None and result["snapshot"] is not None:
+                    run.add(result["snapshot"])
+                entry = result.pop("manifest", None)
+                if entry is not None and not option_list[group]["dry_run"]:
+                    manifests.for_path(result["path"]).set(result["path"], entry)
+                if on_result:
+                    on_result(result)
+    finally:
+        if manifests and not dry_run:
+            with trace.span("manifest.save"):
+                manifests.save()
+        run_id = run.commit() if run is not None else None
+    for group, (paths, _) in enumerate(groups):
+        for i, path in enumerate(paths):
+            result = results[group][i]
+            if result is None:
+                results[group][i] = _result(path, status=CANCELLED, group=group)
+            elif result["snapshot"] is not None:
+                result["snapshot"] = run_id
+    return results
+
+
+def _run_tasks(tasks, groups, workers, cancel_event=None):
+    """执行任务，按完成顺序逐个产出 (序号, 结果)"""
+    if not tasks:
+        return
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(tasks)))
+    if workers == 1:
+        _init_worker(groups)
+        for i, path, entry, group in tasks:
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            yield i, _patch_one((path, entry, group))
+        return
+    # 进程池只在并行处理时才需要，延迟导入以加快启动
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    size = max(1, len(tasks) // (workers * 4))
+    chunks = [tasks[k:k + size] for k in range(0, len(tasks), size)]
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(groups,))
+    try:
+        futures = [pool.submit(_patch_chunk, chunk) for chunk in chunks]
+        pending = set(futures)
+        for future in as_completed(futures):
+            pending.discard(future)
+            yield from future.result()
+            if cancel_event is not None and cancel_event.is_set():
+                break
+        # 已经开始执行的任务无法中断，等它们完成并照常记录结果
+        for future in pending:
+            if not future.cancel():
+                yield from future.result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def format_report(results, total_elapsed=None, verbose=False):
+    """生成逐文件结果表格，verbose 时列出被清空的按键和全部改动"""
+    labels = {PATCHED: "OK", SKIPPED: "跳过", FAILED: "失败", CANCELLED: "取消"}
+    lines = [f"{'状态':<4} {'保留':>6} {'删除':>6} {'新增':>6} {'耗时(ms)':>8}  文件"]
+    for r in results:
+        status = labels[r["status"]]
+        lines.append(f"{status:<6} {r['kept']:>8} {r['removed']:>8} {r['inserted']:>8} "
+                     f"{r['elapsed'] * 1000:>10.1f}  {r['path']}")
+        if r["drift"]:
+            lines.append("       └ 上次处理后文件已被改写，已重新处理")
+        if verbose and r["removed_keys"]:
+            lines.append(f"       └ 已清空：{' '.join(r['removed_keys'])}")
+        if r["conflicts"]:
+            conflicts = r["conflicts"] if verbose else r["conflicts"][:5]
+            more = "" if len(conflicts) == len(r["conflicts"]) else f" 等 {len(r['conflicts'])} 处"
+            lines.append(f"       └ 按键冲突：{'，'.join(conflicts)}{more}")
+        if r["overlaps"]:
+            overlaps = r["overlaps"] if verbose else r["overlaps"][:5]
+            more = "" if len(overlaps) == len(r["overlaps"]) else f" 等 {len(r['overlaps'])} 处"
+            lines.append(f"       └ 图标重叠：{'，'.join(overlaps)}{more}")
+        if r["diff"] is not None:
+            lines.append(f"       └ 预览：{diff.summary(r['diff'])}")
+            if not diff.is_empty(r["diff"]):
+                lines.append(diff.format_diff(r["diff"], limit=None if verbose else 5, indent="         "))
+        if r["error"]:
+            lines.append(f"       └ {r['error']}")
+    counts = {status: 0 for status in labels}
+    for r in results:
+        counts[r["status"]] += 1
+    summary = (f"共 {len(results)} 个文件：成功 {counts[PATCHED]}，跳过 {counts[SKIPPED]}，"
+               f"失败 {counts[FAILED]}")
+    if counts[CANCELLED]:
+        summary += f"，取消 {counts[CANCELLED]}"
+    if total_elapsed is not None:
+        summary += f"，总耗时 {total_elapsed:.2f} s"
+    if any(r["diff"] is not None for r in results):
+        summary += "（预览，未写入任何文件）"
+    lines.append(summary)
+    return "\n".join(lines)
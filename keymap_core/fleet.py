@@ -0,0 +1,210 @@
+"""多实例批量处理：按配置文件一次处理多个模拟器实例的点位文件夹
+
+配置文件（JSON）列出每个实例的点位文件夹，以及各自使用的模板和技能区域：
+
+    {
+        "defaults": {"template": "templates/ba.json", "on_conflict": "template", "format": "pretty"},
+        "instances": [
+            {"name": "MuMu-0", "folder": "D:/MuMu/vms/MuMuPlayer-0/configs/keymapConfig"},
+            {"name": "MuMu-1", "folder": "D:/MuMu/vms/MuMuPlayer-1/configs/keymapConfig",
+             "template": "templates/other.json", "region": "regions/16x10.json"},
+            {"name": "MuMu-2", "folder": "...", "region": {"include": [{"type": "rect", "x_min": 0.6}]}}
+        ]
+    }
+
+实例中没有写的项使用 defaults 中的值，都没有时按文件名规则（naming）使用各游戏的默认模板和区域。可用的项：
+template（模板文件）、region（技能区域文件或直接写区域描述）、on_conflict、format、relocate_icons。
+相对路径相对于配置文件所在的文件夹。不同实例不能使用同一个点位文件夹（按真实路径比较，
+写法不同、经过符号链接也算同一个），否则同一批文件会被两个进程同时处理。
+
+所有实例的文件共用一个进程池（进程数不超过 workers），同一个模板只读取一次；
+一个实例的文件夹或模板有问题时只跳过该实例，其余实例照常处理。整次处理记为一次快照操作。
+"""
+import os
+import time
+
+from . import engine, jsonio, merge
+
+OPTION_KEYS = ("template", "region", "on_conflict", "format", "relocate_icons")
+
+
+class InvalidProfileError(ValueError):
+    """实例配置文件格式错误"""
+
+
+def _resolve(base, value):
+    if isinstance(value, str):
+        return os.path.normpath(os.path.join(base, os.path.expanduser(value)))
+    return value
+
+
+def folder_key(folder):
+    """比较点位文件夹是否相同时用的路径：展开符号链接，Windows 下不区分大小写"""
+    return os.path.normcase(os.path.realpath(folder))
+
+
+def check_folders(instances):
+    """两个实例使用同一个点位文件夹时抛出 InvalidProfileError"""
+    seen = {}
+    for instance in instances:
+        key = folder_key(instance["folder"])
+        if key in seen:
+            raise InvalidProfileError(f"{seen[key]} 与 {instance['name']} 使用同一个点位文件夹：{instance['folder']}")
+        seen[key] = instance["name"]
+
+
+def load_profile(path):
+    """读取实例配置文件，返回实例列表 [{"name", "folder", "template", "region", ...}]，路径均已展开"""
+    try:
+        data = jsonio.load_file(path)
+    except (OSError, ValueError) as e:
+        raise InvalidProfileError(f"无法读取实例配置文件：{e}") from None
+    if not isinstance(data, dict) or not isinstance(data.get("instances"), list):
+        raise InvalidProfileError("实例配置文件中缺少 instances 列表")
+    base = os.path.dirname(os.path.abspath(path))
+    defaults = data.get("defaults") or {}
+    if not isinstance(defaults, dict):
+        raise InvalidProfileError("defaults 必须是对象")
+    instances = []
+    names = set()
+    for n, item in enumerate(data["instances"], 1):
+        if not isinstance(item, dict) or not isinstance(item.get("folder"), str):
+            raise InvalidProfileError(f"第 {n} 个实例缺少 folder")
+        name = str(item.get("name") or os.path.basename(os.path.normpath(item["folder"])) or n)
+        if name in names:
+            raise InvalidProfileError(f"实例名称重复：{name}")
+        names.add(name)
+        instance = {"name": name, "folder": _resolve(base, item["folder"])}
+        for key in OPTION_KEYS:
+            value = item.get(key, defaults.get(key))
+            instance[key] = _resolve(base, value) if key in ("template", "region") else value
+        if instance["on_conflict"] is not None and instance["on_conflict"] not in merge.POLICIES:
+            raise InvalidProfileError(f"{name}：未知的冲突处理策略 {instance['on_conflict']}")
+        if instance["format"] is not None and instance["format"] not in jsonio.OUTPUT_FORMATS:
+            raise InvalidProfileError(f"{name}：未知的保存格式 {instance['format']}")
+        instances.append(instance)
+    check_folders(instances)
+    return instances
+
+
+def _summary(instance):
+    return {
+        "name": instance["name"],
+        "folder": instance["folder"],
+        "template": instance["template"],
+        "files": 0,
+        "patched": 0,
+        "skipped": 0,
+        "failed": 0,
+        "cancelled": 0,
+        "work": 0.0,       # 各文件处理耗时之和（秒）
+        "finished": 0.0,   # 从开始到该实例最后一个文件处理完的时间（秒）
+        "error": "",
+        "results": [],
+    }
+
+
+def run_profile(instances, workers=None, stream=None, use_manifest=True, force=False, snapshot=True,
+                dry_run=False, on_result=None, cancel_event=None):
+    """处理全部实例，返回汇总 {"instances": [每个实例的汇总], "elapsed": 总耗时秒数}
+
+    实例汇总中 results 为该实例逐个文件的结果（与 engine.patch_files 相同）；
+    实例本身无法处理（文件夹不存在、模板无效等）时 error 非空，不处理其中的文件。
+    其余参数与 engine.patch_files 相同，workers 为全部实例共用的进程数上限。
+    """
+    start = time.perf_counter()
+    cache = engine.TemplateCache()
+    summaries = []
+    groups = []   # (实例汇总, 该实例的文件列表, 其中这一组的序号, 参数)
+    for instance in instances:
+        summary = _summary(instance)
+        summaries.append(summary)
+        if not os.path.isdir(instance["folder"]):
+            summary["error"] = f"点位文件夹不存在：{instance['folder']}"
+            continue
+        paths = engine.collect_targets([instance["folder"]])
+        if not paths:
+            summary["error"] = f"文件夹中没有点位文件：{instance['folder']}"
+            continue
+        try:
+            new_keymaps, skill_area = cache.template(instance["template"])
+            region = cache.region(instance["region"])
+            planned = engine.plan(paths, new_keymaps, region or skill_area, cache, stream=stream,
+                                  use_manifest=use_manifest, force=force, policy=instance["on_conflict"],
+                                  relocate_icons=bool(instance["relocate_icons"]),
+                                  output_format=instance["format"], dry_run=dry_run)
+        except (OSError, ValueError) as e:
+            summary["error"] = f"读取模板或技能区域失败：{e}"
+            continue
+        summary["files"] = len(paths)
+        summary["results"] = [None] * len(paths)
+        for indices, options in planned:
+            if isinstance(options, str):
+                for i in indices:
+                    summary["results"][i] = engine.error_result(paths[i], options)
+            else:
+                groups.append((summary, paths, indices, options))
+
+    def record(result):
+        summary = groups[result["group"]][0]
+        summary["finished"] = time.perf_counter() - start
+        if on_result:
+            on_result(summary["name"], result)
+
+    if groups:
+        files = sum(s["files"] for s in summaries)
+        label = f"批量处理 {len({id(summary) for summary, _, _, _ in groups})} 个实例（{files} 个文件）"
+        grouped = engine.patch_groups([([paths[i] for i in indices], options) for _, paths, indices, options in groups],
+                                      workers, record, cancel_event, snapshot, label)
+        for (summary, _, indices, _), group_results in zip(groups, grouped):
+            for i, result in zip(indices, group_results):
+                summary["results"][i] = result
+    for summary in summaries:
+        for r in summary["results"]:
+            summary[r["status"]] += 1
+            summary["work"] += r["elapsed"]
+    return {"instances": summaries, "elapsed": time.perf_counter() - start}
+
+
+def results(report):
+    """全部实例的逐文件结果"""
+    return [r for summary in report["instances"] for r in summary["results"]]
+
+
+def format_report(report, verbose=False):
+    """按实例汇总的结果表格，verbose 时再列出每个实例的逐文件结果"""
+    lines = [f"{'状态':<4} {'文件':>5} {'成功':>5} {'跳过':>5} {'失败':>5} {'取消':>5} "
+             f"{'处理(s)':>8} {'完成(s)':>8}  实例"]
+    for s in report["instances"]:
+        if s["error"]:
+            status = "错误"
+        elif s["failed"]:
+            status = "部分失败"
+        elif s["cancelled"]:
+            status = "取消"
+        else:
+            status = "OK"
+        lines.append(f"{status:<6} {s['files']:>7} {s['patched']:>7} {s['skipped']:>7} {s['failed']:>7} "
+                     f"{s['cancelled']:>7} {s['work']:>9.2f} {s['finished']:>9.2f}  {s['name']}")
+        if s["error"]:
+            lines.append(f"       └ {s['error']}")
+        if verbose and s["results"]:
+            lines.append("\n".join("       " + line for line in
+                                   engine.format_report(s["results"], verbose=True).splitlines()))
+        else:
+            for r in s["results"]:
+                if r["error"]:
+                    lines.append(f"       └ {os.path.basename(r['path'])}：{r['error']}")
+    summaries = report["instances"]
+    bad = sum(1 for s in summaries if s["error"] or s["failed"])
+    text = (f"共 {len(summaries)} 个实例（{bad} 个有错误）、{sum(s['files'] for s in summaries)} 个文件："
+            f"成功 {sum(s['patched'] for s in summaries)}，跳过 {sum(s['skipped'] for s in summaries)}，"
+            f"失败 {sum(s['failed'] for s in summaries)}")
+    cancelled = sum(s["cancelled"] for s in summaries)
+    if cancelled:
+        text += f"，取消 {cancelled}"
+    text += f"，总耗时 {report['elapsed']:.2f} s"
+    if any(r["diff"] is not None for r in results(report)):
+        text += "（预览，未写入任何文件）"
+    lines.append(text)
+    return "\n".join(lines)
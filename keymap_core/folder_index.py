@@ -0,0 +1,110 @@
+"""点位文件夹索引：记住每个文件的修改时间和大小，重新扫描时只报告增、删、改的文件
+
+启动时可以先用上次的索引立即填充列表，再增量扫描修正。图形界面把最近几个文件夹的索引保存在设置文件中
+（settings.Settings），无界面时用 IndexStore 保存到 INDEX_PATH。
+图形界面由 QFileSystemWatcher 触发扫描，无界面时使用 PollingWatcher 定时轮询。
+"""
+import json
+import os
+import threading
+
+from . import jsonio, trace
+from .naming import is_keymap_file
+from .paths import INDEX_PATH
+
+
+class FolderIndex:
+    """单个点位文件夹的索引：文件名 → (mtime_ns, size)"""
+
+    def __init__(self, folder, files=None, dir_mtime_ns=None):
+        self.folder = folder
+        self.files = dict(files or {})
+        self.dir_mtime_ns = dir_mtime_ns
+
+    def names(self):
+        return sorted(self.files)
+
+    def scan(self, quick=False):
+        """重新扫描文件夹，返回 (新增, 删除, 修改) 三个文件名列表
+
+        quick 为 True 时若文件夹本身的修改时间没变（没有增删文件）则直接返回空结果，
+        不会发现已有文件的内容修改。
+        """
+        try:
+            dir_mtime_ns = os.stat(self.folder).st_mtime_ns
+        except OSError:
+            dir_mtime_ns = None
+        if quick and dir_mtime_ns is not None and dir_mtime_ns == self.dir_mtime_ns:
+            return [], [], []
+        current = {}
+        if dir_mtime_ns is not None:
+            with trace.span("listdir", folder=self.folder), os.scandir(self.folder) as it:
+                for entry in it:
+                    if not is_keymap_file(entry.name):
+                        continue
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    if entry.is_file():
+                        current[entry.name] = (st.st_mtime_ns, st.st_size)
+        old = self.files
+        added = sorted(name for name in current if name not in old)
+        removed = sorted(name for name in old if name not in current)
+        changed = sorted(name for name, sig in current.items() if name in old and tuple(old[name]) != sig)
+        self.files = current
+        self.dir_mtime_ns = dir_mtime_ns
+        return added, removed, changed
+
+    def to_dict(self):
+        return {"dir_mtime_ns": self.dir_mtime_ns, "files": {k: list(v) for k, v in self.files.items()}}
+
+    @classmethod
+    def from_dict(cls, folder, data):
+        files = {k: tuple(v) for k, v in data.get("files", {}).items()}
+        return cls(folder, files, data.get("dir_mtime_ns"))
+
+
+class IndexStore:
+    """所有文件夹索引的持久化存储"""
+
+    def __init__(self, path=INDEX_PATH):
+        self.path = path
+        self.folders = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.folders = json.load(f).get("folders", {})
+        except (OSError, ValueError):
+            pass
+
+    def get(self, folder):
+        """取出某个文件夹的索引，没有记录时返回空索引"""
+        return FolderIndex.from_dict(folder, self.folders.get(os.path.normcase(folder), {}))
+
+    def put(self, index):
+        self.folders[os.path.normcase(index.folder)] = index.to_dict()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with jsonio.atomic_write(self.path) as f:
+            json.dump({"folders": self.folders}, f, ensure_ascii=False)
+
+
+class PollingWatcher(threading.Thread):
+    """无界面时的轮询监视：定时扫描索引，有变化时调用 callback(index, added, removed, changed)"""
+
+    def __init__(self, index, callback, interval=2.0):
+        super().__init__(daemon=True)
+        self.index = index
+        self.callback = callback
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            added, removed, changed = self.index.scan()
+            if added or removed or changed:
+                self.callback(self.index, added, removed, changed)
+
+    def stop(self):
+        self._stop_event.set()
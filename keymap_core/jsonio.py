@@ -0,0 +1,345 @@
+"""点位文件读写：JSON 序列化、原子写入，以及逐条读写 keymaps 数组的流式模式
+
+序列化优先使用 orjson（安装了才用，速度快数倍），否则使用标准库；设置环境变量 KEYMAP_JSON=json
+可以强制使用标准库。两者的输出只有很小或很大的浮点数写法不同（0.0000535… / 5.35…e-05），
+读取结果完全相同。
+
+输出格式（OUTPUT_FORMATS）：
+    pretty   与 json.dump(data, ensure_ascii=False, indent=2) 相同（默认）
+    compact  不含空白，文件最小
+    minimal  只改写 keymaps 数组所在的那一段，其余字节（其它字段、缩进、换行符）原样保留，
+             数组沿用原来的缩进或紧凑风格，同步盘和 diff 工具只会看到真正改动的点位
+
+流式模式下只有当前这一条点位和读缓冲区常驻内存，其它顶层字段原样读出后按 pretty / compact 写回。
+"""
+import contextlib
+import json
+import os
+import re
+import stat
+import tempfile
+
+from . import optional, trace
+
+READ_CHUNK = 64 * 1024
+BACKEND_ENV = "KEYMAP_JSON"
+
+# 输出格式
+PRETTY = "pretty"
+COMPACT = "compact"
+MINIMAL = "minimal"
+OUTPUT_FORMATS = (PRETTY, COMPACT, MINIMAL)
+FORMAT_LABELS = {
+    PRETTY: "标准缩进（默认）",
+    COMPACT: "紧凑（文件最小）",
+    MINIMAL: "只改写 keymaps（其余内容保持原样）",
+}
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = re.compile(r"[ \t\r\n]*")
+
+
+_fast_module = None
+_fast_checked = False
+
+
+def _fast():
+    """orjson 模块；未安装或被 KEYMAP_JSON=json 禁用时返回 None（第一次调用时确定）"""
+    global _fast_module, _fast_checked
+    if not _fast_checked:
+        if os.environ.get(BACKEND_ENV, "").lower() != "json":
+            _fast_module = optional.orjson()
+        _fast_checked = True
+    return _fast_module
+
+
+def backend():
+    """当前使用的 JSON 库名称"""
+    return "orjson" if _fast() else "json"
+
+
+def loads(data):
+    """解析 str 或 UTF-8 bytes"""
+    fast = _fast()
+    if fast:
+        return fast.loads(data)
+    if isinstance(data, bytes):
+        data = data.decode("utf-8")
+    return json.loads(data)
+
+
+def dumps(value, compact=False):
+    """序列化为 str：默认与 json.dumps(ensure_ascii=False, indent=2) 相同，compact 时不含空白"""
+    fast = _fast()
+    if fast:
+        try:
+            return fast.dumps(value, option=0 if compact else fast.OPT_INDENT_2).decode("utf-8")
+        except TypeError:
+            pass  # 超出 64 位的整数等 orjson 不支持的值，交给标准库
+    if compact:
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+    return json.dumps(value, ensure_ascii=False, indent=2)
+
+
+def canonical(value):
+    """键排序的紧凑 JSON（bytes），用于比较和计算哈希"""
+    fast = _fast()
+    if fast:
+        try:
+            return fast.dumps(value, option=fast.OPT_SORT_KEYS)
+        except TypeError:
+            pass
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def load_file(path):
+    with open(path, "rb") as f:
+        return loads(f.read())
+
+
+def member_spans(text):
+    """解析顶层对象，返回 (数据, {字段名: (值的起始位置, 结束位置)})"""
+    match = _WHITESPACE.match(text)
+    pos = match.end()
+    if text[pos:pos + 1] != "{":
+        raise ValueError("JSON 格式错误：顶层不是对象")
+    data = {}
+    spans = {}
+    pos = _WHITESPACE.match(text, pos + 1).end()
+    if text[pos:pos + 1] == "}":
+        return data, spans
+    while True:
+        key, pos = _decoder.raw_decode(text, pos)
+        pos = _WHITESPACE.match(text, pos).end()
+        if text[pos:pos + 1] != ":":
+            raise ValueError(f"JSON 格式错误：第 {pos} 个字符处期望 ':'")
+        start = _WHITESPACE.match(text, pos + 1).end()
+        data[key], end = _decoder.raw_decode(text, start)
+        spans[key] = (start, end)
+        pos = _WHITESPACE.match(text, end).end()
+        ch = text[pos:pos + 1]
+        if ch == ",":
+            pos = _WHITESPACE.match(text, pos + 1).end()
+            continue
+        if ch != "}":
+            raise ValueError(f"JSON 格式错误：第 {pos} 个字符处期望 ',' 或 '}}'")
+        return data, spans
+
+
+def splice(text, spans, key, value):
+    """把 text 中 key 字段的值替换为 value，其余字符原样保留
+
+    原来的值跨多行时按 indent=2 写出，并按该字段所在行的缩进对齐；原来在一行内时紧凑写出
+    （原来是空数组时看整个文件有没有换行）。
+    """
+    start, end = spans[key]
+    if end - start <= 2:
+        compact = "\n" not in text
+    else:
+        compact = text.find("\n", start, end) < 0
+    new = dumps(value, compact)
+    if not compact:
+        line_start = text.rfind("\n", 0, start) + 1
+        line = text[line_start:start]
+        indent = line[:len(line) - len(line.lstrip(" \t"))]
+        newline = "\r\n" if text.find("\r\n", start, end) >= 0 else "\n"
+        new = new.replace("\n", newline + indent)
+    return text[:start] + new + text[end:]
+
+
+def render(data, output_format=PRETTY, original=None, spans=None):
+    """按输出格式生成文件内容；minimal 需要原文 original 及 member_spans 得到的 spans，
+    原文中没有 keymaps 字段时按 pretty 写出"""
+    if output_format == MINIMAL and original is not None and "keymaps" in spans:
+        return splice(original, spans, "keymaps", data["keymaps"])
+    return dumps(data, compact=output_format == COMPACT)
+
+
+_umask = None
+
+
+def _target_mode(path):
+    """替换后文件应有的权限：沿用原文件的权限；原文件不存在时与 open() 新建的文件相同（0666 去掉 umask），
+    而不是 mkstemp 的 0600"""
+    global _umask
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        pass
+    if _umask is None:
+        # 只能通过设置来读取 umask，读完立即恢复；只在第一次新建文件时做一次
+        _umask = os.umask(0o022)
+        os.umask(_umask)
+    return 0o666 & ~_umask
+
+
+@contextlib.contextmanager
+def atomic_write(path, encoding='utf-8', mode='w', newline=None):
+    """先写同目录下的临时文件并 fsync，成功后再整体替换目标文件；中途出错目标文件保持不变
+
+    mode 为 'wb' 时写入 bytes；newline='' 时不转换换行符（与 open() 相同）。
+    """
+    path = os.path.abspath(path)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp",
+                                    dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, mode, encoding=None if 'b' in mode else encoding, newline=newline) as f:
+            yield f
+            with trace.span("fsync"):
+                f.flush()
+                os.fsync(f.fileno())
+            if trace.enabled():
+                trace.count("bytes.written", os.fstat(f.fileno()).st_size)
+        with contextlib.suppress(OSError):
+            os.chmod(tmp_path, _target_mode(path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+
+class _Scanner:
+    """带缓冲区的增量 JSON 扫描器"""
+
+    def __init__(self, f, chunk_size=None):
+        self.f = f
+        self.chunk_size = chunk_size or READ_CHUNK
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size=None):
+        if self.eof:
+            return False
+        data = self.f.read(size or self.chunk_size)
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """跳过空白并返回下一个字符，文件结束时返回空串"""
+        while True:
+            buf, pos = self.buf, self.pos
+            while pos < len(buf) and buf[pos] in " \t\r\n":
+                pos += 1
+            self.pos = pos
+            if pos < len(buf) or not self._fill():
+                return buf[pos:pos + 1]
+
+    def expect(self, ch):
+        if self.peek() != ch:
+            raise ValueError(f"JSON 格式错误：期望 {ch!r}，实际为 {self.peek()!r}")
+        self.pos += 1
+
+    def value(self):
+        """解码下一个完整的 JSON 值"""
+        self.peek()
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill(size):
+                    raise
+                size *= 2
+                continue
+            # 数字恰好停在缓冲区末尾时可能被截断，需要读更多内容确认
+            if end == len(self.buf) and not self.eof and self._fill(size):
+                continue
+            self.pos = end
+            return value
+
+
+def iter_document(f, stream_key="keymaps"):
+    """逐个产出顶层字段 (key, value, streamed)
+
+    stream_key 对应的数组不会整体读入，value 是逐条产出数组元素的生成器，
+    必须先把它迭代完，再继续迭代后面的字段。
+    """
+    scanner = _Scanner(f)
+    scanner.expect("{")
+    if scanner.peek() == "}":
+        return
+    while True:
+        key = scanner.value()
+        scanner.expect(":")
+        if key == stream_key and scanner.peek() == "[":
+            yield key, _iter_array(scanner), True
+        else:
+            yield key, scanner.value(), False
+        if scanner.peek() == ",":
+            scanner.pos += 1
+            continue
+        scanner.expect("}")
+        return
+
+
+def _iter_array(scanner):
+    scanner.expect("[")
+    if scanner.peek() == "]":
+        scanner.pos += 1
+        return
+    while True:
+        yield scanner.value()
+        if scanner.peek() == ",":
+            scanner.pos += 1
+            continue
+        scanner.expect("]")
+        return
+
+
+def _dumps(value, level):
+    return dumps(value).replace("\n", "\n" + "  " * level)
+
+
+class StreamWriter:
+    """按 json.dump(indent=2) 的格式（compact 时不含空白）逐个写出顶层字段和数组元素"""
+
+    def __init__(self, f, compact=False):
+        self.f = f
+        self.compact = compact
+        self.members = 0
+        self.items = 0
+
+    def begin(self):
+        self.f.write("{")
+
+    def _key(self, key):
+        sep = "," if self.members else ""
+        if self.compact:
+            self.f.write(sep + json.dumps(key, ensure_ascii=False) + ":")
+        else:
+            self.f.write(sep + "\n  " + json.dumps(key, ensure_ascii=False) + ": ")
+        self.members += 1
+
+    def member(self, key, value):
+        self._key(key)
+        self.f.write(dumps(value, True) if self.compact else _dumps(value, 1))
+
+    def begin_array(self, key):
+        self._key(key)
+        self.f.write("[")
+        self.items = 0
+
+    def item(self, value):
+        sep = "," if self.items else ""
+        if self.compact:
+            self.f.write(sep + dumps(value, True))
+        else:
+            self.f.write(sep + "\n    " + _dumps(value, 2))
+        self.items += 1
+
+    def raw_item(self, text):
+        """写出已经是紧凑 JSON 的数组元素（只用于 compact）"""
+        self.f.write("," + text if self.items else text)
+        self.items += 1
+
+    def end_array(self):
+        self.f.write("\n  ]" if self.items and not self.compact else "]")
+
+    def end(self):
+        self.f.write("\n}" if self.members and not self.compact else "}")
@@ -0,0 +1,187 @@
+"""图标重叠检查：插入的模板图标是否压在保留下来的原有图标上
+
+图标位置取 icon.rel_position（没有时取 rel_work_position），半径按
+BASE_ICON_RADIUS * editor_icon_scale * radius_correction 估算（系数不是数值或没有 icon 字典时按 1 计，
+坐标不是数值时当作没有图标，与 columnar 按列计算的结果相同）。相对坐标的 x、y 分别以屏幕宽、高为单位，
+先按宽高比换算成同一尺度再计算距离。
+
+所有图标放进均匀网格（格子边长为最大直径），每个图标只需检查相邻 3×3 个格子，整体接近 O(n)。
+relocate 为 True 时，把与其他图标重叠的模板图标挪到最近的空位：只改显示用的 icon.rel_position，
+不改 rel_work_position 和宏中的坐标，因此按键的实际效果不变。
+模板内部的图标本来就可能叠放（例如同一技能的点击和瞄准），只检查模板图标与原有图标之间的重叠。
+"""
+import math
+
+from .columnar import HAS_ICON, HAS_WORK, ODD_ICON
+from .merge import key_text
+
+# 图标半径的估算值（以屏幕高度为 1）
+BASE_ICON_RADIUS = 0.025
+# 默认屏幕宽高比
+DEFAULT_ASPECT = 16 / 9
+# 寻找空位时向外搜索的圈数，每圈间隔半个半径
+MAX_RINGS = 40
+# 网格格子的最小边长（图标半径都为 0 时也不会除以 0）
+MIN_CELL = 0.01
+
+
+def _icon(km):
+    icon = km.get("icon")
+    return icon if isinstance(icon, dict) else {}
+
+
+def _factor(value):
+    return value if isinstance(value, (int, float)) else 1
+
+
+def icon_position(km):
+    """图标显示位置 (rel_x, rel_y)，没有位置信息或坐标不是数值时返回 None"""
+    pos = _icon(km).get("rel_position") or km.get("rel_work_position")
+    if not isinstance(pos, dict) or "rel_x" not in pos or "rel_y" not in pos:
+        return None
+    x, y = pos["rel_x"], pos["rel_y"]
+    if not isinstance(x, (int, float)) or not isinstance(y, (int, float)):
+        return None
+    return x, y
+
+
+def icon_radius(km):
+    return BASE_ICON_RADIUS * (_factor(km.get("editor_icon_scale", 1)) * _factor(_icon(km).get("radius_correction", 1)))
+
+
+class SpatialHash:
+    """均匀网格哈希：(格子 x, 格子 y) → 图标序号列表"""
+
+    def __init__(self, cell):
+        self.cell = cell
+        self.cells = {}
+
+    def _key(self, x, y):
+        return int(x // self.cell), int(y // self.cell)
+
+    def insert(self, index, x, y):
+        self.cells.setdefault(self._key(x, y), []).append(index)
+
+    def nearby(self, x, y):
+        """与 (x, y) 相邻的 3×3 个格子中的全部图标序号"""
+        cx, cy = self._key(x, y)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                yield from self.cells.get((cx + dx, cy + dy), ())
+
+
+class Layout:
+    """收集保留下来的图标，再依次放入模板图标并检查重叠"""
+
+    def __init__(self, aspect=DEFAULT_ASPECT, relocate=False):
+        self.aspect = aspect
+        self.relocate = relocate
+        self.icons = []  # (x, y, 半径, 按键名)，x 已乘以宽高比
+
+    def add(self, km):
+        pos = icon_position(km)
+        if pos is not None:
+            self.icons.append((pos[0] * self.aspect, pos[1], icon_radius(km), key_text(km)))
+
+    def add_table(self, table):
+        """加入 columnar.KeymapTable 中的全部图标（与逐行 add() 相同），直接使用坐标和半径系数列"""
+        aspect = self.aspect
+        for i, flags in enumerate(table.flags):
+            if flags & ODD_ICON:
+                self.add(table.row(i))
+            elif flags & HAS_ICON:
+                self.icons.append((table.icon_x[i] * aspect, table.icon_y[i],
+                                   BASE_ICON_RADIUS * table.scale[i], table.key_text(i)))
+            elif flags & HAS_WORK:
+                self.icons.append((table.work_x[i] * aspect, table.work_y[i],
+                                   BASE_ICON_RADIUS * table.scale[i], table.key_text(i)))
+
+    def place(self, new_keymaps):
+        """放入模板点位，返回 (点位列表（可能含挪动后的副本）, 重叠描述列表)"""
+        new_icons = []
+        for km in new_keymaps:
+            pos = icon_position(km)
+            new_icons.append(None if pos is None else (pos[0] * self.aspect, pos[1], icon_radius(km)))
+        radii = [icon[2] for icon in self.icons] + [icon[2] for icon in new_icons if icon]
+        if not radii:
+            return list(new_keymaps), []
+        grid = SpatialHash(max(2 * max(radii), MIN_CELL))
+        icons = list(self.icons)
+        for i, icon in enumerate(icons):
+            grid.insert(i, icon[0], icon[1])
+        placed = []
+        overlaps = []
+        for km, icon in zip(new_keymaps, new_icons):
+            if icon is None:
+                placed.append(km)
+                continue
+            x, y, r = icon
+            hit = self._hit(grid, icons, x, y, r, len(self.icons))
+            if hit is not None:
+                if self.relocate:
+                    spot = self._free_spot(grid, icons, x, y, r)
+                    if spot is not None:
+                        x, y = spot
+                        km = _moved(km, x / self.aspect, y)
+                        overlaps.append(f"{key_text(km)} 与 {icons[hit][3]} 重叠，已挪到 "
+                                        f"({x / self.aspect:.3f}, {y:.3f})")
+                    else:
+                        overlaps.append(f"{key_text(km)} 与 {icons[hit][3]} 重叠，附近没有空位")
+                else:
+                    overlaps.append(f"{key_text(km)} 与 {icons[hit][3]} 重叠")
+            grid.insert(len(icons), x, y)
+            icons.append((x, y, r, key_text(km)))
+            placed.append(km)
+        return placed, overlaps
+
+    @staticmethod
+    def _hit(grid, icons, x, y, r, limit=None):
+        """返回第一个与圆 (x, y, r) 重叠的图标序号，limit 限定只检查序号小于它的图标"""
+        for j in grid.nearby(x, y):
+            if limit is not None and j >= limit:
+                continue
+            ox, oy, o_r = icons[j][:3]
+            if (ox - x) ** 2 + (oy - y) ** 2 < (o_r + r) ** 2:
+                return j
+        return None
+
+    def _free_spot(self, grid, icons, x, y, r):
+        """由近到远逐圈寻找不与任何图标重叠、且不超出屏幕的位置"""
+        step = r / 2
+        for ring in range(1, MAX_RINGS + 1):
+            dist = ring * step
+            count = 8 * ring
+            for k in range(count):
+                angle = 2 * math.pi * k / count
+                nx = x + dist * math.cos(angle)
+                ny = y + dist * math.sin(angle)
+                if not (r <= nx <= self.aspect - r and r <= ny <= 1 - r):
+                    continue
+                if self._hit(grid, icons, nx, ny, r) is None:
+                    return nx, ny
+        return None
+
+
+def _moved(km, rel_x, rel_y):
+    icon = dict(_icon(km), rel_position={"rel_x": rel_x, "rel_y": rel_y})
+    return dict(km, icon=icon)
+
+
+def find_overlaps(keymaps, aspect=DEFAULT_ASPECT):
+    """找出一组点位中全部互相重叠的图标，返回 [(序号, 序号)]"""
+    icons = []
+    for i, km in enumerate(keymaps):
+        pos = icon_position(km)
+        if pos is not None:
+            icons.append((i, pos[0] * aspect, pos[1], icon_radius(km)))
+    if not icons:
+        return []
+    grid = SpatialHash(max(2 * max(icon[3] for icon in icons), MIN_CELL))
+    pairs = []
+    for k, (i, x, y, r) in enumerate(icons):
+        for m in grid.nearby(x, y):
+            j, ox, oy, o_r = icons[m]
+            if (ox - x) ** 2 + (oy - y) ** 2 < (o_r + r) ** 2:
+                pairs.append((j, i))
+        grid.insert(k, x, y)
+    return pairs
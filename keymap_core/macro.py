@@ -0,0 +1,294 @@
+"""宏指令解析：把 press_actions / release_actions 中的字符串编译成紧凑的中间表示
+
+    "click_rel:(0.972586,0.081568)"                      → Action(click_rel, coords=[0.972586, 0.081568])
+    "sleep:50"                                           → Action(sleep, arg=50)
+    "start_loop:until_release"                           → Action(start_loop, arg="until_release")
+    "curve_rel:(0.846246,0.896186);(0.851013,0.843220);mouse"
+                                                         → Action(curve_rel, arg="mouse", coords=[4 个数])
+
+同一字符串只解析一次（带缓存），出错时抛出 MacroSyntaxError，给出出错字符的位置。
+format_action() 可以把中间表示还原成字符串，parse_action(format_action(a)) == a。
+
+OPCODES 之外的指令（模拟器新增的、自定义模板里的）不算错误：编译成 RAW 指令，原样保留、原样写回，
+不参与坐标换算和耗时估算，unknown_opcodes() 列出它们供提示；strict=True 时才当作错误（check --strict）。
+"""
+import functools
+from array import array
+
+# 参数格式
+ARG_NONE = "none"      # 无参数，例如 stop_loop
+ARG_INT = "int"        # 整数，例如 sleep:50
+ARG_POINT = "point"    # 单个坐标，例如 click_rel:(x,y)
+ARG_POINTS = "points"  # 多个坐标，用 ; 分隔，例如 curve_rel:(x,y);(x,y)
+
+# 指令名 → (参数格式, 可以代替参数（或跟在坐标后面）的关键字)
+OPCODES = {
+    "click_rel": (ARG_POINT, ()),
+    "press_rel": (ARG_POINT, ("mouse",)),
+    "release_rel": (ARG_POINT, ("mouse",)),
+    "sleep": (ARG_INT, ()),
+    "start_loop": (ARG_INT, ("until_release",)),
+    "stop_loop": (ARG_NONE, ()),
+    "curve_first_point_sleep_time": (ARG_INT, ("until_release_cmd",)),
+    "curve_last_point_sleep_time": (ARG_INT, ("until_release_cmd",)),
+    "curve_rel": (ARG_POINTS, ("mouse",)),
+    "curve_release": (ARG_NONE, ()),
+}
+OPCODE_NAMES = list(OPCODES)
+_OPCODE_INDEX = {name: i for i, name in enumerate(OPCODE_NAMES)}
+# 不认识的指令：arg 为完整的原始字符串
+RAW = len(OPCODE_NAMES)
+
+ACTION_FIELDS = ("press_actions", "release_actions")
+
+
+class MacroSyntaxError(ValueError):
+    """宏指令格式错误，column 为出错字符在指令字符串中的位置（从 0 开始）"""
+
+    def __init__(self, message, text="", column=0):
+        super().__init__(message)
+        self.message = message
+        self.text = text
+        self.column = column
+        # 以下位置信息由 compile_actions / validate_keymaps 补充
+        self.keymap = None
+        self.field = None
+        self.index = None
+
+    def location(self):
+        parts = []
+        if self.keymap is not None:
+            parts.append(f"第 {self.keymap + 1} 个点位")
+        if self.field is not None:
+            parts.append(self.field)
+        if self.index is not None:
+            parts.append(f"第 {self.index + 1} 条")
+        parts.append(f"第 {self.column + 1} 个字符")
+        return " ".join(parts)
+
+    def __str__(self):
+        return f"{self.location()}：{self.message}\n    {self.text}\n    {' ' * self.column}^"
+
+
+class Action:
+    """一条编译后的宏指令；op 为 OPCODE_NAMES 中的序号，coords 为 x0, y0, x1, y1 … 的紧凑数组
+
+    Action 对象会被缓存复用，不要修改。
+    """
+    __slots__ = ("op", "arg", "coords")
+
+    def __init__(self, op, arg=None, coords=()):
+        self.op = op
+        self.arg = arg
+        self.coords = array("d", coords)
+
+    @property
+    def name(self):
+        if self.op == RAW:
+            return self.arg.partition(":")[0]
+        return OPCODE_NAMES[self.op]
+
+    @property
+    def points(self):
+        c = self.coords
+        return [(c[i], c[i + 1]) for i in range(0, len(c), 2)]
+
+    def __eq__(self, other):
+        return (isinstance(other, Action) and self.op == other.op
+                and self.arg == other.arg and self.coords == other.coords)
+
+    def __hash__(self):
+        return hash((self.op, self.arg, tuple(self.coords)))
+
+    def __repr__(self):
+        return f"Action({self.name!r}, arg={self.arg!r}, coords={list(self.coords)!r})"
+
+
+class _Cursor:
+    def __init__(self, text, pos):
+        self.text = text
+        self.pos = pos
+
+    def error(self, message, pos=None):
+        return MacroSyntaxError(message, self.text, self.pos if pos is None else pos)
+
+    def at_end(self):
+        return self.pos >= len(self.text)
+
+    def expect(self, ch):
+        if self.text[self.pos:self.pos + 1] != ch:
+            raise self.error(f"此处应为 {ch!r}")
+        self.pos += 1
+
+    def number(self):
+        start = self.pos
+        text = self.text
+        while self.pos < len(text) and text[self.pos] in "+-.0123456789eE":
+            self.pos += 1
+        try:
+            value = float(text[start:self.pos])
+        except ValueError:
+            raise self.error("此处应为数字", start) from None
+        if not 0.0 <= value <= 1.0:
+            raise self.error("相对坐标必须在 0 到 1 之间", start)
+        return value
+
+    def point(self, coords):
+        self.expect("(")
+        coords.append(self.number())
+        self.expect(",")
+        coords.append(self.number())
+        self.expect(")")
+
+
+@functools.lru_cache(maxsize=65536)
+def parse_action(text):
+    """解析单条宏指令字符串（带缓存）；不认识的指令返回原样保存的 RAW 指令"""
+    name, sep, rest = text.partition(":")
+    op = _OPCODE_INDEX.get(name)
+    if op is None:
+        return Action(RAW, text)
+    kind, symbols = OPCODES[name]
+    cursor = _Cursor(text, len(name) + 1)
+    if kind == ARG_NONE:
+        if sep:
+            raise cursor.error(f"{name} 不需要参数", len(name))
+        return Action(op)
+    if not sep:
+        raise cursor.error(f"{name} 缺少参数", len(name))
+    if rest in symbols:
+        return Action(op, rest)
+    if kind == ARG_INT:
+        if not (rest.isascii() and rest.isdigit()):
+            expected = "非负整数" + "".join(f" 或 {s}" for s in symbols)
+            raise cursor.error(f"此处应为{expected}")
+        return Action(op, int(rest))
+    coords = []
+    arg = None
+    cursor.point(coords)
+    while not cursor.at_end():
+        if kind != ARG_POINTS:
+            raise cursor.error("多余的内容")
+        cursor.expect(";")
+        tail = text[cursor.pos:]
+        if tail in symbols:
+            arg = tail
+            break
+        cursor.point(coords)
+    return Action(op, arg, coords)
+
+
+def _format_number(value):
+    # 模拟器写出的坐标为 6 位小数，能精确还原时沿用该格式
+    text = f"{value:.6f}"
+    return text if float(text) == value else repr(value)
+
+
+def format_action(action):
+    """把中间表示还原成宏指令字符串"""
+    if action.op == RAW:
+        return action.arg
+    name = action.name
+    kind = OPCODES[name][0]
+    if kind == ARG_NONE:
+        return name
+    if not action.coords:
+        return f"{name}:{action.arg}"
+    c = action.coords
+    text = ";".join(f"({_format_number(c[i])},{_format_number(c[i + 1])})" for i in range(0, len(c), 2))
+    if action.arg is not None:
+        text += f";{action.arg}"
+    return f"{name}:{text}"
+
+
+_START_LOOP = _OPCODE_INDEX["start_loop"]
+_STOP_LOOP = _OPCODE_INDEX["stop_loop"]
+
+
+def compile_actions(actions, field=None, strict=False):
+    """编译一组宏指令并检查循环是否配对，返回 Action 元组；strict 时不认识的指令也是错误"""
+    if not isinstance(actions, list):
+        raise MacroSyntaxError(f"{field or '宏指令'} 必须是列表", repr(actions), 0)
+    compiled = []
+    depth = 0
+    for i, text in enumerate(actions):
+        try:
+            if not isinstance(text, str):
+                raise MacroSyntaxError(f"宏指令必须是字符串，实际为 {type(text).__name__}", repr(text), 0)
+            action = parse_action(text)
+            if strict and action.op == RAW:
+                raise MacroSyntaxError(f"未知的宏指令 {action.name!r}", text, 0)
+        except MacroSyntaxError as e:
+            e.field, e.index = field, i
+            raise
+        if action.op == _START_LOOP:
+            depth += 1
+        elif action.op == _STOP_LOOP:
+            depth -= 1
+            if depth < 0:
+                error = MacroSyntaxError("stop_loop 之前没有对应的 start_loop", text, 0)
+                error.field, error.index = field, i
+                raise error
+        compiled.append(action)
+    if depth > 0:
+        error = MacroSyntaxError("start_loop 没有对应的 stop_loop", actions[-1], 0)
+        error.field, error.index = field, len(actions) - 1
+        raise error
+    return tuple(compiled)
+
+
+def format_actions(compiled):
+    return [format_action(action) for action in compiled]
+
+
+def compile_keymap(km):
+    """编译单个点位的宏，返回 {字段名: Action 元组}，没有宏的点位返回空字典"""
+    return {field: compile_actions(km[field], field) for field in ACTION_FIELDS if field in km}
+
+
+def validate_keymaps(keymaps, limit=None, strict=False):
+    """一次性检查全部点位的宏指令，返回 MacroSyntaxError 列表（最多 limit 个）"""
+    errors = []
+    for k, km in enumerate(keymaps):
+        if not isinstance(km, dict):
+            continue
+        for field in ACTION_FIELDS:
+            if field not in km:
+                continue
+            try:
+                compile_actions(km[field], field, strict)
+            except MacroSyntaxError as e:
+                e.keymap = k
+                errors.append(e)
+                if limit is not None and len(errors) >= limit:
+                    return errors
+    return errors
+
+
+def unknown_opcodes(keymaps):
+    """点位中出现的不认识的指令名（按名称排序），格式有误的宏不计入"""
+    names = set()
+    for km in keymaps:
+        if not isinstance(km, dict):
+            continue
+        for field in ACTION_FIELDS:
+            actions = km.get(field)
+            if not isinstance(actions, list):
+                continue
+            for text in actions:
+                if isinstance(text, str):
+                    try:
+                        action = parse_action(text)
+                    except MacroSyntaxError:
+                        continue
+                    if action.op == RAW:
+                        names.add(action.name)
+    return sorted(names)
+
+
+def unknown_warning(keymaps):
+    """有不认识的指令时返回提示文字，否则返回空字符串"""
+    names = unknown_opcodes(keymaps)
+    if not names:
+        return ""
+    return f"有不认识的宏指令 {'、'.join(names)}，将原样保留（不检查格式，也不换算其中的坐标）"
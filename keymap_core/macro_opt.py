@@ -0,0 +1,257 @@
+"""宏耗时分析与精简
+
+analyze() 估算一组宏指令按一次键的最坏耗时（循环到松开为止的宏给出每轮周期），
+optimize() 在不改变效果的前提下合并相邻的 sleep、删除 sleep:0 和末尾无意义的 sleep；
+指定 budget_ms 时还会把连续重复点击同一位置的步骤合并成一次，并按比例缩短 sleep，
+直到预计耗时不超过预算（sleep 不会低于 min_sleep_ms）。
+
+点击、曲线每段的耗时只是估算值，可以通过 timing 参数按实际情况调整。
+"""
+from . import macro
+from .macro import Action
+
+# 估算用的耗时（毫秒）
+DEFAULT_TIMING = {
+    "click_ms": 10,        # 一次点击（按下 + 松开）
+    "press_ms": 1,         # 单独按下
+    "release_ms": 1,       # 单独松开
+    "curve_point_ms": 16,  # 曲线相邻两点之间的移动
+    "min_sleep_ms": 16,    # 按预算缩短 sleep 时的下限（约一帧）
+}
+
+_OP = {name: i for i, name in enumerate(macro.OPCODE_NAMES)}
+_SLEEP = _OP["sleep"]
+_CLICK = _OP["click_rel"]
+_START_LOOP = _OP["start_loop"]
+_STOP_LOOP = _OP["stop_loop"]
+
+UNTIL_RELEASE = None  # 表示“直到松开按键”，没有固定耗时
+
+
+def _timing(timing):
+    return dict(DEFAULT_TIMING, **(timing or {}))
+
+
+def _duration(actions, t, start=0, end=None):
+    """计算 actions[start:end] 的耗时，返回 (耗时或 UNTIL_RELEASE, 结束位置)"""
+    end = len(actions) if end is None else end
+    total = 0.0
+    curve_first = curve_last = 0
+    i = start
+    while i < end:
+        a = actions[i]
+        name = a.name
+        if a.op == _START_LOOP:
+            body, i = _duration(actions, t, i + 1, end)
+            if a.arg == "until_release" or body is UNTIL_RELEASE:
+                return UNTIL_RELEASE, _skip_to_loop_end(actions, i, end)
+            total += body * a.arg
+        elif a.op == _STOP_LOOP:
+            return total, i
+        elif a.op == _SLEEP:
+            total += a.arg
+        elif a.op == _CLICK:
+            total += t["click_ms"]
+        elif name == "press_rel":
+            total += t["press_ms"]
+        elif name == "release_rel":
+            total += t["release_ms"]
+        elif name == "curve_first_point_sleep_time":
+            curve_first = a.arg
+        elif name == "curve_last_point_sleep_time":
+            curve_last = a.arg
+        elif name == "curve_rel":
+            if curve_first == "until_release_cmd" or curve_last == "until_release_cmd":
+                return UNTIL_RELEASE, _skip_to_loop_end(actions, i, end)
+            total += curve_first + curve_last + t["curve_point_ms"] * max(len(a.coords) // 2 - 1, 0)
+        i += 1
+    return total, i
+
+
+def _skip_to_loop_end(actions, i, end):
+    depth = 0
+    while i < end:
+        if actions[i].op == _START_LOOP:
+            depth += 1
+        elif actions[i].op == _STOP_LOOP:
+            if depth == 0:
+                return i
+            depth -= 1
+        i += 1
+    return i
+
+
+def duration_ms(actions, timing=None):
+    """一次按键的最坏耗时（毫秒），循环到松开为止的宏返回 UNTIL_RELEASE"""
+    return _duration(list(actions), _timing(timing))[0]
+
+
+def loop_period_ms(actions, timing=None):
+    """第一个“循环到松开为止”的循环每轮耗时，没有这种循环时返回 None"""
+    actions = list(actions)
+    t = _timing(timing)
+    for i, a in enumerate(actions):
+        if a.op == _START_LOOP and a.arg == "until_release":
+            return _duration(actions, t, i + 1)[0]
+    return None
+
+
+def _find_click_runs(actions):
+    """找出连续点击同一位置的片段（中间可夹 sleep），返回 [(起点, 终点, 点击次数)]"""
+    runs = []
+    i = 0
+    n = len(actions)
+    while i < n:
+        a = actions[i]
+        if a.op != _CLICK:
+            i += 1
+            continue
+        j = i + 1
+        clicks = 1
+        while j < n:
+            if actions[j] == a:
+                j += 1
+            elif actions[j].op == _SLEEP and j + 1 < n and actions[j + 1] == a:
+                j += 2
+            else:
+                break
+            clicks += 1
+        if clicks > 1:
+            runs.append((i, j, clicks))
+        i = j
+    return runs
+
+
+def _simplify(actions, changes):
+    """不改变效果的精简：删除 sleep:0、合并相邻 sleep、删除末尾的 sleep"""
+    out = []
+    for a in actions:
+        if a.op == _SLEEP:
+            if a.arg == 0:
+                changes.append("删除 sleep:0")
+                continue
+            if out and out[-1].op == _SLEEP:
+                changes.append(f"合并 sleep:{out[-1].arg} 和 sleep:{a.arg}")
+                out[-1] = Action(_SLEEP, out[-1].arg + a.arg)
+                continue
+        out.append(a)
+    # 最后一步之后的等待不会影响任何操作
+    while out and out[-1].op == _SLEEP:
+        changes.append(f"删除末尾的 sleep:{out[-1].arg}")
+        out.pop()
+    return out
+
+
+def _collapse_clicks(actions, changes):
+    out = []
+    last = 0
+    for start, end, clicks in _find_click_runs(actions):
+        out.extend(actions[last:start])
+        out.append(actions[start])
+        changes.append(f"{macro.format_action(actions[start])} 连续 {clicks} 次合并为 1 次")
+        last = end
+    out.extend(actions[last:])
+    return out
+
+
+def _scale_sleeps(actions, k, min_sleep):
+    return [Action(_SLEEP, max(min(a.arg, min_sleep), round(a.arg * k))) if a.op == _SLEEP else a
+            for a in actions]
+
+
+def analyze(actions, timing=None):
+    """分析一组宏指令（字符串列表），返回耗时估算和可优化之处"""
+    compiled = list(macro.compile_actions(actions))
+    t = _timing(timing)
+    findings = []
+    for start, end, clicks in _find_click_runs(compiled):
+        findings.append(f"第 {start + 1}~{end} 步连续 {clicks} 次点击同一位置")
+    _simplify(compiled, findings)
+    return {
+        "steps": len(compiled),
+        "clicks": sum(1 for a in compiled if a.op == _CLICK),
+        "sleep_ms": sum(a.arg for a in compiled if a.op == _SLEEP),
+        "duration_ms": _duration(compiled, t)[0],
+        "loop_period_ms": loop_period_ms(compiled, t),
+        "findings": findings,
+    }
+
+
+def optimize(actions, budget_ms=None, timing=None):
+    """精简一组宏指令，返回 (新的字符串列表, 报告)"""
+    t = _timing(timing)
+    compiled = list(macro.compile_actions(actions))
+    before = _duration(compiled, t)[0]
+    changes = []
+    result = _simplify(compiled, changes)
+    after = _duration(result, t)[0]
+    within_budget = True
+    if budget_ms is not None and after is not UNTIL_RELEASE and after > budget_ms:
+        result = _simplify(_collapse_clicks(result, changes), changes)
+        after = _duration(result, t)[0]
+        if after > budget_ms:
+            # 二分查找 sleep 的缩放比例
+            lo, hi = 0.0, 1.0
+            for _ in range(30):
+                mid = (lo + hi) / 2
+                if _duration(_scale_sleeps(result, mid, t["min_sleep_ms"]), t)[0] > budget_ms:
+                    hi = mid
+                else:
+                    lo = mid
+            result = _scale_sleeps(result, lo, t["min_sleep_ms"])
+            after = _duration(result, t)[0]
+            changes.append(f"sleep 缩短为原来的 {lo:.0%}（不低于 {t['min_sleep_ms']} ms）")
+            within_budget = after <= budget_ms
+    saved = None if before is UNTIL_RELEASE or after is UNTIL_RELEASE else before - after
+    report = {
+        "steps_before": len(compiled),
+        "steps_after": len(result),
+        "before_ms": before,
+        "after_ms": after,
+        "saved_ms": saved,
+        "loop_period_ms": loop_period_ms(result, t),
+        "within_budget": within_budget,
+        "changes": changes,
+    }
+    return macro.format_actions(result), report
+
+
+def optimize_keymaps(keymaps, budget_ms=None, timing=None):
+    """精简全部点位的宏，返回 (新的点位列表, 每个宏的报告列表)；原列表不会被修改"""
+    new_keymaps = []
+    reports = []
+    for km in keymaps:
+        new_km = km
+        for field in macro.ACTION_FIELDS:
+            actions = km.get(field)
+            if not actions:
+                continue
+            optimized, report = optimize(actions, budget_ms, timing)
+            report["key"] = km.get("key", {}).get("text", "") or "?"
+            report["field"] = field
+            reports.append(report)
+            if optimized != actions:
+                if new_km is km:
+                    new_km = dict(km)
+                new_km[field] = optimized
+        new_keymaps.append(new_km)
+    return new_keymaps, reports
+
+
+def format_reports(reports):
+    """生成逐个宏的耗时对比表"""
+    def ms(value):
+        return "直到松开" if value is UNTIL_RELEASE else f"{value:.0f}"
+
+    lines = [f"{'按键':<6} {'字段':<16} {'步数':>8} {'耗时(ms)':>16} {'节省(ms)':>8}"]
+    for r in reports:
+        saved = "-" if r["saved_ms"] is None else f"{r['saved_ms']:.0f}"
+        lines.append(f"{r['key']:<8} {r['field']:<16} {r['steps_before']:>4} → {r['steps_after']:<4} "
+                     f"{ms(r['before_ms']):>8} → {ms(r['after_ms']):<8} {saved:>8}")
+        if r["loop_period_ms"] is not None:
+            lines.append(f"         └ 按住时每轮循环约 {r['loop_period_ms']:.0f} ms")
+        for change in r["changes"]:
+            lines.append(f"         └ {change}")
+        if not r["within_budget"]:
+            lines.append("         └ 已缩到最短，仍超出预算")
+    return "\n".join(lines)
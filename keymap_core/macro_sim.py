@@ -0,0 +1,287 @@
+"""宏的试运行：在虚拟时钟上执行 press_actions / release_actions，记录输入事件并统计性能
+
+不需要模拟器，也不会真的等待：所有 sleep 都在虚拟时钟上完成，多个按键的宏并发执行。
+按键场景用 (按键名, 按下时刻, 松开时刻) 描述，时刻单位为毫秒，例如：
+
+    run(keymaps, [("Ctrl", 0, 1000), ("R", 200, 300)])
+
+结果中包含事件时间线、每个按键的点击次数 / 每秒点击数 / 宏总耗时，以及同时按住的按键之间的重叠时长。
+各类操作本身的耗时沿用 macro_opt.DEFAULT_TIMING 的估算值。
+"""
+import asyncio
+import heapq
+
+from . import macro
+from .macro_opt import DEFAULT_TIMING
+
+# 循环体不消耗时间时的保护上限，避免死循环
+MAX_LOOP_ITERATIONS = 100000
+
+
+class VirtualClock:
+    """虚拟时钟：所有任务都在等待时，直接把时间推进到最早的唤醒时刻"""
+
+    def __init__(self):
+        self.now = 0.0
+        self._heap = []
+        self._seq = 0
+        self._live = 0
+        self._waiting = 0
+        self._idle = None
+
+    async def sleep(self, ms):
+        future = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        heapq.heappush(self._heap, (self.now + max(ms, 0), self._seq, future))
+        self._waiting += 1
+        self._check_idle()
+        await future
+
+    async def sleep_until(self, t):
+        await self.sleep(t - self.now)
+
+    def _check_idle(self):
+        if self._waiting >= self._live:
+            self._idle.set()
+
+    async def _track(self, coro):
+        try:
+            await coro
+        finally:
+            self._live -= 1
+            self._check_idle()
+
+    async def run(self, coros):
+        """并发执行所有协程，直到全部结束"""
+        self._idle = asyncio.Event()
+        tasks = [asyncio.ensure_future(self._track(c)) for c in coros]
+        self._live = len(tasks)
+        while self._live:
+            await self._idle.wait()
+            self._idle.clear()
+            if not self._live or not self._heap:
+                continue
+            # 唤醒同一时刻的全部任务
+            t = self._heap[0][0]
+            self.now = t
+            while self._heap and self._heap[0][0] == t:
+                future = heapq.heappop(self._heap)[2]
+                self._waiting -= 1
+                future.set_result(None)
+        await asyncio.gather(*tasks)
+
+
+class RecordingDevice:
+    """假的输入设备：只记录触摸事件 (时刻, 按键, 触点, 事件, x, y)"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.events = []
+
+    def emit(self, key, touch, kind, x=None, y=None):
+        self.events.append({"t": self.clock.now, "key": key, "touch": touch, "kind": kind, "x": x, "y": y})
+
+
+class _KeyRun:
+    """单次按键：执行按下时的宏，松开时再执行松开的宏"""
+
+    def __init__(self, sim, key, press_at, release_at, compiled, position=None):
+        self.sim = sim
+        self.key = key
+        self.press_at = press_at
+        self.release_at = release_at
+        self.compiled = compiled
+        self.position = position
+        self.position_touch = None
+        self.clicks = 0
+        self.end = press_at
+        self.touches = 0
+
+    @property
+    def released(self):
+        return self.sim.clock.now >= self.release_at
+
+    async def press(self):
+        await self.sim.clock.sleep_until(self.press_at)
+        if self.position is not None:
+            # 普通点击点位：按住期间一直按在该位置
+            self.position_touch = self._new_touch()
+            self.sim.device.emit(self.key, self.position_touch, "down", *self.position)
+            self.clicks += 1
+        await self._execute(self.compiled.get("press_actions", ()))
+        self.end = max(self.end, self.sim.clock.now)
+
+    async def release(self):
+        await self.sim.clock.sleep_until(self.release_at)
+        if self.position_touch is not None:
+            self.sim.device.emit(self.key, self.position_touch, "up", *self.position)
+        await self._execute(self.compiled.get("release_actions", ()))
+        self.end = max(self.end, self.sim.clock.now)
+
+    def _new_touch(self):
+        self.touches += 1
+        return f"{self.key}#{self.touches}"
+
+    async def _execute(self, actions, start=0, end=None):
+        clock = self.sim.clock
+        dev = self.sim.device
+        t = self.sim.timing
+        end = len(actions) if end is None else end
+        curve_first = curve_last = 0
+        held = None  # press_rel 按下、尚未松开的触点
+        i = start
+        while i < end:
+            a = actions[i]
+            name = a.name
+            if name == "start_loop":
+                body_end = _loop_end(actions, i + 1, end)
+                iterations = 0
+                while iterations < MAX_LOOP_ITERATIONS:
+                    if a.arg == "until_release" and self.released:
+                        break
+                    if a.arg != "until_release" and iterations >= a.arg:
+                        break
+                    before = clock.now
+                    await self._execute(actions, i + 1, body_end)
+                    iterations += 1
+                    if clock.now == before and a.arg == "until_release":
+                        break
+                i = body_end + 1
+                continue
+            if name == "sleep":
+                await clock.sleep(a.arg)
+            elif name == "click_rel":
+                x, y = a.coords
+                touch = self._new_touch()
+                dev.emit(self.key, touch, "down", x, y)
+                self.clicks += 1
+                await clock.sleep(t["click_ms"])
+                dev.emit(self.key, touch, "up", x, y)
+            elif name == "press_rel":
+                x, y = a.coords if a.coords else (None, None)
+                held = self._new_touch()
+                dev.emit(self.key, held, "down", x, y)
+                self.clicks += 1
+                await clock.sleep(t["press_ms"])
+            elif name == "release_rel":
+                x, y = a.coords if a.coords else (None, None)
+                dev.emit(self.key, held or self._new_touch(), "up", x, y)
+                held = None
+                await clock.sleep(t["release_ms"])
+            elif name == "curve_first_point_sleep_time":
+                curve_first = a.arg
+            elif name == "curve_last_point_sleep_time":
+                curve_last = a.arg
+            elif name == "curve_rel":
+                points = a.points
+                held = self._new_touch()
+                dev.emit(self.key, held, "down", *points[0])
+                self.clicks += 1
+                await self._wait(curve_first)
+                for x, y in points[1:]:
+                    await clock.sleep(t["curve_point_ms"])
+                    dev.emit(self.key, held, "move", x, y)
+                await self._wait(curve_last)
+            elif name == "curve_release":
+                dev.emit(self.key, held or self._new_touch(), "up")
+                held = None
+            i += 1
+
+    async def _wait(self, value):
+        if value == "until_release_cmd":
+            await self.sim.clock.sleep_until(self.release_at)
+        else:
+            await self.sim.clock.sleep(value)
+
+
+def _loop_end(actions, i, end):
+    depth = 0
+    while i < end:
+        if actions[i].name == "start_loop":
+            depth += 1
+        elif actions[i].name == "stop_loop":
+            if depth == 0:
+                return i
+            depth -= 1
+        i += 1
+    return end
+
+
+class Simulation:
+    def __init__(self, keymaps, timing=None):
+        self.timing = dict(DEFAULT_TIMING, **(timing or {}))
+        self.clock = VirtualClock()
+        self.device = RecordingDevice(self.clock)
+        # 按键名 → (编译后的宏, 普通点击的位置)；同名按键取最后一个
+        self.macros = {}
+        for km in keymaps:
+            text = km.get("key", {}).get("text", "")
+            if not text:
+                continue
+            position = None
+            if km.get("type") == "Click":
+                pos = km.get("rel_work_position", {})
+                position = (pos.get("rel_x", 0), pos.get("rel_y", 0))
+            self.macros[text] = (macro.compile_keymap(km), position)
+
+    async def run(self, presses):
+        runs = []
+        for key, press_at, release_at in presses:
+            if key not in self.macros:
+                raise KeyError(f"模板中没有按键 {key}")
+            compiled, position = self.macros[key]
+            runs.append(_KeyRun(self, key, press_at, release_at, compiled, position))
+        coros = [r.press() for r in runs] + [r.release() for r in runs]
+        await self.clock.run(coros)
+        return _summarize(runs, self.device.events)
+
+
+def _summarize(runs, events):
+    keys = []
+    for r in runs:
+        hold = r.release_at - r.press_at
+        keys.append({
+            "key": r.key,
+            "press_at": r.press_at,
+            "release_at": r.release_at,
+            "clicks": r.clicks,
+            "clicks_per_sec": r.clicks / (hold / 1000) if hold > 0 else None,
+            "duration_ms": r.end - r.press_at,
+        })
+    overlaps = []
+    for i, a in enumerate(runs):
+        for b in runs[i + 1:]:
+            overlap = min(a.end, b.end) - max(a.press_at, b.press_at)
+            if overlap > 0:
+                overlaps.append({"keys": [a.key, b.key], "overlap_ms": overlap})
+    events.sort(key=lambda e: e["t"])
+    return {"keys": keys, "overlaps": overlaps, "events": events}
+
+
+def default_presses(keymaps, hold_ms=1000, gap_ms=1000):
+    """默认场景：依次单独按住每个带宏的按键 hold_ms 毫秒"""
+    presses = []
+    t = 0
+    for km in keymaps:
+        text = km.get("key", {}).get("text", "")
+        if text and km.get("press_actions"):
+            presses.append((text, t, t + hold_ms))
+            t += hold_ms + gap_ms
+    return presses
+
+
+def run(keymaps, presses, timing=None):
+    """同步执行一次试运行，返回统计结果"""
+    return asyncio.run(Simulation(keymaps, timing).run(presses))
+
+
+def format_summary(summary):
+    lines = [f"{'按键':<6} {'按下':>8} {'松开':>8} {'点击':>6} {'点击/秒':>8} {'宏耗时(ms)':>10}"]
+    for k in summary["keys"]:
+        cps = "-" if k["clicks_per_sec"] is None else f"{k['clicks_per_sec']:.1f}"
+        lines.append(f"{k['key']:<8} {k['press_at']:>8.0f} {k['release_at']:>8.0f} {k['clicks']:>8} "
+                     f"{cps:>10} {k['duration_ms']:>13.0f}")
+    for o in summary["overlaps"]:
+        lines.append(f"{' + '.join(o['keys'])} 同时执行 {o['overlap_ms']:.0f} ms")
+    lines.append(f"共 {len(summary['events'])} 个触摸事件")
+    return "\n".join(lines)
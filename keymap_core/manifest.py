@@ -0,0 +1,123 @@
+"""处理记录：记住每个点位文件上次处理后的大小、修改时间、内容哈希和所用模板
+
+记录保存在点位文件夹下的 .keymap_manifest 中（不以 .json 结尾，不会出现在点位列表里）。
+大小和修改时间都没变、且模板相同的文件直接跳过（O(1)，无需读取文件）；
+大小或修改时间变了再比对内容哈希，哈希也变了说明文件被模拟器或用户改写过（drift）。
+"""
+import hashlib
+import json
+import os
+
+from . import jsonio
+
+MANIFEST_NAME = ".keymap_manifest"
+MANIFEST_VERSION = 1
+
+# check() 的返回值
+NEW = "new"                  # 从未处理过
+UNCHANGED = "unchanged"      # 已用同一模板处理过且之后未被改动
+TEMPLATE_CHANGED = "template"  # 文件未被改动，但这次使用的模板不同
+DRIFT = "drift"              # 处理之后文件又被改写过
+
+
+def template_hash(new_keymaps, skill_area, policy=None, relocate_icons=False, output_format=None):
+    """模板内容（点位 + 技能区域）及处理选项的哈希"""
+    options = {"keymaps": new_keymaps, "skill_area": skill_area.to_spec(), "policy": policy,
+               "relocate_icons": relocate_icons}
+    # 默认格式不计入，升级后已处理过的文件不会因此全部重新处理
+    if output_format not in (None, jsonio.PRETTY):
+        options["output_format"] = output_format
+    text = json.dumps(options, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def make_entry(path, tpl_hash):
+    """生成文件当前状态的记录"""
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": file_hash(path), "template": tpl_hash}
+
+
+def quick_check(path, entry, tpl_hash):
+    """只比对 stat 的快速检查：能确定未改动时返回 UNCHANGED 或 TEMPLATE_CHANGED，否则返回 None"""
+    if entry is None:
+        return NEW
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if st.st_size != entry["size"] or st.st_mtime_ns != entry["mtime_ns"]:
+        return None
+    return UNCHANGED if entry["template"] == tpl_hash else TEMPLATE_CHANGED
+
+
+def check(path, entry, tpl_hash):
+    """完整检查：stat 不一致时比对内容哈希；返回 (状态, 需要刷新的记录或 None)"""
+    status = quick_check(path, entry, tpl_hash)
+    if status is not None:
+        return status, None
+    if file_hash(path) != entry["sha256"]:
+        return DRIFT, None
+    # 内容没变，只是被 touch 过：刷新 stat
+    refreshed = dict(entry, **make_entry(path, entry["template"]))
+    return (UNCHANGED if entry["template"] == tpl_hash else TEMPLATE_CHANGED), refreshed
+
+
+class Manifest:
+    """单个点位文件夹的处理记录"""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.path = os.path.join(folder, MANIFEST_NAME)
+        self.files = {}
+        self.dirty = False
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.files = data.get("files", {})
+        except (OSError, ValueError):
+            pass
+
+    def get(self, path):
+        return self.files.get(os.path.basename(path))
+
+    def set(self, path, entry):
+        self.files[os.path.basename(path)] = entry
+        self.dirty = True
+
+    def discard(self, path):
+        if self.files.pop(os.path.basename(path), None) is not None:
+            self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        with jsonio.atomic_write(self.path) as f:
+            json.dump({"version": MANIFEST_VERSION, "files": self.files}, f, ensure_ascii=False, indent=2)
+        self.dirty = False
+
+
+class ManifestSet:
+    """按文件夹分组管理多个 Manifest"""
+
+    def __init__(self):
+        self.manifests = {}
+
+    def for_path(self, path):
+        folder = os.path.dirname(os.path.abspath(path))
+        manifest = self.manifests.get(folder)
+        if manifest is None:
+            manifest = self.manifests[folder] = Manifest(folder)
+        return manifest
+
+    def save(self):
+        for manifest in self.manifests.values():
+            manifest.save()
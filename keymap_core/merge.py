@@ -0,0 +1,291 @@
+"""插入模板时的按键冲突处理
+
+保留下来的原有点位可能和模板点位绑定同一个按键（例如原布局里的 Space、R），
+直接拼接会让一个按键同时触发两个点位。Merger 先按模板建好按键索引
+（device + virtual_key、device + scan_code 各一张哈希表），
+逐个检查保留的点位，整体 O(n)，流式处理时也只需要逐条调用 keep()。
+
+与某个模板点位完全相同的原有点位（之前插入过的模板点位）直接丢弃、不算冲突，
+模板点位照常追加在最后，所以对同一个文件重复插入同一模板时结果不变。
+比较时忽略图标显示位置 icon.rel_position（layout 挪开重叠图标时只改它）。
+
+冲突处理策略：
+    KEEP_BOTH      两者都保留，只在结果中报告冲突（默认，与不检查冲突时的结果相同）
+    TEMPLATE_WINS  模板优先：删除冲突的原有点位
+    ORIGINAL_WINS  原有优先：不插入冲突的模板点位
+    REBIND         两者都保留：原有点位在原位置改绑到一个空闲按键（数字键、F1~F12、字母键依次尝试）；
+                   空闲按键用完、不是键盘按键或摇杆等其它按键也冲突时原样保留，在冲突中记为 unresolved
+    ABORT          不修改文件，抛出 MergeConflictError 列出全部冲突
+
+REBIND 要在处理第一个点位之前知道文件中原有的全部按键（reserve() / reserve_table()），
+改绑时不会选到后面的点位正在用的按键。
+
+keep_table() 处理 columnar.KeymapTable：先用按键列整体找出与模板冲突的行，
+没有冲突的行直接按列登记按键，只有冲突的行才走 keep() 的逐个处理。
+"""
+from . import jsonio, optional
+from .columnar import COMPLEX_KEY
+from .regions import VECTORIZE_THRESHOLD
+
+KEEP_BOTH = "both"
+TEMPLATE_WINS = "template"
+ORIGINAL_WINS = "original"
+REBIND = "rebind"
+ABORT = "abort"
+POLICIES = (KEEP_BOTH, TEMPLATE_WINS, ORIGINAL_WINS, REBIND, ABORT)
+# 删除用户自己的点位必须明确选择，默认只报告
+DEFAULT_POLICY = KEEP_BOTH
+
+POLICY_LABELS = {
+    KEEP_BOTH: "都保留（只报告冲突）",
+    TEMPLATE_WINS: "模板优先（删除冲突的原有点位）",
+    ORIGINAL_WINS: "原有优先（不插入冲突的模板点位）",
+    REBIND: "改绑空闲按键（原有点位换一个按键）",
+    ABORT: "有冲突时不修改文件",
+}
+
+# 改绑时依次尝试的空闲按键：(显示名, scan_code, virtual_key)
+FREE_KEYS = (
+    [(str(n % 10), 2 + (n - 1), 48 + n % 10) for n in range(1, 11)]
+    + [(f"F{n}", 58 + n, 111 + n) for n in range(1, 11)]
+    + [("F11", 87, 122), ("F12", 88, 123)]
+    + [(ch, sc, ord(ch)) for ch, sc in (
+        ("T", 20), ("Y", 21), ("U", 22), ("I", 23), ("O", 24), ("P", 25), ("F", 33), ("G", 34),
+        ("H", 35), ("J", 36), ("K", 37), ("L", 38), ("Z", 44), ("X", 45), ("C", 46), ("V", 47),
+        ("B", 48), ("N", 49), ("M", 50))]
+)
+
+
+class MergeConflictError(ValueError):
+    """ABORT 策略下发现按键冲突"""
+
+    def __init__(self, conflicts):
+        keys = "，".join(c["key"] for c in conflicts[:10])
+        if len(conflicts) > 10:
+            keys += f" 等 {len(conflicts)} 处"
+        super().__init__("按键冲突，未修改文件：" + keys)
+        self.conflicts = conflicts
+
+
+def key_bindings(km):
+    """点位绑定的全部按键 (device, virtual_key, scan_code)，包括摇杆等类型中嵌套的按键"""
+    bindings = []
+    for value in km.values():
+        if isinstance(value, dict) and ("virtual_key" in value or "scan_code" in value):
+            bindings.append((value.get("device", ""), value.get("virtual_key"), value.get("scan_code")))
+    return bindings
+
+
+class KeyIndex:
+    """按键 → 点位序号的哈希索引，virtual_key 和 scan_code 任一相同即视为同一按键"""
+
+    def __init__(self):
+        self.by_vk = {}
+        self.by_sc = {}
+
+    def add(self, km, index):
+        for device, vk, sc in key_bindings(km):
+            if vk is not None:
+                self.by_vk.setdefault((device, vk), index)
+            if sc is not None:
+                self.by_sc.setdefault((device, sc), index)
+
+    def find(self, km):
+        """返回第一个与 km 绑定同一按键的点位序号，没有时返回 None"""
+        for device, vk, sc in key_bindings(km):
+            if vk is not None and (device, vk) in self.by_vk:
+                return self.by_vk[(device, vk)]
+            if sc is not None and (device, sc) in self.by_sc:
+                return self.by_sc[(device, sc)]
+        return None
+
+    def used(self, device, vk, sc):
+        return (device, vk) in self.by_vk or (device, sc) in self.by_sc
+
+
+def identity(km):
+    """判断点位是否与模板点位相同时比较的内容：键排序的紧凑 JSON，不含 icon.rel_position"""
+    icon = km.get("icon")
+    if isinstance(icon, dict) and "rel_position" in icon:
+        km = dict(km, icon={k: v for k, v in icon.items() if k != "rel_position"})
+    return jsonio.canonical(km)
+
+
+def key_text(km):
+    """点位在报告中显示的按键名"""
+    return km.get("key", {}).get("text", "") or "?"
+
+
+class Merger:
+    """对一个文件做一次合并：先对每个保留的点位调用 keep()，最后由 finish() 给出要追加的点位"""
+
+    def __init__(self, new_keymaps, policy=None):
+        policy = policy or DEFAULT_POLICY
+        if policy not in POLICIES:
+            raise ValueError(f"未知的冲突处理策略：{policy}")
+        self.policy = policy
+        self.new_keymaps = new_keymaps
+        self.template_index = KeyIndex()
+        for i, km in enumerate(new_keymaps):
+            self.template_index.add(km, i)
+        self.template_identities = {identity(km) for km in new_keymaps}
+        self.kept_index = KeyIndex()
+        self.kept = 0
+        self.blocked = set()          # ORIGINAL_WINS 时不插入的模板点位序号
+        self.reserved = KeyIndex()    # REBIND 时文件中原有的全部按键
+        self.free = None              # REBIND 时依次取出空闲按键的生成器
+        self.conflicts = []
+
+    def reserve(self, keymaps):
+        """REBIND 时登记文件中原有的点位的按键（在 keep() 之前调用），其它策略下什么也不做"""
+        if self.policy != REBIND:
+            return
+        for km in keymaps:
+            self.reserved.add(km, 0)
+
+    def reserve_table(self, table):
+        """与 reserve() 相同，参数为 KeymapTable"""
+        if self.policy != REBIND:
+            return
+        by_vk, by_sc = self.reserved.by_vk, self.reserved.by_sc
+        for i, flags in enumerate(table.flags):
+            if flags & COMPLEX_KEY:
+                self.reserved.add(table.row(i), 0)
+                continue
+            device, vk, sc = table.devices[table.device[i]], table.vk[i], table.sc[i]
+            if vk >= 0:
+                by_vk.setdefault((device, vk), 0)
+            if sc >= 0:
+                by_sc.setdefault((device, sc), 0)
+
+    def keep(self, km):
+        """处理一个保留的原有点位，返回要写入的点位（可能是修改后的副本），需要丢弃时返回 None"""
+        j = self.template_index.find(km)
+        if j is None:
+            self.kept_index.add(km, self.kept)
+            self.kept += 1
+            return km
+        if identity(km) in self.template_identities:
+            return None
+        conflict = {"key": key_text(km), "original_type": km.get("type", ""),
+                    "template_type": self.new_keymaps[j].get("type", ""), "action": self.policy}
+        self.conflicts.append(conflict)
+        if self.policy == TEMPLATE_WINS:
+            return None
+        if self.policy == REBIND:
+            km = self._rebind(km, conflict)
+        self.kept_index.add(km, self.kept)
+        self.kept += 1
+        if self.policy == ORIGINAL_WINS:
+            self.blocked.add(j)
+        return km
+
+    def _rebind(self, km, conflict):
+        """REBIND：返回改绑到空闲按键的副本；无法改绑时原样返回，并在 conflict 中记下原因"""
+        key = km.get("key", {})
+        if key.get("device", "keyboard") != "keyboard":
+            conflict["unresolved"] = "不是键盘按键"
+            return km
+        if self.free is None:
+            self.free = self._free_keys()
+        binding = next(self.free, None)
+        if binding is None:
+            conflict["unresolved"] = "没有空闲的按键"
+            return km
+        text, sc, vk = binding
+        rebound = dict(km, key=dict(key, text=text, scan_code=sc, virtual_key=vk))
+        if self.template_index.find(rebound) is not None:
+            conflict["unresolved"] = "摇杆等其它按键也与模板冲突"
+            return km
+        conflict["rebound"] = text
+        return rebound
+
+    def keep_table(self, table):
+        """对 KeymapTable 的每一行调用 keep()，返回要写入的行组成的新表（与逐行 keep() 的结果相同）
+
+        只有冲突的行才解析原始内容，其余保留的行不展开成字典；改绑的行在 table 中原地替换。
+        """
+        hit = self._table_conflicts(table)
+        by_vk, by_sc = self.kept_index.by_vk, self.kept_index.by_sc
+        kept = []
+        for i, h in enumerate(hit):
+            if h:
+                row = table.row(i)
+                km = self.keep(row)
+                if km is not None:
+                    if km is not row:
+                        table.replace(i, km)
+                    kept.append(i)
+                continue
+            device, vk, sc = table.devices[table.device[i]], table.vk[i], table.sc[i]
+            if vk >= 0:
+                by_vk.setdefault((device, vk), self.kept)
+            if sc >= 0:
+                by_sc.setdefault((device, sc), self.kept)
+            self.kept += 1
+            kept.append(i)
+        return table if len(kept) == len(table) else table.take(kept)
+
+    def _table_conflicts(self, table):
+        """每一行是否需要逐个处理：按键与模板冲突，或者按键不能用列表示（COMPLEX_KEY）"""
+        by_vk, by_sc = self.template_index.by_vk, self.template_index.by_sc
+        np = optional.numpy() if len(table) >= VECTORIZE_THRESHOLD else None
+        if np is None:
+            return [flags & COMPLEX_KEY or (vk >= 0 and (table.devices[d], vk) in by_vk)
+                    or (sc >= 0 and (table.devices[d], sc) in by_sc)
+                    for d, vk, sc, flags in zip(table.device, table.vk, table.sc, table.flags)]
+        devices, vks, scs, flags = table.numpy_columns("device", "vk", "sc", "flags")
+        hit = (flags & COMPLEX_KEY) != 0
+        for d, device in enumerate(table.devices):
+            template_vks = [vk for dev, vk in by_vk if dev == device and isinstance(vk, (int, float))]
+            template_scs = [sc for dev, sc in by_sc if dev == device and isinstance(sc, (int, float))]
+            if template_vks or template_scs:
+                hit |= (devices == d) & (((vks >= 0) & np.isin(vks, template_vks))
+                                         | ((scs >= 0) & np.isin(scs, template_scs)))
+        return hit.tolist()
+
+    def finish(self):
+        """返回在保留的点位之后追加的模板点位列表；ABORT 策略下有冲突时抛出 MergeConflictError"""
+        if self.policy == ABORT and self.conflicts:
+            raise MergeConflictError(self.conflicts)
+        if self.blocked:
+            return [km for i, km in enumerate(self.new_keymaps) if i not in self.blocked]
+        return list(self.new_keymaps)
+
+    def _free_keys(self):
+        for text, sc, vk in FREE_KEYS:
+            if not (self.template_index.used("keyboard", vk, sc) or self.reserved.used("keyboard", vk, sc)
+                    or self.kept_index.used("keyboard", vk, sc)):
+                yield text, sc, vk
+
+    def inserted(self):
+        return len(self.new_keymaps) - len(self.blocked)
+
+
+def merge(kept_keymaps, new_keymaps, policy=None):
+    """合并保留的点位和模板点位，返回 (合并后的列表, 冲突列表)"""
+    merger = Merger(new_keymaps, policy)
+    merger.reserve(kept_keymaps)
+    merged = []
+    for km in kept_keymaps:
+        km = merger.keep(km)
+        if km is not None:
+            merged.append(km)
+    merged.extend(merger.finish())
+    return merged, merger.conflicts
+
+
+def format_conflict(conflict):
+    action = conflict["action"]
+    if action == KEEP_BOTH:
+        return f"{conflict['key']}（原有 {conflict['original_type']} 与模板 {conflict['template_type']} 都保留）"
+    if action == TEMPLATE_WINS:
+        return f"{conflict['key']}（删除原有 {conflict['original_type']}）"
+    if action == ORIGINAL_WINS:
+        return f"{conflict['key']}（保留原有，未插入模板 {conflict['template_type']}）"
+    if action == REBIND and "unresolved" in conflict:
+        return (f"{conflict['key']}（{conflict['unresolved']}，无法改绑，"
+                f"原有 {conflict['original_type']} 与模板 {conflict['template_type']} 都保留）")
+    if action == REBIND:
+        return f"{conflict['key']}（原有 {conflict['original_type']} 改绑到 {conflict['rebound']}）"
+    return conflict["key"]
@@ -0,0 +1,212 @@
+"""点位文件名识别：按规则表排除游戏自带方案、把包名替换成易读的显示名，并给出各游戏的默认模板和技能区域
+
+规则表内置下面的 EXCLUDED_FILES / DISPLAY_PREFIXES，用户可以在 paths.RULES_PATH 中增加或覆盖：
+
+    {
+        "rules": [
+            {"file": "com.nexon.bluearchive.json", "exclude": true},
+            {"prefix": "com.nexon.bluearchive", "display": "国际服点位",
+             "template": "templates/global.json", "region": "regions/global.json"},
+            {"prefix": "com.example.game", "display": "某游戏", "region": {"include": [{"type": "rect", "x_min": 0.6}]}},
+            {"prefix": "com.example.tool", "exclude": true}
+        ]
+    }
+
+file 规则只匹配完整的文件名，prefix 规则匹配以该包名开头的文件名。一个文件匹配多条规则时逐项合并：
+较长的前缀中写了的项覆盖较短的前缀，file 规则中写了的项又覆盖所有前缀（与书写顺序无关）；
+显示名取写了 display 的最长前缀替换。用户规则与内置规则的 file / prefix 相同时覆盖内置规则，
+例如 {"file": "com.nexon.bluearchive.json", "exclude": false} 可以取消内置的排除。
+template / region 为该游戏没有指定模板 / 技能区域时使用的默认值，region 可以是文件，也可以直接写区域描述；
+相对路径相对于规则文件所在的文件夹。
+
+全部规则编译成一棵按字符展开的前缀树，识别一个文件名只需从头到尾走一遍，耗时与规则数量无关。
+"""
+import functools
+import os
+
+from . import jsonio
+from .paths import RULES_PATH
+
+# 游戏自带的默认方案，不允许修改
+EXCLUDED_FILES = {
+    "com.nexon.bluearchive.json",
+    "com.RoamingStar.BlueArchive.json",
+    "com.RoamingStar.BlueArchive.bilibili.json",
+    "com.RoamingStar.BlueArchive-默认操作方案.json",
+    "com.nexon.bluearchive-默认操作模式.json",
+    "com.RoamingStar.BlueArchive.bilibili-默认操作方案.json",
+}
+
+# 包名前缀 → 显示名
+DISPLAY_PREFIXES = [
+    ("com.nexon.bluearchive", "国际服点位"),
+    ("com.RoamingStar.BlueArchive.bilibili", "B服点位"),
+    ("com.RoamingStar.BlueArchive", "官服点位"),
+]
+
+DEFAULT_RULES = ([{"file": file, "exclude": True} for file in sorted(EXCLUDED_FILES)]
+                 + [{"prefix": prefix, "display": display} for prefix, display in DISPLAY_PREFIXES])
+
+RULE_FIELDS = ("display", "exclude", "template", "region")
+
+
+class InvalidRulesError(ValueError):
+    """文件名规则表格式错误"""
+
+
+class Rule:
+    """一条规则；没有写的项为 None"""
+    __slots__ = ("file", "prefix", "display", "exclude", "template", "region")
+
+    def __init__(self, file=None, prefix=None, display=None, exclude=None, template=None, region=None):
+        self.file = file
+        self.prefix = prefix
+        self.display = display
+        self.exclude = exclude
+        self.template = template
+        self.region = region
+
+    @classmethod
+    def from_spec(cls, spec, base=None):
+        if not isinstance(spec, dict):
+            raise InvalidRulesError("每条规则必须是对象")
+        file, prefix = spec.get("file"), spec.get("prefix")
+        if (file is None) == (prefix is None) or not isinstance(file or prefix, str) or not (file or prefix):
+            raise InvalidRulesError(f"规则需要 file 或 prefix 其中之一：{spec}")
+        unknown = set(spec) - {"file", "prefix", *RULE_FIELDS}
+        if unknown:
+            raise InvalidRulesError(f"规则中有未知的项 {'、'.join(sorted(unknown))}：{spec}")
+        template, region = spec.get("template"), spec.get("region")
+        if base is not None:
+            if isinstance(template, str):
+                template = os.path.normpath(os.path.join(base, template))
+            if isinstance(region, str):
+                region = os.path.normpath(os.path.join(base, region))
+        exclude = spec.get("exclude")
+        return cls(file, prefix, spec.get("display"), None if exclude is None else bool(exclude), template, region)
+
+
+class Match:
+    """一个文件名的识别结果"""
+    __slots__ = ("excluded", "display", "template", "region")
+
+    def __init__(self, excluded=False, display=None, template=None, region=None):
+        self.excluded = excluded
+        self.display = display
+        self.template = template
+        self.region = region
+
+
+_NO_MATCH = Match()
+
+
+class RuleSet:
+    """编译后的规则表
+
+    前缀树的每个节点为 [子节点字典, 以此结尾的 prefix 规则, 以此结尾的 file 规则]。
+    """
+
+    def __init__(self, rules=()):
+        self._root = [{}, None, None]
+        self.rules = []
+        keyed = {}
+        for rule in rules:
+            key = ("file", rule.file) if rule.file is not None else ("prefix", rule.prefix)
+            keyed[key] = rule
+        for (kind, text), rule in keyed.items():
+            node = self._root
+            for ch in text:
+                node = node[0].setdefault(ch, [{}, None, None])
+            node[2 if kind == "file" else 1] = rule
+            self.rules.append(rule)
+
+    def _lookup(self, file):
+        """返回 匹配的规则列表：前缀从短到长，最后是完整文件名规则"""
+        node = self._root
+        found = []
+        for ch in file:
+            node = node[0].get(ch)
+            if node is None:
+                return found
+            if node[1] is not None:
+                found.append(node[1])
+        if node[2] is not None:
+            found.append(node[2])
+        return found
+
+    def match(self, file):
+        """识别文件名，返回 Match"""
+        found = self._lookup(file)
+        if not found:
+            return _NO_MATCH
+        fields = {}
+        for rule in found:
+            for name in RULE_FIELDS:
+                value = getattr(rule, name)
+                if value is not None:
+                    fields[name] = value
+        display = fields.get("display")
+        if display is not None:
+            rule = next(rule for rule in reversed(found) if rule.display is not None)
+            if rule.prefix is not None:
+                display += file[len(rule.prefix):]
+        return Match(bool(fields.get("exclude")), display, fields.get("template"), fields.get("region"))
+
+    def is_excluded(self, file):
+        return self.match(file).excluded
+
+    def is_keymap_file(self, file):
+        return file.endswith(".json") and not self.match(file).excluded
+
+    def display_name(self, file):
+        return self.match(file).display or file
+
+
+def parse_rules(data, base=None):
+    """解析规则表内容，返回 Rule 列表"""
+    if not isinstance(data, dict) or not isinstance(data.get("rules"), list):
+        raise InvalidRulesError("规则文件中缺少 rules 列表")
+    return [Rule.from_spec(spec, base) for spec in data["rules"]]
+
+
+def load_rules(path=RULES_PATH):
+    """内置规则加上用户规则文件（不存在时只有内置规则）编译成的 RuleSet"""
+    rules = [Rule.from_spec(spec) for spec in DEFAULT_RULES]
+    try:
+        data = jsonio.load_file(path)
+    except FileNotFoundError:
+        return RuleSet(rules)
+    except (OSError, ValueError) as e:
+        raise InvalidRulesError(f"无法读取文件名规则：{e}") from None
+    return RuleSet(rules + parse_rules(data, os.path.dirname(os.path.abspath(path))))
+
+
+def write_default_rules(path=RULES_PATH):
+    """写出一份包含内置规则的规则文件，供用户在此基础上修改"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with jsonio.atomic_write(path) as f:
+        f.write(jsonio.dumps({"rules": DEFAULT_RULES}))
+
+
+@functools.lru_cache(maxsize=None)
+def rules():
+    """当前使用的规则表；用户规则文件有误时只使用内置规则"""
+    try:
+        return load_rules()
+    except InvalidRulesError:
+        return RuleSet(Rule.from_spec(spec) for spec in DEFAULT_RULES)
+
+
+def reload_rules():
+    """规则文件修改后重新读取"""
+    rules.cache_clear()
+    return rules()
+
+
+def is_keymap_file(file):
+    """是否为可以处理的点位文件"""
+    return rules().is_keymap_file(file)
+
+
+def display_name(file):
+    return rules().display_name(file)
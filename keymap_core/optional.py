@@ -0,0 +1,35 @@
+"""可选依赖：用到时才导入
+
+NumPy 的导入本身就要 100 ms 左右，只处理少量点位时并不划算，因此不在模块加载时导入。
+orjson 用于加快 JSON 读写（见 jsonio），未安装时使用标准库。
+"""
+_numpy = None
+_numpy_checked = False
+_orjson = None
+_orjson_checked = False
+
+
+def numpy():
+    """返回 numpy 模块，未安装时返回 None（只尝试导入一次）"""
+    global _numpy, _numpy_checked
+    if not _numpy_checked:
+        try:
+            import numpy as np
+        except ImportError:
+            np = None
+        _numpy = np
+        _numpy_checked = True
+    return _numpy
+
+
+def orjson():
+    """返回 orjson 模块，未安装时返回 None（只尝试导入一次）"""
+    global _orjson, _orjson_checked
+    if not _orjson_checked:
+        try:
+            import orjson as module
+        except ImportError:
+            module = None
+        _orjson = module
+        _orjson_checked = True
+    return _orjson
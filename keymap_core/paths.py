@@ -0,0 +1,49 @@
+"""配置文件与资源文件位置
+
+Windows 下配置放在 %APPDATA%\\keymap，缓存和快照放在 %LOCALAPPDATA%\\keymap；
+其它系统按 XDG 规范放在 $XDG_CONFIG_HOME/keymap、$XDG_CACHE_HOME/keymap 和 $XDG_STATE_HOME/keymap。
+设置环境变量 KEYMAP_HOME 时全部放在该文件夹下（便携版或测试用）。
+"""
+import os
+import sys
+
+HOME_ENV = "KEYMAP_HOME"
+
+
+def _base(windows_env, xdg_env, xdg_default):
+    home = os.environ.get(HOME_ENV)
+    if home:
+        return home
+    if os.name == "nt":
+        base = os.environ.get(windows_env) or os.environ.get("APPDATA") or os.path.expanduser(r"~\AppData\Roaming")
+    else:
+        base = os.environ.get(xdg_env) or os.path.expanduser(xdg_default)
+    return os.path.join(base, "keymap")
+
+
+CONFIG_DIR = _base("APPDATA", "XDG_CONFIG_HOME", "~/.config")
+CACHE_DIR = _base("LOCALAPPDATA", "XDG_CACHE_HOME", "~/.cache")
+STATE_DIR = _base("LOCALAPPDATA", "XDG_STATE_HOME", "~/.local/state")
+
+# 设置文件：最近的文件夹、已导入的模板和文件夹索引
+CONFIG_PATH = os.path.join(CONFIG_DIR, "settings.json")
+# 旧版本的配置文件，只在第一次启动时读取其中的文件夹路径
+LEGACY_CONFIG_PATH = r"C:\ProgramData\keymap.json" if os.name == "nt" else None
+# 文件名规则：排除的文件、显示名和各游戏的默认模板 / 技能区域（见 naming）
+RULES_PATH = os.path.join(CONFIG_DIR, "naming_rules.json")
+# 无界面时（PollingWatcher 等）使用的点位文件夹索引
+INDEX_PATH = os.path.join(CACHE_DIR, "folder_index.json")
+# 已导入模板解析后的缓存，按模板文件内容的哈希命名
+TEMPLATE_CACHE_DIR = os.path.join(CACHE_DIR, "templates")
+# 修改 / 删除前的文件快照
+SNAPSHOT_DIR = os.path.join(STATE_DIR, "snapshots")
+
+# 源码运行时资源相对于项目根目录（keymap_core 的上一级）
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def resource_path(relative_path):
+    """获取打包后或源码状态下的资源路径"""
+    if hasattr(sys, "_MEIPASS"):
+        return os.path.join(sys._MEIPASS, relative_path)
+    return os.path.join(_ROOT, relative_path)
@@ -0,0 +1,188 @@
+"""技能区域描述与批量判定
+
+区域描述跟模板一起保存在模板文件的 "skill_area" 字段中，例如：
+
+    "skill_area": {
+        "include": [
+            {"type": "rect", "x_min": 0.67, "y_min": 0.79},
+            {"type": "polygon", "points": [[0.1, 0.1], [0.3, 0.1], [0.2, 0.4]]}
+        ],
+        "exclude": [
+            {"type": "rect", "x_min": 0.9, "x_max": 1.0, "y_min": 0.9, "y_max": 1.0}
+        ]
+    }
+
+落在任一 include 区域内、且不在任何 exclude 区域内的点位会被清空。
+矩形的下边界不含、上边界含（x_min < x <= x_max），缺省的边界视为无限。
+安装了 NumPy 且点位数量不少于 VECTORIZE_THRESHOLD 时所有点位坐标一次性向量化判定，否则逐个判定。
+split() 也接受 columnar.KeymapTable，此时直接使用坐标列，不需要逐个点位取出坐标。
+"""
+import math
+
+from . import optional
+from .columnar import KeymapTable
+
+# 点位少于该数量时逐个判定更快（也省去导入 NumPy 的时间）
+VECTORIZE_THRESHOLD = 2048
+
+# 默认技能区域：与旧版 rel_x > 0.67 and rel_y > 0.79 完全一致
+DEFAULT_SKILL_AREA_SPEC = {
+    "include": [{"type": "rect", "x_min": 0.67, "y_min": 0.79}],
+    "exclude": [],
+}
+
+
+class InvalidRegionError(ValueError):
+    """技能区域描述格式错误"""
+
+
+class Rect:
+    __slots__ = ("x_min", "y_min", "x_max", "y_max")
+
+    def __init__(self, x_min=-math.inf, y_min=-math.inf, x_max=math.inf, y_max=math.inf):
+        self.x_min = x_min
+        self.y_min = y_min
+        self.x_max = x_max
+        self.y_max = y_max
+
+    def contains(self, x, y):
+        return self.x_min < x <= self.x_max and self.y_min < y <= self.y_max
+
+    def mask(self, xs, ys):
+        return (xs > self.x_min) & (xs <= self.x_max) & (ys > self.y_min) & (ys <= self.y_max)
+
+    def to_spec(self):
+        spec = {"type": "rect"}
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if not math.isinf(value):
+                spec[name] = value
+        return spec
+
+
+class Polygon:
+    __slots__ = ("points",)
+
+    def __init__(self, points):
+        self.points = points
+
+    def _edges(self):
+        points = self.points
+        for i in range(len(points)):
+            x1, y1 = points[i - 1]
+            x2, y2 = points[i]
+            if y1 != y2:
+                yield x1, y1, x2, y2
+
+    def contains(self, x, y):
+        # 射线法（奇偶规则）
+        inside = False
+        for x1, y1, x2, y2 in self._edges():
+            if (y1 > y) != (y2 > y) and x < (x2 - x1) * (y - y1) / (y2 - y1) + x1:
+                inside = not inside
+        return inside
+
+    def mask(self, xs, ys):
+        np = optional.numpy()
+        inside = np.zeros(xs.shape, dtype=bool)
+        for x1, y1, x2, y2 in self._edges():
+            crosses = (y1 > ys) != (y2 > ys)
+            inside ^= crosses & (xs < (x2 - x1) * (ys - y1) / (y2 - y1) + x1)
+        return inside
+
+    def to_spec(self):
+        return {"type": "polygon", "points": [list(p) for p in self.points]}
+
+
+def _parse_shape(spec):
+    if not isinstance(spec, dict):
+        raise InvalidRegionError(f"区域必须是对象：{spec!r}")
+    shape_type = spec.get("type", "rect")
+    try:
+        if shape_type == "rect":
+            return Rect(**{name: float(spec[name]) for name in Rect.__slots__ if name in spec})
+        if shape_type == "polygon":
+            points = [(float(x), float(y)) for x, y in spec["points"]]
+    except (KeyError, TypeError, ValueError) as e:
+        raise InvalidRegionError(f"区域格式错误：{spec!r}") from e
+    if shape_type != "polygon":
+        raise InvalidRegionError(f"不支持的区域类型：{shape_type}")
+    if len(points) < 3:
+        raise InvalidRegionError("多边形至少需要 3 个顶点")
+    return Polygon(points)
+
+
+class SkillArea:
+    """编译后的技能区域，可对大量点位一次性判定"""
+
+    def __init__(self, spec=None):
+        if spec is None:
+            spec = DEFAULT_SKILL_AREA_SPEC
+        if not isinstance(spec, dict):
+            raise InvalidRegionError("skill_area 必须是对象")
+        self.include = [_parse_shape(s) for s in spec.get("include", [])]
+        self.exclude = [_parse_shape(s) for s in spec.get("exclude", [])]
+
+    def to_spec(self):
+        return {
+            "include": [s.to_spec() for s in self.include],
+            "exclude": [s.to_spec() for s in self.exclude],
+        }
+
+    def contains(self, x, y):
+        return (any(s.contains(x, y) for s in self.include)
+                and not any(s.contains(x, y) for s in self.exclude))
+
+    def mask(self, xs, ys):
+        """对坐标数组做向量化判定，返回布尔数组（True 表示需要清空）"""
+        np = optional.numpy()
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        hit = np.zeros(xs.shape, dtype=bool)
+        for shape in self.include:
+            hit |= shape.mask(xs, ys)
+        for shape in self.exclude:
+            if not hit.any():
+                break
+            hit &= ~shape.mask(xs, ys)
+        return hit
+
+    def split(self, keymaps):
+        """把点位分成 (保留, 清空) 两个列表，保持原有顺序；传入 KeymapTable 时返回两个 KeymapTable"""
+        if isinstance(keymaps, KeymapTable):
+            return self._split_table(keymaps)
+        if not keymaps:
+            return [], []
+        np = optional.numpy() if len(keymaps) >= VECTORIZE_THRESHOLD else None
+        if np is None:
+            kept, removed = [], []
+            for km in keymaps:
+                pos = km.get("rel_work_position", {})
+                if self.contains(pos.get("rel_x", 0), pos.get("rel_y", 0)):
+                    removed.append(km)
+                else:
+                    kept.append(km)
+            return kept, removed
+        count = len(keymaps)
+        positions = [km.get("rel_work_position", {}) for km in keymaps]
+        xs = np.fromiter((p.get("rel_x", 0) for p in positions), dtype=np.float64, count=count)
+        ys = np.fromiter((p.get("rel_y", 0) for p in positions), dtype=np.float64, count=count)
+        hit = self.mask(xs, ys).tolist()
+        kept = [km for km, h in zip(keymaps, hit) if not h]
+        removed = [km for km, h in zip(keymaps, hit) if h]
+        return kept, removed
+
+    def _split_table(self, table):
+        np = optional.numpy() if len(table) >= VECTORIZE_THRESHOLD else None
+        if np is None:
+            hit = [self.contains(x, y) for x, y in zip(table.work_x, table.work_y)]
+            kept = [i for i, h in enumerate(hit) if not h]
+            removed = [i for i, h in enumerate(hit) if h]
+        else:
+            hit = self.mask(*table.numpy_columns("work_x", "work_y"))
+            kept = np.flatnonzero(~hit).tolist()
+            removed = np.flatnonzero(hit).tolist()
+        return table.take(kept), table.take(removed)
+
+
+DEFAULT_SKILL_AREA = SkillArea()
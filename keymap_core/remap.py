@@ -0,0 +1,305 @@
+"""分辨率 / 宽高比换算：把点位文件中的全部相对坐标做同一个仿射变换
+
+需要换算的坐标包括 rel_work_position、icon.rel_position，以及宏指令中的坐标
+（例如 click_rel:(0.972586,0.081568)）。所有坐标先收集到数组中一次性变换，再写回原处；
+恒等变换不会改动任何数值。模板文件中的 skill_area 也会一起换算。
+
+remap_table() 换算 columnar.KeymapTable：点位坐标直接整列计算，宏指令中的坐标只解析含宏指令的行。
+remap_file() 对不小于 columnar.COLUMNAR_THRESHOLD 的文件使用 KeymapTable，读取和写出都不展开全部点位。
+
+letterbox() 用于游戏画面保持固定宽高比、在不同屏幕上加黑边的情况：
+例如 16:9 的画面放到 16:10 的实例上，上下各留出一条黑边，画面内的相对坐标需要相应压缩。
+"""
+import math
+import os
+import time
+
+from . import jsonio, macro, optional, snapshots
+from .columnar import COLUMNAR_THRESHOLD, HAS_ACTIONS, HAS_ICON, HAS_WORK, KeymapTable
+from .macro import Action
+
+
+def parse_aspect(text):
+    """把 "16:9"、"9:16"、"1.6" 之类的写法转成宽 / 高"""
+    text = str(text).strip()
+    try:
+        if ":" in text:
+            w, h = text.split(":", 1)
+            value = float(w) / float(h)
+        else:
+            value = float(text)
+    except (ValueError, ZeroDivisionError):
+        raise ValueError(f"无法识别的宽高比：{text}") from None
+    if not value > 0:
+        raise ValueError(f"无法识别的宽高比：{text}")
+    return value
+
+
+class Transform:
+    """x' = a*x + b*y + c，y' = d*x + e*y + f"""
+    __slots__ = ("a", "b", "c", "d", "e", "f")
+
+    def __init__(self, a=1.0, b=0.0, c=0.0, d=0.0, e=1.0, f=0.0):
+        self.a, self.b, self.c, self.d, self.e, self.f = a, b, c, d, e, f
+
+    @classmethod
+    def scale(cls, sx, sy, ox=0.0, oy=0.0):
+        return cls(sx, 0.0, ox, 0.0, sy, oy)
+
+    @classmethod
+    def letterbox(cls, src_aspect, dst_aspect, content_aspect=None):
+        """游戏画面（宽高比 content_aspect，默认与源屏幕相同）居中显示、不足处留黑边时的换算"""
+        if content_aspect is None:
+            content_aspect = src_aspect
+        src = _content_rect(src_aspect, content_aspect)
+        dst = _content_rect(dst_aspect, content_aspect)
+        sx = dst[2] / src[2]
+        sy = dst[3] / src[3]
+        return cls.scale(sx, sy, dst[0] - src[0] * sx, dst[1] - src[1] * sy)
+
+    @property
+    def is_identity(self):
+        return (self.a, self.b, self.c, self.d, self.e, self.f) == (1.0, 0.0, 0.0, 0.0, 1.0, 0.0)
+
+    @property
+    def axis_aligned(self):
+        return self.b == 0.0 and self.d == 0.0
+
+    def apply(self, x, y):
+        return self.a * x + self.b * y + self.c, self.d * x + self.e * y + self.f
+
+    def apply_arrays(self, xs, ys):
+        """对两个等长的坐标序列做变换；有 NumPy 时一次性计算"""
+        np = optional.numpy()
+        if np is not None:
+            xs = np.asarray(xs, dtype=np.float64)
+            ys = np.asarray(ys, dtype=np.float64)
+            return (self.a * xs + self.b * ys + self.c).tolist(), (self.d * xs + self.e * ys + self.f).tolist()
+        out = [self.apply(x, y) for x, y in zip(xs, ys)]
+        return [p[0] for p in out], [p[1] for p in out]
+
+    def to_list(self):
+        return [self.a, self.b, self.c, self.d, self.e, self.f]
+
+    def __repr__(self):
+        return f"Transform({', '.join(f'{v:g}' for v in self.to_list())})"
+
+
+def _content_rect(screen_aspect, content_aspect):
+    """画面在屏幕中占据的相对矩形 (x, y, w, h)"""
+    if screen_aspect > content_aspect:
+        w = content_aspect / screen_aspect
+        return (1 - w) / 2, 0.0, w, 1.0
+    h = screen_aspect / content_aspect
+    return 0.0, (1 - h) / 2, 1.0, h
+
+
+def _clamp(value):
+    return min(max(value, 0.0), 1.0)
+
+
+def remap_keymaps(keymaps, transform):
+    """原地换算全部点位中的坐标，返回 (坐标个数, 超出 0~1 被截断的个数)"""
+    if transform.is_identity:
+        return 0, 0
+    positions = []   # 需要写回的 {"rel_x", "rel_y"} 字典
+    actions = []     # (所在列表, 下标, Action)
+    xs, ys = [], []
+    axs, ays = [], []  # 宏指令中的坐标，排在点位坐标之后
+    for km in keymaps:
+        for pos in (km.get("rel_work_position"), km.get("icon", {}).get("rel_position")):
+            if isinstance(pos, dict) and "rel_x" in pos and "rel_y" in pos:
+                positions.append(pos)
+                xs.append(pos["rel_x"])
+                ys.append(pos["rel_y"])
+        for field in macro.ACTION_FIELDS:
+            if field not in km:
+                continue
+            compiled = macro.compile_actions(km[field], field)
+            for j, action in enumerate(compiled):
+                coords = action.coords
+                if coords:
+                    actions.append((km[field], j, action))
+                    axs.extend(coords[0::2])
+                    ays.extend(coords[1::2])
+    new_xs, new_ys = transform.apply_arrays(xs + axs, ys + ays)
+    clamped = 0
+    k = 0
+    for pos in positions:
+        x, y = new_xs[k], new_ys[k]
+        k += 1
+        if not (0.0 <= x <= 1.0 and 0.0 <= y <= 1.0):
+            clamped += 1
+        pos["rel_x"] = _clamp(x)
+        pos["rel_y"] = _clamp(y)
+    for actions_list, j, action in actions:
+        n = len(action.coords) // 2
+        coords = []
+        for x, y in zip(new_xs[k:k + n], new_ys[k:k + n]):
+            if not (0.0 <= x <= 1.0 and 0.0 <= y <= 1.0):
+                clamped += 1
+            coords.extend((_clamp(x), _clamp(y)))
+        k += n
+        actions_list[j] = macro.format_action(Action(action.op, action.arg, coords))
+    return k, clamped
+
+
+def remap_table(table, transform):
+    """原地换算 KeymapTable 中的全部坐标，返回值与 remap_keymaps 相同"""
+    if transform.is_identity:
+        return 0, 0
+    t = transform
+    np = optional.numpy()
+    coords = clamped = 0
+    for x_column, y_column, flag in (("work_x", "work_y", HAS_WORK), ("icon_x", "icon_y", HAS_ICON)):
+        if np is not None and len(table):
+            xs, ys, flags = table.numpy_columns(x_column, y_column, "flags")
+            rows = (flags & flag) != 0
+            x, y = xs[rows], ys[rows]
+            new_xs, new_ys = t.a * x + t.b * y + t.c, t.d * x + t.e * y + t.f
+            coords += len(new_xs)
+            clamped += int((~((new_xs >= 0.0) & (new_xs <= 1.0) & (new_ys >= 0.0) & (new_ys <= 1.0))).sum())
+            xs[rows] = np.clip(new_xs, 0.0, 1.0)
+            ys[rows] = np.clip(new_ys, 0.0, 1.0)
+            continue
+        xs, ys = getattr(table, x_column), getattr(table, y_column)
+        rows = [i for i, flags in enumerate(table.flags) if flags & flag]
+        new_xs, new_ys = t.apply_arrays([xs[i] for i in rows], [ys[i] for i in rows])
+        for i, x, y in zip(rows, new_xs, new_ys):
+            if not (0.0 <= x <= 1.0 and 0.0 <= y <= 1.0):
+                clamped += 1
+            xs[i], ys[i] = _clamp(x), _clamp(y)
+        coords += len(rows)
+    table.moved = True
+    # 宏指令：只取出动作列表换算（与原点位共用列表），再整行写回
+    rows = [i for i, flags in enumerate(table.flags) if flags & HAS_ACTIONS]
+    keymaps = [table.row(i) for i in rows]
+    actions = [{field: km[field] for field in macro.ACTION_FIELDS if field in km} for km in keymaps]
+    k, c = remap_keymaps(actions, transform)
+    for i, km in zip(rows, keymaps):
+        table.replace(i, km)
+    return coords + k, clamped + c
+
+
+def remap_skill_area(spec, transform):
+    """换算模板中的 skill_area 描述，返回新的描述"""
+    result = {}
+    for group in ("include", "exclude"):
+        shapes = []
+        for shape in spec.get(group, []):
+            if shape.get("type", "rect") == "polygon":
+                points = [list(transform.apply(x, y)) for x, y in shape["points"]]
+                shapes.append(dict(shape, points=points))
+                continue
+            if not transform.axis_aligned:
+                raise ValueError("带旋转或错切的变换无法换算矩形区域")
+            new = {"type": "rect"}
+            for lo, hi, scale, offset in (("x_min", "x_max", transform.a, transform.c),
+                                          ("y_min", "y_max", transform.e, transform.f)):
+                a = shape.get(lo, -math.inf) * scale + offset
+                b = shape.get(hi, math.inf) * scale + offset
+                a, b = min(a, b), max(a, b)
+                if not math.isinf(a):
+                    new[lo] = a
+                if not math.isinf(b):
+                    new[hi] = b
+            shapes.append(new)
+        result[group] = shapes
+    return result
+
+
+def remap_file(path, transform, store=None):
+    """换算单个点位或模板文件并原子写回，返回结果字典；指定快照仓库 store 时先保存原文件"""
+    start = time.perf_counter()
+    snapshot = None
+    table = None
+    if os.path.getsize(path) >= COLUMNAR_THRESHOLD:
+        data, table = KeymapTable.load(path)
+        count = len(table)
+        coords, clamped = remap_table(table, transform)
+    else:
+        data = jsonio.load_file(path)
+        keymaps = data.get("keymaps", [])
+        count = len(keymaps)
+        coords, clamped = remap_keymaps(keymaps, transform)
+    if isinstance(data.get("skill_area"), dict) and not transform.is_identity:
+        data["skill_area"] = remap_skill_area(data["skill_area"], transform)
+    if not transform.is_identity:
+        if store is not None:
+            snapshot = store.save_file(path)
+        with jsonio.atomic_write(path) as f:
+            if table is None:
+                f.write(jsonio.dumps(data))
+            else:
+                table.write_document(f, data)
+    return {"path": path, "ok": True, "keymaps": count, "coords": coords, "clamped": clamped,
+            "snapshot": snapshot, "elapsed": time.perf_counter() - start, "error": ""}
+
+
+_worker_transform = None
+_worker_store = None
+
+
+def _init_worker(transform, snapshot_root=None):
+    global _worker_transform, _worker_store
+    _worker_transform = transform
+    _worker_store = snapshots.Store(snapshot_root) if snapshot_root else None
+
+
+def _remap_one(path):
+    start = time.perf_counter()
+    try:
+        return remap_file(path, _worker_transform, _worker_store)
+    except Exception as e:
+        return {"path": path, "ok": False, "keymaps": 0, "coords": 0, "clamped": 0,
+                "snapshot": None, "elapsed": time.perf_counter() - start, "error": str(e) or type(e).__name__}
+
+
+def remap_files(paths, transform, workers=None, snapshot=True):
+    """批量换算，按输入顺序返回结果
+
+    snapshot 为 True（默认仓库）或 snapshots.Store 时先保存原文件，整批记为一次操作，
+    结果的 snapshot 为该操作的编号。
+    """
+    paths = list(paths)
+    if not paths:
+        return []
+    store = None
+    if snapshot:
+        store = snapshot if isinstance(snapshot, snapshots.Store) else snapshots.Store()
+    initargs = (transform, store.root if store else None)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(paths)))
+    if workers == 1:
+        _init_worker(*initargs)
+        results = [_remap_one(path) for path in paths]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        chunksize = max(1, len(paths) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+            results = list(pool.map(_remap_one, paths, chunksize=chunksize))
+    if store is not None:
+        run = store.begin(f"换算坐标（{len(paths)} 个文件）")
+        for r in results:
+            if r["snapshot"] is not None:
+                run.add(r["snapshot"])
+        run_id = run.commit()
+        for r in results:
+            if r["snapshot"] is not None:
+                r["snapshot"] = run_id
+    return results
+
+
+def format_report(results, total_elapsed=None):
+    lines = [f"{'状态':<4} {'点位':>6} {'坐标':>6} {'截断':>6} {'耗时(ms)':>8}  文件"]
+    for r in results:
+        status = "OK" if r["ok"] else "失败"
+        lines.append(f"{status:<6} {r['keymaps']:>8} {r['coords']:>8} {r['clamped']:>8} "
+                     f"{r['elapsed'] * 1000:>10.1f}  {r['path']}")
+        if r["error"]:
+            lines.append(f"       └ {r['error']}")
+    ok = sum(1 for r in results if r["ok"])
+    summary = f"共 {len(results)} 个文件：成功 {ok}，失败 {len(results) - ok}"
+    if total_elapsed is not None:
+        summary += f"，总耗时 {total_elapsed:.2f} s"
+    lines.append(summary)
+    return "\n".join(lines)
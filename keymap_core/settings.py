@@ -0,0 +1,259 @@
+"""持久化设置：最近的点位文件夹、已导入的模板和文件夹索引
+
+全部保存在 paths.CONFIG_PATH 一个小文件中：
+
+    {
+        "version": 1,
+        "recent_folders": ["最近使用的文件夹", ...],
+        "template": "当前模板的哈希（null 为默认模板）",
+        "templates": {"哈希": {"name": 文件名, "path": 路径, "size": 字节数, "imported": 时间}},
+        "folders": {"文件夹（绝对路径，normcase）": 文件夹索引}
+    }
+
+模板按文件内容的 sha256 登记，解析并检查过的内容以紧凑 JSON 缓存在 paths.TEMPLATE_CACHE_DIR/<哈希>.json，
+启动时只读设置文件，第一次插入时才读取缓存（不再重新检查宏指令）；再次导入内容相同的模板时直接使用缓存。
+文件夹索引只保留最近的 MAX_RECENT 个文件夹，设置文件不会无限变大。
+修改后不立即写盘，SAVE_DELAY 秒内的多次修改合并为一次原子写入；退出前调用 flush() 写出尚未保存的修改。
+"""
+import contextlib
+import hashlib
+import os
+import threading
+import time
+
+from . import jsonio, trace
+from .folder_index import FolderIndex
+from .paths import CONFIG_PATH, LEGACY_CONFIG_PATH, TEMPLATE_CACHE_DIR
+from .regions import DEFAULT_SKILL_AREA, SkillArea
+
+SETTINGS_VERSION = 1
+MAX_RECENT = 8
+# 最后一次修改之后等待多少秒再写盘
+SAVE_DELAY = 1.0
+
+
+def _key(folder):
+    return os.path.normcase(os.path.abspath(folder))
+
+
+def template_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class Settings:
+    """设置文件的读写；可以在多个线程中修改，写盘在后台定时器线程中完成"""
+
+    def __init__(self, path=CONFIG_PATH, cache_dir=TEMPLATE_CACHE_DIR, delay=SAVE_DELAY):
+        self.path = path
+        self.cache_dir = cache_dir
+        self.delay = delay
+        self.recent_folders = []
+        self.template = None
+        self.templates = {}
+        self.folders = {}
+        self._lock = threading.RLock()
+        self._timer = None
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        try:
+            with trace.span("config.read"):
+                data = jsonio.load_file(self.path)
+        except FileNotFoundError:
+            self._migrate()
+            return
+        except (OSError, ValueError):
+            return
+        if not isinstance(data, dict):
+            return
+        self.recent_folders = [f for f in data.get("recent_folders", []) if isinstance(f, str)][:MAX_RECENT]
+        self.templates = dict(data.get("templates") or {})
+        self.template = data.get("template") if data.get("template") in self.templates else None
+        self.folders = dict(data.get("folders") or {})
+
+    def _migrate(self):
+        """第一次启动时沿用旧版配置文件中的文件夹路径"""
+        if not LEGACY_CONFIG_PATH:
+            return
+        try:
+            folder = jsonio.load_file(LEGACY_CONFIG_PATH).get("folder_path")
+        except (OSError, ValueError, AttributeError):
+            return
+        if folder:
+            self.add_recent(folder)
+
+    # ---------- 最近的文件夹 ----------
+
+    @property
+    def folder(self):
+        """最近使用的文件夹，没有记录时为空字符串"""
+        return self.recent_folders[0] if self.recent_folders else ""
+
+    def add_recent(self, folder):
+        """把文件夹移到最近列表的最前面，超出 MAX_RECENT 的文件夹连同索引一起移除"""
+        with self._lock:
+            key = _key(folder)
+            self.recent_folders = [folder] + [f for f in self.recent_folders if _key(f) != key]
+            del self.recent_folders[MAX_RECENT:]
+            self._prune_folders()
+            self.mark_dirty()
+
+    def remove_recent(self, folder):
+        with self._lock:
+            key = _key(folder)
+            self.recent_folders = [f for f in self.recent_folders if _key(f) != key]
+            self._prune_folders()
+            self.mark_dirty()
+
+    def _prune_folders(self):
+        keep = {_key(f) for f in self.recent_folders}
+        for key in [key for key in self.folders if key not in keep]:
+            del self.folders[key]
+
+    # ---------- 文件夹索引 ----------
+
+    def get_index(self, folder):
+        """取出某个文件夹的索引，没有记录时返回空索引"""
+        with self._lock:
+            return FolderIndex.from_dict(folder, self.folders.get(_key(folder), {}))
+
+    def put_index(self, index):
+        """保存文件夹索引；只保存最近列表中的文件夹"""
+        key = _key(index.folder)
+        with self._lock:
+            if key not in {_key(f) for f in self.recent_folders}:
+                return
+            self.folders[key] = index.to_dict()
+            self.mark_dirty()
+
+    # ---------- 模板 ----------
+
+    def _cache_path(self, digest):
+        return os.path.join(self.cache_dir, f"{digest}.json")
+
+    def _write_cache(self, digest, keymaps, skill_area):
+        cached = {"keymaps": keymaps}
+        if skill_area is not DEFAULT_SKILL_AREA:
+            cached["skill_area"] = skill_area.to_spec()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with jsonio.atomic_write(self._cache_path(digest)) as f:
+            f.write(jsonio.dumps(cached, compact=True))
+
+    def _read_cache(self, digest):
+        with trace.span("template.cache", digest=digest):
+            cached = jsonio.load_file(self._cache_path(digest))
+        skill_area = SkillArea(cached["skill_area"]) if "skill_area" in cached else DEFAULT_SKILL_AREA
+        return cached["keymaps"], skill_area
+
+    def import_template(self, path):
+        """导入模板文件并设为当前模板，返回 (哈希, keymaps, 技能区域)
+
+        内容与已缓存的模板相同时直接读取缓存，否则解析、检查并写入缓存。
+        模板无效时抛出 engine.InvalidTemplateError，设置不变。
+        """
+        from . import engine
+        with open(path, "rb") as f:
+            raw = f.read()
+        digest = template_digest(raw)
+        try:
+            keymaps, skill_area = self._read_cache(digest)
+        except (OSError, ValueError, KeyError, TypeError):
+            with trace.span("template.load", path=path):
+                keymaps, skill_area = engine.parse_template(jsonio.loads(raw))
+            self._write_cache(digest, keymaps, skill_area)
+        with self._lock:
+            self.templates[digest] = {"name": os.path.basename(path), "path": os.path.abspath(path),
+                                      "size": len(raw), "imported": time.time()}
+            self.template = digest
+            self.mark_dirty()
+        return digest, keymaps, skill_area
+
+    def load_template(self, digest):
+        """读取已登记的模板，返回 (keymaps, 技能区域)
+
+        缓存丢失时按登记的路径重新导入（文件内容必须没有变化），都失败时抛出 engine.InvalidTemplateError。
+        """
+        from . import engine
+        entry = self.templates.get(digest)
+        if entry is None:
+            raise engine.InvalidTemplateError("没有导入过该模板！")
+        try:
+            return self._read_cache(digest)
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        try:
+            with open(entry["path"], "rb") as f:
+                raw = f.read()
+        except OSError:
+            raw = None
+        if raw is None or template_digest(raw) != digest:
+            raise engine.InvalidTemplateError(f"模板 {entry['name']} 的缓存已丢失，原文件也已不存在或被修改，请重新导入。")
+        keymaps, skill_area = engine.parse_template(jsonio.loads(raw))
+        self._write_cache(digest, keymaps, skill_area)
+        return keymaps, skill_area
+
+    def select_template(self, digest):
+        """设为当前模板；None 为默认模板"""
+        with self._lock:
+            self.template = digest if digest in self.templates else None
+            self.mark_dirty()
+
+    def remove_template(self, digest):
+        """从登记中移除模板并删除缓存"""
+        with self._lock:
+            if self.templates.pop(digest, None) is None:
+                return
+            if self.template == digest:
+                self.template = None
+            self.mark_dirty()
+        with contextlib.suppress(OSError):
+            os.remove(self._cache_path(digest))
+
+    def template_list(self):
+        """已登记的模板，按导入时间从新到旧：[(哈希, 登记信息), ...]"""
+        with self._lock:
+            return sorted(self.templates.items(), key=lambda item: item[1].get("imported", 0), reverse=True)
+
+    # ---------- 写盘 ----------
+
+    def to_dict(self):
+        return {
+            "version": SETTINGS_VERSION,
+            "recent_folders": list(self.recent_folders),
+            "template": self.template,
+            "templates": dict(self.templates),
+            "folders": dict(self.folders),
+        }
+
+    def mark_dirty(self):
+        """记录有修改，delay 秒内没有新的修改时写盘；delay 为 0 时立即写盘"""
+        with self._lock:
+            self._dirty = True
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self.delay <= 0:
+                self._save_locked()
+                return
+            self._timer = threading.Timer(self.delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """立即写出尚未保存的修改；写盘失败时保留修改，下次再试"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._dirty:
+                with contextlib.suppress(OSError):
+                    self._save_locked()
+
+    def _save_locked(self):
+        text = jsonio.dumps(self.to_dict(), compact=True)
+        with trace.span("config.write"):
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with jsonio.atomic_write(self.path) as f:
+                f.write(text)
+        self._dirty = False
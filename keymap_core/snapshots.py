@@ -0,0 +1,455 @@
+"""修改 / 删除前的快照：按内容寻址、去重并压缩保存原文件，可以撤销单个文件或整批操作
+
+存储结构（默认在 paths.SNAPSHOT_DIR）：
+    objects/ab/cdef…   内容块，文件名是未压缩内容的 sha256，内容用 zlib 压缩
+    zdict              压缩字典（创建仓库时的默认模板），单个点位很短，有了字典压缩率能提高三倍左右
+    runs/<编号>.json    一次操作（一次批量处理、一次删除……）中每个文件的快照记录
+    history/<哈希>.json 单个文件依次出现在哪些操作中（文件名是路径的哈希）
+
+点位文件按 json.dump(indent=2) 的格式保存，每个点位以 "\\n    {" 开头，按这个位置切块：
+不同文件、同一文件的不同版本里相同的点位（例如模板点位）只保存一份。没有这种格式的文件按固定大小切块。
+块已存在时只做一次 stat，不重复写入；多个工作进程同时写同一个块也没有问题（先写临时文件再替换）。
+
+撤销单个文件只需读取它的 history 和一条 run 记录（与快照总数无关），撤销整批就是逐个恢复 run 中的文件。
+恢复本身也是一次写入，恢复前同样会拍快照，因此恢复也可以再撤销。
+总大小超过上限时按最近使用时间（恢复时会刷新）从旧到新删除整条 run，再删除不再被引用的块。
+总大小记在 usage 文件中，每次提交只加上本次新写入的字节数，不遍历整个仓库；清理时重新统计。
+其它进程（监视模式、图形界面、命令行共用一个仓库）正在进行、尚未提交的操作所用的块还没有 run 引用，
+所以 PRUNE_GRACE 秒内写入或复用过的块（复用时会刷新修改时间）清理时一律保留。
+"""
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+import time
+import uuid
+import zlib
+
+from . import jsonio, trace
+from .default_template import default_keymaps
+from .paths import SNAPSHOT_DIR
+
+# 快照总大小上限（压缩后）
+MAX_BYTES = 200 * 1024 * 1024
+# 点位之间的分隔（indent=2 时数组元素所在的缩进）
+SEPARATOR = b"\n    {"
+# 没有分隔符时每块的最大长度
+MAX_BLOCK = 256 * 1024
+READ_CHUNK = 1024 * 1024
+# 最近这么多秒内写入或复用过的块不会被清理（可能属于其它进程尚未提交的操作）
+PRUNE_GRACE = 3600
+RUN_VERSION = 1
+
+# 操作类型
+MODIFY = "modify"
+DELETE = "delete"
+OP_LABELS = {MODIFY: "修改", DELETE: "删除"}
+
+
+class SnapshotError(ValueError):
+    """快照不存在或已损坏"""
+
+
+def _blocks(f):
+    """按点位边界把文件切块，逐块产出（内存占用与文件大小无关）"""
+    buf = b""
+    while True:
+        data = f.read(READ_CHUNK)
+        if not data:
+            break
+        buf += data
+        start = 0
+        while True:
+            cut = buf.find(SEPARATOR, start + 1)
+            if cut < 0 or cut - start > MAX_BLOCK:
+                break
+            yield buf[start:cut]
+            start = cut
+        buf = buf[start:]
+        while len(buf) > MAX_BLOCK:
+            yield buf[:MAX_BLOCK]
+            buf = buf[MAX_BLOCK:]
+    if buf:
+        yield buf
+
+
+def _write_bytes(path, data):
+    """写临时文件再替换，多个进程同时写同一个块时结果相同"""
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+
+def _path_key(path):
+    return hashlib.sha256(os.path.normcase(os.path.abspath(path)).encode("utf-8")).hexdigest()[:32]
+
+
+class Store:
+    """快照仓库"""
+
+    def __init__(self, root=None):
+        self.root = root or SNAPSHOT_DIR
+        self.objects = os.path.join(self.root, "objects")
+        self.runs = os.path.join(self.root, "runs")
+        self.history = os.path.join(self.root, "history")
+        self._zdict = None
+
+    # ---- 内容块 ----
+
+    def zdict(self):
+        """压缩字典：第一次使用时写入仓库，之后一直用同一份（模板改了也不影响已保存的块）"""
+        if self._zdict is None:
+            path = os.path.join(self.root, "zdict")
+            if not os.path.exists(path):
+                os.makedirs(self.root, exist_ok=True)
+                text = json.dumps({"keymaps": default_keymaps()}, ensure_ascii=False, indent=2)
+                _write_bytes(path, text.encode("utf-8")[-32768:])
+            with open(path, "rb") as f:
+                self._zdict = f.read()
+        return self._zdict
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects, digest[:2], digest[2:])
+
+    def _put(self, block):
+        """保存一个块，返回 (哈希, 新写入的字节数)"""
+        digest = hashlib.sha256(block).hexdigest()
+        path = self._object_path(digest)
+        try:
+            os.utime(path)  # 已有的块只刷新修改时间，清理时才知道它刚被用过
+            return digest, 0
+        except FileNotFoundError:
+            pass
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        compressor = zlib.compressobj(zdict=self.zdict())
+        data = compressor.compress(block) + compressor.flush()
+        _write_bytes(path, data)
+        trace.count("snapshot.bytes", len(data))
+        return digest, len(data)
+
+    def _get(self, digest):
+        try:
+            with open(self._object_path(digest), "rb") as f:
+                decompressor = zlib.decompressobj(zdict=self.zdict())
+                block = decompressor.decompress(f.read()) + decompressor.flush()
+        except (OSError, zlib.error) as e:
+            raise SnapshotError(f"快照内容缺失或已损坏：{digest[:12]}（{e}）") from None
+        if hashlib.sha256(block).hexdigest() != digest:
+            raise SnapshotError(f"快照内容已损坏：{digest[:12]}")
+        return block
+
+    # ---- 拍快照 ----
+
+    def save_file(self, path, op=MODIFY):
+        """保存文件当前内容，返回快照记录（交给 Run.add 记入本次操作）"""
+        path = os.path.abspath(path)
+        with trace.span("snapshot", path=path):
+            digest = hashlib.sha256()
+            blocks = []
+            size = stored = 0
+            with open(path, "rb") as f:
+                for block in _blocks(f):
+                    digest.update(block)
+                    size += len(block)
+                    block_digest, written = self._put(block)
+                    blocks.append(block_digest)
+                    stored += written
+        # stored 只用于统计仓库大小，Run.add 时取出，不写入 run 记录
+        return {"path": path, "op": op, "time": time.time(), "size": size, "sha256": digest.hexdigest(),
+                "blocks": blocks, "stored": stored}
+
+    def read(self, entry):
+        """还原快照记录对应的文件内容（bytes），校验整体哈希"""
+        data = b"".join(self._get(digest) for digest in entry["blocks"])
+        if hashlib.sha256(data).hexdigest() != entry["sha256"]:
+            raise SnapshotError(f"快照内容已损坏：{entry['path']}")
+        return data
+
+    # ---- 操作记录 ----
+
+    def begin(self, label):
+        return Run(self, label)
+
+    def load_run(self, run_id):
+        try:
+            with open(os.path.join(self.runs, run_id + ".json"), "r", encoding="utf-8") as f:
+                run = json.load(f)
+        except (OSError, ValueError):
+            raise SnapshotError(f"找不到操作记录：{run_id}") from None
+        if run.get("version") != RUN_VERSION:
+            raise SnapshotError(f"操作记录版本不兼容：{run_id}")
+        return run
+
+    def list_runs(self, limit=None):
+        """操作记录摘要（不含文件明细），新的在前，limit 限定条数"""
+        try:
+            names = [name[:-5] for name in os.listdir(self.runs) if name.endswith(".json")]
+        except FileNotFoundError:
+            return []
+        runs = []
+        for run_id in sorted(names, reverse=True)[:limit]:
+            try:
+                run = self.load_run(run_id)
+            except SnapshotError:
+                continue
+            runs.append({"id": run_id, "time": run["time"], "label": run["label"], "files": len(run["files"])})
+        return runs
+
+    def _history_path(self, path):
+        return os.path.join(self.history, _path_key(path) + ".json")
+
+    def file_history(self, path):
+        """文件出现过的操作编号，新的在后（可能含已被清理的操作）"""
+        try:
+            with open(self._history_path(path), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def _add_history(self, path, run_id):
+        # history 只是加快查找的索引，不做 fsync；丢失时仍可按操作编号恢复
+        history = self.file_history(path)
+        history.append(run_id)
+        os.makedirs(self.history, exist_ok=True)
+        _write_bytes(self._history_path(path), json.dumps(history).encode("utf-8"))
+
+    def find(self, path, run_id=None):
+        """文件在某次操作（默认最近一次仍保留的操作）之前的快照记录，返回 (操作编号, 记录)"""
+        path = os.path.abspath(path)
+        candidates = [run_id] if run_id else reversed(self.file_history(path))
+        for candidate in candidates:
+            try:
+                entry = self.load_run(candidate)["files"].get(path)
+            except SnapshotError:
+                if run_id:
+                    raise
+                continue
+            if entry is not None:
+                return candidate, entry
+        raise SnapshotError(f"没有该文件的快照：{path}")
+
+    # ---- 恢复 ----
+
+    def restore_entries(self, entries, label):
+        """把文件恢复为快照中的内容；当前内容先拍快照。返回 (恢复前内容所在操作的编号或 None, 结果列表)"""
+        run = self.begin(label)
+        results = []
+        try:
+            for entry in entries:
+                path = entry["path"]
+                start = time.perf_counter()
+                try:
+                    data = self.read(entry)
+                    changed = True
+                    if os.path.exists(path):
+                        current = self.save_file(path, MODIFY)
+                        changed = current["sha256"] != entry["sha256"]
+                        if changed:
+                            run.add(current)
+                    if changed:
+                        os.makedirs(os.path.dirname(path), exist_ok=True)
+                        with jsonio.atomic_write(path, mode="wb") as f:
+                            f.write(data)
+                    results.append({"path": path, "ok": True, "changed": changed, "op": entry["op"],
+                                    "elapsed": time.perf_counter() - start, "error": ""})
+                except (OSError, SnapshotError) as e:
+                    results.append({"path": path, "ok": False, "changed": False, "op": entry["op"],
+                                    "elapsed": time.perf_counter() - start, "error": str(e)})
+        finally:
+            run_id = run.commit()
+        return run_id, results
+
+    def restore_file(self, path, run_id=None):
+        """撤销单个文件：恢复为最近一次（或指定操作）修改 / 删除之前的内容"""
+        found_id, entry = self.find(path, run_id)
+        self._touch(found_id)
+        return self.restore_entries([entry], f"恢复 {os.path.basename(path)}")
+
+    def restore_run(self, run_id):
+        """撤销整次操作：把其中每个文件恢复为操作之前的内容"""
+        run = self.load_run(run_id)
+        self._touch(run_id)
+        return self.restore_entries(run["files"].values(), f"撤销 {run['label']}")
+
+    def _touch(self, run_id):
+        with contextlib.suppress(OSError):
+            os.utime(os.path.join(self.runs, run_id + ".json"))
+
+    # ---- 清理 ----
+
+    def size(self):
+        """快照占用的磁盘空间（字节），遍历整个仓库统计"""
+        total = 0
+        for folder, _, files in os.walk(self.root):
+            for name in files:
+                with contextlib.suppress(OSError):
+                    total += os.path.getsize(os.path.join(folder, name))
+        return total
+
+    def _usage_path(self):
+        return os.path.join(self.root, "usage")
+
+    def _write_usage(self, total):
+        with contextlib.suppress(OSError):
+            _write_bytes(self._usage_path(), str(max(int(total), 0)).encode("ascii"))
+
+    def add_usage(self, delta):
+        """把新写入的字节数计入 usage，返回估计的总大小（多个进程同时提交时可能略有偏差，清理时会校正）"""
+        try:
+            with open(self._usage_path(), "rb") as f:
+                total = int(f.read()) + delta
+        except (OSError, ValueError):
+            total = self.size()
+        self._write_usage(total)
+        return total
+
+    def prune(self, max_bytes=MAX_BYTES, max_age=None, keep=1):
+        """删除最久未使用的操作记录直到总大小不超过 max_bytes，并删除早于 max_age 秒的记录。
+        最近的 keep 条记录总会保留。返回 (删除的记录数, 释放的字节数)"""
+        runs = []
+        refs = {}
+        try:
+            names = [name for name in os.listdir(self.runs) if name.endswith(".json")]
+        except FileNotFoundError:
+            return 0, 0
+        for name in names:
+            path = os.path.join(self.runs, name)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    blocks = {digest for entry in json.load(f)["files"].values() for digest in entry["blocks"]}
+                st = os.stat(path)
+            except (OSError, ValueError, KeyError):
+                continue
+            runs.append((st.st_mtime, name, path, st.st_size, blocks))
+            for digest in blocks:
+                refs[digest] = refs.get(digest, 0) + 1
+        runs.sort()
+        sizes = {}
+        recent = set()
+        total = 0
+        fresh = time.time() - PRUNE_GRACE
+        for folder, _, files in os.walk(self.objects):
+            for name in files:
+                digest = os.path.basename(folder) + name
+                with contextlib.suppress(OSError):
+                    st = os.stat(os.path.join(folder, name))
+                    sizes[digest] = st.st_size
+                    total += st.st_size
+                    if st.st_mtime >= fresh:
+                        recent.add(digest)
+        total += sum(run[3] for run in runs)
+        before = total
+        cutoff = time.time() - max_age if max_age is not None else None
+        removed = 0
+        garbage = [digest for digest in sizes if digest not in refs and digest not in recent]
+        total -= sum(sizes[digest] for digest in garbage)
+        for mtime, name, path, run_size, blocks in runs[:max(len(runs) - keep, 0)]:
+            if total <= max_bytes and (cutoff is None or mtime >= cutoff):
+                break
+            with contextlib.suppress(OSError):
+                os.remove(path)
+            removed += 1
+            total -= run_size
+            for digest in blocks:
+                refs[digest] -= 1
+                if refs[digest] == 0 and digest in sizes and digest not in recent:
+                    garbage.append(digest)
+                    total -= sizes[digest]
+        for digest in garbage:
+            with contextlib.suppress(OSError):
+                os.remove(self._object_path(digest))
+        if removed:
+            self._prune_history()
+        self._write_usage(total)
+        return removed, before - total
+
+    def _prune_history(self):
+        try:
+            names = os.listdir(self.history)
+        except FileNotFoundError:
+            return
+        alive = {name[:-5] for name in os.listdir(self.runs) if name.endswith(".json")}
+        for name in names:
+            path = os.path.join(self.history, name)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    history = [run_id for run_id in json.load(f) if run_id in alive]
+            except (OSError, ValueError):
+                continue
+            if history:
+                _write_bytes(path, json.dumps(history).encode("utf-8"))
+            else:
+                with contextlib.suppress(OSError):
+                    os.remove(path)
+
+
+class Run:
+    """一次操作：收集各文件的快照记录，结束时写出 run 记录并更新各文件的 history"""
+
+    def __init__(self, store, label):
+        self.store = store
+        self.label = label
+        self.time = time.time()
+        # 编号按时间排序，末尾的随机串避免多个进程同时开始时重名
+        self.id = (time.strftime("%Y%m%d-%H%M%S", time.localtime(self.time))
+                   + f"-{int(self.time * 1000) % 1000:03d}-{uuid.uuid4().hex[:4]}")
+        self.files = {}
+        self.stored = 0
+
+    def add(self, entry):
+        # 同一次操作中同一文件只保留第一次的快照，即操作之前的内容
+        entry = dict(entry)
+        self.stored += entry.pop("stored", 0)
+        self.files.setdefault(entry["path"], entry)
+
+    def snapshot(self, path, op=MODIFY):
+        self.add(self.store.save_file(path, op))
+
+    def commit(self, max_bytes=MAX_BYTES):
+        """写出记录；没有任何文件时不写。总大小超过 max_bytes 时顺便清理旧记录"""
+        if not self.files:
+            return None
+        with trace.span("snapshot.commit", files=len(self.files)):
+            os.makedirs(self.store.runs, exist_ok=True)
+            run_path = os.path.join(self.store.runs, self.id + ".json")
+            with jsonio.atomic_write(run_path) as f:
+                json.dump({"version": RUN_VERSION, "id": self.id, "time": self.time, "label": self.label,
+                           "files": self.files}, f, ensure_ascii=False)
+            for path in self.files:
+                self.store._add_history(path, self.id)
+            total = self.store.add_usage(self.stored + os.path.getsize(run_path))
+            if max_bytes is not None and total > max_bytes:
+                self.store.prune(max_bytes)
+        return self.id
+
+
+def format_runs(runs):
+    lines = [f"{'编号':<24} {'时间':<19} {'文件数':>6}  操作"]
+    for run in runs:
+        when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(run["time"]))
+        lines.append(f"{run['id']:<26} {when:<19} {run['files']:>8}  {run['label']}")
+    return "\n".join(lines)
+
+
+def format_restore(run_id, results):
+    lines = []
+    for r in results:
+        if not r["ok"]:
+            lines.append(f"失败  {r['path']}\n      └ {r['error']}")
+        elif r["changed"]:
+            lines.append(f"已恢复  {r['path']}" + ("（重新创建被删除的文件）" if r["op"] == DELETE else ""))
+        else:
+            lines.append(f"未改动  {r['path']}（内容与快照相同）")
+    ok = sum(1 for r in results if r["ok"])
+    summary = f"共 {len(results)} 个文件：成功 {ok}，失败 {len(results) - ok}"
+    if run_id:
+        summary += f"；恢复前的内容已保存为 {run_id}"
+    lines.append(summary)
+    return "\n".join(lines)
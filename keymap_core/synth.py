@@ -0,0 +1,96 @@
+"""生成模拟的 MuMu 点位文件，用于性能测试
+
+点位的结构照搬默认模板中的 Click / Macro 点位，位置、按键和宏指令随机生成；
+同样的 seed 总是生成同样的内容，便于前后两次测试结果对比。
+"""
+import copy
+import functools
+import os
+import random
+
+from . import jsonio
+from .default_template import default_keymaps
+
+# 随机点位使用的按键：(显示名, scan_code, virtual_key)
+KEYS = (
+    [(ch, sc, ord(ch)) for ch, sc in (
+        ("Q", 16), ("W", 17), ("E", 18), ("R", 19), ("T", 20), ("Y", 21), ("U", 22), ("I", 23), ("O", 24),
+        ("P", 25), ("A", 30), ("S", 31), ("D", 32), ("F", 33), ("G", 34), ("H", 35), ("J", 36), ("K", 37),
+        ("L", 38), ("Z", 44), ("X", 45), ("C", 46), ("V", 47), ("B", 48), ("N", 49), ("M", 50))]
+    + [(str(n % 10), 1 + n, 48 + n % 10) for n in range(1, 11)]
+    + [("Space", 57, 32), ("Shift", 42, 16), ("Ctrl", 29, 17), ("Alt", 56, 18), ("Tab", 15, 9)]
+)
+
+# 文件名使用的包名，与 naming.DISPLAY_PREFIXES 对应
+PACKAGES = ("com.nexon.bluearchive", "com.RoamingStar.BlueArchive", "com.RoamingStar.BlueArchive.bilibili")
+
+
+@functools.lru_cache(maxsize=None)
+def _prototype(keymap_type):
+    return next(km for km in default_keymaps() if km["type"] == keymap_type)
+
+
+def _point(rng):
+    return f"({rng.random():.6f},{rng.random():.6f})"
+
+
+def _random_actions(rng):
+    """随机宏：循环点击、曲线滑动或带等待的连点"""
+    kind = rng.randrange(3)
+    if kind == 0:
+        return ["start_loop:until_release", f"click_rel:{_point(rng)}", f"sleep:{rng.randrange(1, 100)}",
+                "stop_loop"]
+    if kind == 1:
+        points = ";".join(_point(rng) for _ in range(rng.randrange(2, 6)))
+        return ["start_loop:until_release", "curve_first_point_sleep_time:1",
+                "curve_last_point_sleep_time:until_release_cmd", f"curve_rel:{points};mouse",
+                "curve_release", "stop_loop"]
+    actions = []
+    for _ in range(rng.randrange(2, 8)):
+        actions.append(f"click_rel:{_point(rng)}")
+        actions.append(f"sleep:{rng.randrange(10, 300)}")
+    return actions
+
+
+def make_keymap(rng, macro_ratio=0.5):
+    """生成一个随机点位"""
+    km = copy.deepcopy(_prototype("Macro" if rng.random() < macro_ratio else "Click"))
+    x, y = rng.random(), rng.random()
+    km["icon"]["rel_position"] = {"rel_x": x, "rel_y": y}
+    km["rel_work_position"] = {"rel_x": x, "rel_y": y}
+    text, scan_code, virtual_key = rng.choice(KEYS)
+    km["key"] = {"device": "keyboard", "scan_code": scan_code, "text": text, "virtual_key": virtual_key}
+    if km["type"] == "Macro":
+        km["press_actions"] = _random_actions(rng)
+        km["release_actions"] = []
+    return km
+
+
+def generate_keymaps(count, seed=0, macro_ratio=0.5):
+    rng = random.Random(seed)
+    return [make_keymap(rng, macro_ratio) for _ in range(count)]
+
+
+def write_file(path, count, seed=0, macro_ratio=0.5):
+    """写出一个含 count 个点位的文件；点位很多时逐条写出，内存占用与数量无关"""
+    rng = random.Random(seed)
+    with jsonio.atomic_write(path) as f:
+        writer = jsonio.StreamWriter(f)
+        writer.begin()
+        writer.member("version", 3)
+        writer.begin_array("keymaps")
+        for _ in range(count):
+            writer.item(make_keymap(rng, macro_ratio))
+        writer.end_array()
+        writer.end()
+    return path
+
+
+def write_folder(folder, files, keymaps_per_file, seed=0, macro_ratio=0.5):
+    """在 folder 中生成 files 个点位文件，返回路径列表"""
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for i in range(files):
+        name = f"{PACKAGES[i % len(PACKAGES)]}-{i:05d}.json"
+        paths.append(write_file(os.path.join(folder, name), keymaps_per_file, seed + i, macro_ratio))
+    return paths
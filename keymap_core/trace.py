@@ -0,0 +1,185 @@
+"""可选的分阶段计时：记录各处理阶段的耗时和计数，导出为 Chrome trace / Perfetto 可以打开的 JSON
+
+默认关闭，关闭时 span() 返回一个共享的空对象，几乎没有开销。开启方式：
+    设置环境变量 KEYMAP_TRACE=输出文件.json（图形界面和命令行都有效），或
+    命令行 python keymap_cli.py --trace 输出文件.json patch ...
+程序退出时写出文件，并在标准错误输出中打印按阶段汇总的耗时表。
+
+生成的文件可以在 chrome://tracing 或 https://ui.perfetto.dev 中打开。
+多进程批量处理时，工作进程记录的事件随结果一起传回主进程。
+"""
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+
+ENV_VAR = "KEYMAP_TRACE"
+
+_events = []
+_totals = {}
+_lock = threading.Lock()
+_enabled = False
+_output = None
+_registered = False
+
+
+class _Span:
+    __slots__ = ("name", "args", "ts", "start")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.ts = time.time_ns() / 1000
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        dur = (time.perf_counter() - self.start) * 1e6
+        _record({"name": self.name, "ph": "X", "ts": self.ts, "dur": dur,
+                 "pid": os.getpid(), "tid": threading.get_ident(), "args": self.args})
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def _record(event):
+    with _lock:
+        _events.append(event)
+
+
+def enabled():
+    return _enabled
+
+
+def enable(output=None):
+    """开启记录；指定 output 时在程序退出时写出 trace 文件并打印汇总"""
+    global _enabled, _output, _registered
+    _enabled = True
+    if output:
+        _output = output
+        if not _registered:
+            atexit.register(_at_exit)
+            _registered = True
+
+
+def start_worker():
+    """在工作进程中开启记录（fork 出来的进程会继承主进程已记录的事件，需要先清空）"""
+    global _enabled, _output
+    with _lock:
+        _events.clear()
+        _totals.clear()
+    _enabled = True
+    _output = None
+
+
+def span(name, **args):
+    """记录一个阶段：with trace.span("json.parse", path=path): ..."""
+    return _Span(name, args) if _enabled else _NO_SPAN
+
+
+def count(name, value=1):
+    """累加计数（点位数、写入字节数等）"""
+    if not _enabled:
+        return
+    with _lock:
+        total = _totals.get(name, 0) + value
+        _totals[name] = total
+        _events.append({"name": name, "ph": "C", "ts": time.time_ns() / 1000,
+                        "pid": os.getpid(), "args": {"value": total}})
+
+
+def drain():
+    """取出并清空已记录的事件（工作进程把它们随结果传回主进程）"""
+    with _lock:
+        events = list(_events)
+        _events.clear()
+    return events
+
+
+def extend(events):
+    with _lock:
+        _events.extend(events)
+
+
+def events():
+    with _lock:
+        return list(_events)
+
+
+def export(path):
+    """写出 Chrome trace JSON"""
+    from . import jsonio
+    data = {"traceEvents": events(), "displayTimeUnit": "ms"}
+    with jsonio.atomic_write(path) as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+def summary(trace_events=None):
+    """按阶段汇总：{"spans": {名称: {count, total_ms, max_ms}}, "counters": {名称: 合计}}"""
+    if trace_events is None:
+        trace_events = events()
+    spans = {}
+    last = {}
+    for e in trace_events:
+        if e["ph"] == "X":
+            s = spans.setdefault(e["name"], {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            ms = e["dur"] / 1000
+            s["count"] += 1
+            s["total_ms"] += ms
+            s["max_ms"] = max(s["max_ms"], ms)
+        elif e["ph"] == "C":
+            # 计数事件记录的是各进程内的累计值，取每个进程的最大值再相加
+            key = (e["pid"], e["name"])
+            last[key] = max(last.get(key, 0), e["args"]["value"])
+    counters = {}
+    for (_, name), value in last.items():
+        counters[name] = counters.get(name, 0) + value
+    return {"spans": spans, "counters": counters}
+
+
+def format_summary(result):
+    lines = [f"{'阶段':<20} {'次数':>6} {'合计(ms)':>10} {'平均(ms)':>10} {'最长(ms)':>10}"]
+    for name, s in sorted(result["spans"].items(), key=lambda item: -item[1]["total_ms"]):
+        lines.append(f"{name:<22} {s['count']:>8} {s['total_ms']:>12.1f} {s['total_ms'] / s['count']:>12.2f} "
+                     f"{s['max_ms']:>12.2f}")
+    for name, value in sorted(result["counters"].items()):
+        lines.append(f"{name:<22} {value:>8}")
+    return "\n".join(lines)
+
+
+def _at_exit():
+    if not _output:
+        return
+    try:
+        export(_output)
+    except OSError as e:
+        print(f"写出 trace 文件失败：{e}", file=sys.stderr)
+        return
+    print(format_summary(summary()), file=sys.stderr)
+    print(f"trace 已写入：{_output}", file=sys.stderr)
+
+
+def _enable_from_env():
+    # 只在主进程中按环境变量开启，工作进程由 engine 通过 start_worker() 开启
+    import multiprocessing
+    if multiprocessing.parent_process() is None:
+        enable(os.environ[ENV_VAR])
+
+
+if os.environ.get(ENV_VAR):
+    _enable_from_env()
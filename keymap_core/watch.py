@@ -0,0 +1,270 @@
+"""监视模式：持续轮询点位文件夹，新建或被改写的点位文件自动插入模板
+
+不依赖操作系统的文件通知，每隔 interval 秒用 FolderIndex 增量扫描一次（只 stat，不读文件），
+所以网络盘、虚拟机共享文件夹上也能用。一个文件夹在 debounce 秒内没有新的变化之后，
+才把这段时间内新增 / 修改的文件整批交给 engine.patch_files（与图形界面“插入宏点位并保存”相同），
+模拟器一次写出多个文件时只处理一次。已处理过且没有再被改写的文件（包括刚写出的文件本身）
+由处理记录（manifest）直接跳过，不会反复处理。
+启动时先扫描一遍各文件夹作为基准，只处理此后新建或被改写的文件；
+initial 为 True 时启动时已有的文件也当作新文件处理一遍（补上停止监视期间的变化）。
+
+扫描和插入都放在线程池中执行，事件循环只负责调度；同一时间只处理一个文件夹。
+status_address 不为空时在该地址提供状态查询：任何 HTTP 请求（或直接连接）都返回一份 JSON，
+包括排队的文件数、各文件夹上次扫描和处理的时间、结果和最近的错误。
+"""
+import asyncio
+import collections
+import functools
+import os
+import time
+
+from . import engine, jsonio
+from .folder_index import FolderIndex
+
+INTERVAL = 2.0
+DEBOUNCE = 1.5
+# 状态中保留的最近错误条数
+MAX_ERRORS = 20
+MISSING = "点位文件夹不存在"
+
+
+class WatchedFolder:
+    """一个被监视的文件夹及其处理参数（与 fleet 实例的格式相同）"""
+
+    def __init__(self, instance, keymaps=None, skill_area=None):
+        self.name = instance["name"]
+        self.folder = instance["folder"]
+        self.keymaps = keymaps
+        self.skill_area = skill_area
+        self.policy = instance.get("on_conflict")
+        self.output_format = instance.get("format")
+        self.relocate_icons = bool(instance.get("relocate_icons"))
+        self.index = FolderIndex(self.folder)
+        self.pending = {}       # 文件名 → 最后一次发现变化的时间（monotonic）
+        self.queued = set()     # 已到期、等待处理的文件名
+        self.in_queue = False
+        self.last_scan = None
+        self.last_run = None
+        self.last_error = ""
+        self.totals = {engine.PATCHED: 0, engine.SKIPPED: 0, engine.FAILED: 0}
+
+    def status(self):
+        return {
+            "name": self.name,
+            "folder": self.folder,
+            "files": len(self.index.files),
+            "pending": len(self.pending),
+            "queued": len(self.queued),
+            "last_scan": self.last_scan,
+            "last_run": self.last_run,
+            "last_error": self.last_error,
+            "totals": dict(self.totals),
+        }
+
+
+class WatchDaemon:
+    """监视若干文件夹；run() 一直运行到 stop() 被调用或任务被取消
+
+    log(text) 用于输出每次处理的结果（默认不输出）。其余参数与 engine.patch_files 相同。
+    """
+
+    def __init__(self, folders, interval=INTERVAL, debounce=DEBOUNCE, workers=None, snapshot=True,
+                 status_address=None, log=None, initial=False):
+        self.folders = list(folders)
+        self.initial = initial
+        self.interval = interval
+        self.debounce = debounce
+        self.workers = workers
+        self.snapshot = snapshot
+        self.status_address = status_address
+        self.log = log or (lambda text: None)
+        self.started = None
+        self.running = None
+        self.runs = 0
+        self.errors = collections.deque(maxlen=MAX_ERRORS)
+        self._queue = None
+        self._stop = None
+        self._server = None
+
+    # ---------- 状态 ----------
+
+    def queue_depth(self):
+        """尚未处理的文件数（包括还在等待变化停止的文件）"""
+        return sum(len(f.pending) + len(f.queued) for f in self.folders)
+
+    def status(self):
+        return {
+            "started": self.started,
+            "uptime": time.time() - self.started if self.started else 0.0,
+            "interval": self.interval,
+            "debounce": self.debounce,
+            "queue_depth": self.queue_depth(),
+            "running": self.running,
+            "runs": self.runs,
+            "folders": [f.status() for f in self.folders],
+            "errors": list(self.errors),
+        }
+
+    def _error(self, folder, text):
+        folder.last_error = text
+        self.errors.append({"time": time.time(), "folder": folder.name, "error": text})
+        self.log(f"[{folder.name}] {text}")
+
+    async def _handle_status(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            parts = request.decode("latin-1").split()
+            path = parts[1] if len(parts) > 1 else "/"
+            if path.split("?")[0] in ("/", "/status"):
+                code, body = "200 OK", jsonio.dumps(self.status())
+            else:
+                code, body = "404 Not Found", jsonio.dumps({"error": "not found"})
+            data = body.encode("utf-8")
+            if parts:
+                writer.write(f"HTTP/1.0 {code}\r\nContent-Type: application/json; charset=utf-8\r\n"
+                             f"Content-Length: {len(data)}\r\n\r\n".encode("latin-1"))
+            writer.write(data)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    # ---------- 扫描与处理 ----------
+
+    async def _baseline(self):
+        """记下各文件夹中已有的文件，第一次轮询时不把它们当作新文件"""
+        loop = asyncio.get_running_loop()
+        for folder in self.folders:
+            try:
+                await loop.run_in_executor(None, folder.index.scan)
+            except OSError as e:
+                self._error(folder, f"扫描失败：{e}")
+                continue
+            folder.last_scan = time.time()
+
+    async def _poll(self):
+        loop = asyncio.get_running_loop()
+        if not self.initial:
+            await self._baseline()
+            await asyncio.sleep(self.interval)
+        while True:
+            for folder in self.folders:
+                try:
+                    added, removed, changed = await loop.run_in_executor(None, folder.index.scan)
+                except OSError as e:
+                    self._error(folder, f"扫描失败：{e}")
+                    continue
+                now = time.monotonic()
+                folder.last_scan = time.time()
+                if folder.index.dir_mtime_ns is None:
+                    if folder.last_error != MISSING:
+                        self._error(folder, MISSING)
+                    continue
+                if folder.last_error == MISSING:
+                    folder.last_error = ""
+                for name in removed:
+                    folder.pending.pop(name, None)
+                    folder.queued.discard(name)
+                for name in added + changed:
+                    folder.pending[name] = now
+                if folder.pending and now - max(folder.pending.values()) >= self.debounce:
+                    folder.queued.update(folder.pending)
+                    folder.pending.clear()
+                    if not folder.in_queue:
+                        folder.in_queue = True
+                        self._queue.put_nowait(folder)
+            await asyncio.sleep(self.interval)
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            folder = await self._queue.get()
+            folder.in_queue = False
+            names = sorted(folder.queued)
+            folder.queued.clear()
+            paths = [os.path.join(folder.folder, name) for name in names
+                     if os.path.isfile(os.path.join(folder.folder, name))]
+            if not paths:
+                continue
+            self.running = folder.name
+            start = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(None, functools.partial(
+                    engine.patch_files, paths, folder.keymaps, folder.skill_area,
+                    workers=1 if len(paths) == 1 else self.workers, policy=folder.policy,
+                    relocate_icons=folder.relocate_icons, snapshot=self.snapshot,
+                    output_format=folder.output_format))
+            except Exception as e:
+                self._error(folder, f"处理失败：{e}")
+                continue
+            finally:
+                self.running = None
+            self.runs += 1
+            self._record(folder, results, time.perf_counter() - start)
+
+    def _record(self, folder, results, elapsed):
+        counts = {engine.PATCHED: 0, engine.SKIPPED: 0, engine.FAILED: 0}
+        for r in results:
+            counts[r["status"]] = counts.get(r["status"], 0) + 1
+        for status in folder.totals:
+            folder.totals[status] += counts[status]
+        folder.last_run = {"time": time.time(), "files": len(results), "patched": counts[engine.PATCHED],
+                           "skipped": counts[engine.SKIPPED], "failed": counts[engine.FAILED],
+                           "elapsed": elapsed}
+        for r in results:
+            if r["status"] == engine.FAILED:
+                self._error(folder, f"{os.path.basename(r['path'])}：{r['error']}")
+        if counts[engine.PATCHED]:
+            self.log(f"[{folder.name}] 已插入 {counts[engine.PATCHED]} 个文件"
+                     f"（跳过 {counts[engine.SKIPPED]}，失败 {counts[engine.FAILED]}，{elapsed * 1000:.0f} ms）："
+                     + "，".join(os.path.basename(r["path"]) for r in results if r["status"] == engine.PATCHED))
+        if not counts[engine.FAILED]:
+            folder.last_error = ""
+
+    # ---------- 运行 ----------
+
+    async def run(self):
+        self.started = time.time()
+        self._queue = asyncio.Queue()
+        self._stop = asyncio.Event()
+        if self.status_address:
+            host, port = self.status_address
+            self._server = await asyncio.start_server(self._handle_status, host, port)
+            self.log(f"状态查询：http://{host}:{port}/status")
+        tasks = [asyncio.create_task(self._poll()), asyncio.create_task(self._worker())]
+        try:
+            await self._stop.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if self._server is not None:
+                self._server.close()
+                await self._server.wait_closed()
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+
+
+def from_instances(instances, cache=None):
+    """按 fleet 实例列表生成 WatchedFolder 列表；模板、技能区域或处理参数有误时抛出 ValueError / OSError"""
+    cache = cache or engine.TemplateCache()
+    folders = []
+    for instance in instances:
+        keymaps, skill_area = cache.template(instance.get("template"))
+        skill_area = cache.region(instance.get("region")) or skill_area
+        engine.make_options(keymaps, skill_area, policy=instance.get("on_conflict"),
+                            output_format=instance.get("format"))
+        folders.append(WatchedFolder(instance, keymaps, skill_area))
+    return folders
+
+
+def parse_address(text):
+    """把 host:port 或 port 解析为 (host, port)，host 默认 127.0.0.1"""
+    host, _, port = text.rpartition(":")
+    try:
+        return host or "127.0.0.1", int(port)
+    except ValueError:
+        raise ValueError(f"状态地址格式应为 host:port 或 port（实际为 {text}）") from None
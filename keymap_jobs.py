@@ -0,0 +1,145 @@
+"""后台任务：把文件读写放到 QThreadPool 中执行，结果通过信号回到界面线程"""
+import os
+import threading
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+from keymap_core import engine, snapshots
+
+
+class JobSignals(QObject):
+    progress = pyqtSignal(int, int)   # 已完成数量, 总数
+    finished = pyqtSignal(object)     # 任务函数的返回值
+    failed = pyqtSignal(object)       # 任务函数抛出的异常
+    done = pyqtSignal()               # 无论成功与否最后都会发出
+
+
+class Job(QRunnable):
+    """一个后台任务：func(job, *args) 在工作线程中执行，可通过 job.report() 汇报进度"""
+
+    def __init__(self, title, func, *args):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.title = title
+        self.func = func
+        self.args = args
+        self.signals = JobSignals()
+        self.cancel_event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def report(self, done, total):
+        self.signals.progress.emit(done, total)
+
+    def run(self):
+        try:
+            result = self.func(self, *self.args)
+        except Exception as e:
+            self.signals.failed.emit(e)
+        else:
+            self.signals.finished.emit(result)
+        finally:
+            self.signals.done.emit()
+
+
+class JobQueue(QObject):
+    """按提交顺序逐个执行任务的队列（单线程，保证同一文件的操作不会交错）"""
+
+    started = pyqtSignal(object)   # 开始执行的 Job
+    changed = pyqtSignal(int)      # 队列中尚未完成的任务数
+    idle = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self.jobs = []
+        self.current = None
+
+    def submit(self, job):
+        job.signals.done.connect(lambda: self._on_done(job))
+        self.jobs.append(job)
+        if self.current is None:
+            self._start(job)
+        self.changed.emit(len(self.jobs))
+        return job
+
+    def _start(self, job):
+        self.current = job
+        self.started.emit(job)
+        self.pool.start(job)
+
+    def _on_done(self, job):
+        if job in self.jobs:
+            self.jobs.remove(job)
+        self.current = None
+        # 已取消的排队任务直接丢弃
+        while self.jobs and self.jobs[0].cancelled:
+            self.jobs.pop(0)
+        if self.jobs:
+            self._start(self.jobs[0])
+        self.changed.emit(len(self.jobs))
+        if not self.jobs:
+            self.idle.emit()
+
+    def cancel_all(self):
+        for job in self.jobs:
+            job.cancel()
+
+    def wait(self, msecs=-1):
+        return self.pool.waitForDone(msecs)
+
+
+# ---- 任务函数（在工作线程中执行，不能直接操作界面） ----
+
+def patch_job(job, paths, new_keymaps, skill_area, force=False, policy=None, relocate_icons=False,
+              output_format=None, dry_run=False):
+    """插入宏点位（dry_run 时只预览改动），返回 engine.patch_files 的结果列表"""
+    total = len(paths)
+    done = 0
+
+    def on_result(result):
+        nonlocal done
+        done += 1
+        job.report(done, total)
+
+    job.report(0, total)
+    return engine.patch_files(paths, new_keymaps, skill_area, workers=1 if total == 1 else None,
+                              force=force, on_result=on_result, cancel_event=job.cancel_event, policy=policy,
+                              relocate_icons=relocate_icons, output_format=output_format, dry_run=dry_run)
+
+
+def delete_job(job, path):
+    """删除前先保存快照，返回快照所在操作的编号"""
+    job.report(0, 1)
+    run = snapshots.Store().begin(f"删除 {os.path.basename(path)}")
+    run.snapshot(path, snapshots.DELETE)
+    run_id = run.commit()
+    os.remove(path)
+    job.report(1, 1)
+    return run_id
+
+
+def restore_job(job, run_id):
+    """撤销一次操作，返回 (恢复前内容所在操作的编号, 结果列表)"""
+    job.report(0, 1)
+    result = snapshots.Store().restore_run(run_id)
+    job.report(1, 1)
+    return result
+
+
+def load_template_job(job, path, settings=None):
+    """读取模板文件，返回 (路径, keymaps, 技能区域, 哈希)；给出 settings 时登记到设置中并缓存，否则哈希为 None"""
+    job.report(0, 1)
+    if settings is None:
+        digest = None
+        new_keymaps, skill_area = engine.load_template(path)
+    else:
+        digest, new_keymaps, skill_area = settings.import_template(path)
+    job.report(1, 1)
+    return path, new_keymaps, skill_area, digest